@@ -0,0 +1,1543 @@
+"""
+Local load/latency benchmarks against a fake OpenAI-compatible SSE provider.
+No API keys or network access needed.
+
+Usage:
+    python bench.py stream [--calls 50]
+    python bench.py pool [--calls 20]
+    python bench.py ratelimit [--calls 60]
+    python bench.py hedge
+    python bench.py early
+    python bench.py retry
+    python bench.py repair
+    python bench.py cache
+    python bench.py phash [--items 100000]
+    python bench.py images [--images 24]
+    python bench.py encoding [--samples 20] [--live]
+    python bench.py crop [--samples 12]
+    python bench.py page [--pages 6]
+    python bench.py upload
+    python bench.py sse
+    python bench.py pipelined [--runs 5]
+    python bench.py ensemble [--questions 100]
+    python bench.py routing [--questions 40]
+    python bench.py answerbank [--items 100000]
+    python bench.py race [--requests 20]
+    python bench.py batch [--count 10]
+    python bench.py questionpool [--requests 30]
+    python bench.py prefilter [--count 10]
+    python bench.py copyguard [--items 100000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+# Point both providers at local fake servers before config is imported
+FAKE_HOST = "127.0.0.1"
+FAKE_PORT = int(os.getenv("BENCH_FAKE_PORT", "8765"))
+TOGETHER_FAKE_PORT = FAKE_PORT + 1
+os.environ.setdefault("FIREWORKS_BASE_URL", f"http://{FAKE_HOST}:{FAKE_PORT}/v1")
+os.environ.setdefault("TOGETHER_BASE_URL", f"http://{FAKE_HOST}:{TOGETHER_FAKE_PORT}/v1")
+# The fake provider is not rate limited; let the admission layer open up
+os.environ.setdefault("FIREWORKS_MAX_CONCURRENCY", "64")
+# /chat in the image benchmark, the page pipelines and /generate talk to the fake providers
+os.environ.setdefault("SOLVE_API_KEY", "fake")
+os.environ.setdefault("EXTRACT_API_KEY", "fake")
+os.environ.setdefault("GENERATE_API_KEY", "fake")
+os.environ.setdefault("TOGETHER_API_KEY", "fake")
+# Keep benchmark cache entries out of data/
+_BENCH_DATA = tempfile.mkdtemp(prefix="yks-bench-")
+os.environ.setdefault("LLM_CACHE_DB_PATH", os.path.join(_BENCH_DATA, "llm_cache.db"))
+os.environ.setdefault("QUESTION_POOL_DB_PATH", os.path.join(_BENCH_DATA, "question_pool.db"))
+
+from contract_guard import run_with_contract_guard
+from llm_client import call_llm, clients
+from rate_limiter import get_limiter
+from schemas_contracts.models import ChatV1, SolveV1
+
+
+# ------------------------------------------------------------------------
+# FAKE SSE PROVIDER
+# ------------------------------------------------------------------------
+
+class FakeProvider:
+    """
+    Tiny HTTP/1.1 server speaking the chat.completions streaming protocol.
+    Keeps connections alive so connection reuse can be observed.
+    `text` may be a list: request i is answered with text[i % len(text)].
+    """
+
+    def __init__(self, text, ttft: float = 0.3, token_delay: float = 0.01, chunk_size: int = 4,
+                 handshake_delay: float = 0.0, max_active: int = 0, ttft_jitter: float = 0.0):
+        self.text = text
+        self.ttft = ttft
+        # Extra TTFT drawn uniformly from [0, ttft_jitter] per request
+        self.ttft_jitter = ttft_jitter
+        # Simulated TCP+TLS setup cost, paid once per new connection
+        self.handshake_delay = handshake_delay
+        # Answer 429 + Retry-After when more than this many streams are active (0 = unlimited)
+        self.max_active = max_active
+        self.active = 0
+        self.rejected = 0
+        self.completed = 0
+        self.aborted = 0
+        self.token_delay = token_delay
+        self.chunk_size = chunk_size
+        self.requests = 0
+        self.connections = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        await asyncio.sleep(self.handshake_delay)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                await reader.readexactly(int(headers.get("content-length", "0")))
+                self.requests += 1
+                if self.max_active and self.active >= self.max_active:
+                    self.rejected += 1
+                    writer.write(b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 0.5\r\nContent-Length: 0\r\n\r\n")
+                    await writer.drain()
+                    continue
+                self.active += 1
+                try:
+                    await self.respond(writer)
+                    self.completed += 1
+                except ConnectionError:
+                    self.aborted += 1
+                    raise
+                finally:
+                    self.active -= 1
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer: asyncio.StreamWriter):
+        text = self.text[(self.requests - 1) % len(self.text)] if isinstance(self.text, list) else self.text
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+        await writer.drain()
+        await asyncio.sleep(self.ttft + random.uniform(0, self.ttft_jitter))
+
+        for i in range(0, len(text), self.chunk_size):
+            delta = text[i:i + self.chunk_size]
+            event = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": delta}}]}
+            self._write_chunk(writer, f"data: {json.dumps(event)}\n\n")
+            await writer.drain()
+            await asyncio.sleep(self.token_delay)
+
+        self._write_chunk(writer, "data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, data: str):
+        raw = data.encode("utf-8")
+        writer.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+
+
+def start_fake_provider(provider: FakeProvider, port: int = FAKE_PORT) -> None:
+    """Runs the fake provider on its own event loop in a daemon thread."""
+    ready = threading.Event()
+
+    def _run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(asyncio.start_server(provider.handle, FAKE_HOST, port))
+        ready.set()
+        loop.run_until_complete(server.serve_forever())
+
+    threading.Thread(target=_run, daemon=True).start()
+    ready.wait()
+
+
+# ------------------------------------------------------------------------
+# HELPERS
+# ------------------------------------------------------------------------
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Returns the worst event-loop scheduling delay observed until `stop` is set."""
+    worst = 0.0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - t0 - interval)
+    return worst
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+SOLVE_RESPONSE = json.dumps({
+    "steps": ["Verilenleri yaz.", "Oranı kur.", "Sonucu hesapla."],
+    "final_answer": "C",
+    "confidence": 0.9
+}, ensure_ascii=False)
+
+CHAT_RESPONSE = json.dumps({"response": "Merhaba! Bu bir yük testi cevabıdır. " * 4}, ensure_ascii=False)
+
+
+# ------------------------------------------------------------------------
+# SCENARIOS
+# ------------------------------------------------------------------------
+
+async def bench_stream(calls: int):
+    """Many overlapping LLM calls on one event loop; the loop must stay responsive."""
+    provider = FakeProvider(CHAT_RESPONSE, ttft=0.3, token_delay=0.01)
+    start_fake_provider(provider)
+
+    async def one_call(i):
+        t0 = time.perf_counter()
+        await run_with_contract_guard(
+            prompt="ping", output_model=ChatV1, api_key="fake",
+            pipeline_name="bench", model_name="fake", request_id=f"bench-{i}"
+        )
+        return time.perf_counter() - t0
+
+    # Single call baseline
+    single = await one_call(-1)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    t0 = time.perf_counter()
+    latencies = await asyncio.gather(*(one_call(i) for i in range(calls)))
+    wall = time.perf_counter() - t0
+    stop.set()
+    worst_lag = await lag_task
+
+    print(f"\n[BENCH stream] calls={calls}")
+    print(f"  single call:          {single * 1000:.0f} ms")
+    print(f"  {calls} concurrent wall:  {wall * 1000:.0f} ms (serial would be ~{single * calls * 1000:.0f} ms)")
+    print(f"  per-call p50/p99:     {percentile(latencies, 50) * 1000:.0f} / {percentile(latencies, 99) * 1000:.0f} ms")
+    print(f"  worst loop lag:       {worst_lag * 1000:.1f} ms")
+
+
+async def bench_pool(calls: int):
+    """Back-to-back calls: fresh connection per call vs. the pooled keep-alive registry."""
+    provider = FakeProvider(CHAT_RESPONSE, ttft=0.05, token_delay=0.0, handshake_delay=0.08)
+    start_fake_provider(provider)
+
+    async def ttft():
+        t0 = time.perf_counter()
+        stream = call_llm(prompt="ping", api_key="fake")
+        await stream.__anext__()
+        first = time.perf_counter() - t0
+        async for _ in stream:
+            pass
+        return first
+
+    cold = []
+    for _ in range(calls):
+        await clients.aclose()  # forces a new connection every call
+        cold.append(await ttft())
+
+    await clients.aclose()
+    conns_before = provider.connections
+    warm = [await ttft() for _ in range(calls)]
+    warm_conns = provider.connections - conns_before
+    await clients.aclose()
+
+    print(f"\n[BENCH pool] calls={calls} (simulated handshake 80ms, server ttft 50ms)")
+    print(f"  new connection each call: ttft p50 {percentile(cold, 50) * 1000:.0f} ms, mean {sum(cold) / calls * 1000:.0f} ms")
+    print(f"  pooled keep-alive:        ttft p50 {percentile(warm, 50) * 1000:.0f} ms, mean {sum(warm) / calls * 1000:.0f} ms ({warm_conns} connection(s) opened)")
+
+
+async def bench_ratelimit(calls: int):
+    """Burst against a provider that only tolerates 4 concurrent streams."""
+    provider = FakeProvider(CHAT_RESPONSE, ttft=0.2, token_delay=0.005, max_active=4)
+    start_fake_provider(provider)
+
+    async def one_call(i):
+        try:
+            await run_with_contract_guard(
+                prompt="ping", output_model=ChatV1, api_key="fake",
+                pipeline_name="bench", model_name="fake", request_id=f"bench-{i}"
+            )
+            return True
+        except Exception:
+            return False
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one_call(i) for i in range(calls)))
+    wall = time.perf_counter() - t0
+    limiter = get_limiter("fireworks", "fake")
+
+    print(f"\n[BENCH ratelimit] calls={calls}, provider cap=4 concurrent streams")
+    print(f"  succeeded:      {sum(results)}/{calls} in {wall:.1f}s")
+    print(f"  provider 429s:  {provider.rejected} (of {provider.requests} requests)")
+    print(f"  final limiter:  rate scale {limiter.rate_scale:.2f}, concurrency {limiter.concurrency_limit}")
+
+
+async def bench_hedge():
+    """Slow primary (2s TTFT) vs. fast secondary; hedge deadline 300ms."""
+    slow = FakeProvider(SOLVE_RESPONSE, ttft=2.0, token_delay=0.02)
+    fast = FakeProvider(SOLVE_RESPONSE, ttft=0.1, token_delay=0.01)
+    start_fake_provider(slow, FAKE_PORT)
+    start_fake_provider(fast, TOGETHER_FAKE_PORT)
+
+    routes = [
+        {"provider": "fireworks", "api_key": "fake", "model": "slow-model"},
+        {"provider": "together", "api_key": "fake", "model": "fast-model"},
+    ]
+
+    async def timed(**kwargs):
+        t0 = time.perf_counter()
+        await run_with_contract_guard(prompt="solve", output_model=SolveV1, api_key="fake",
+                                      pipeline_name="bench", model_name="fake", **kwargs)
+        return time.perf_counter() - t0
+
+    unhedged = await timed(routes=routes[:1])
+    hedged = await timed(routes=routes, hedge_after_ms=300)
+    await asyncio.sleep(2.5)  # let the slow server notice the closed connection
+
+    print("\n[BENCH hedge] primary TTFT 2s, secondary TTFT 0.1s, hedge after 300ms")
+    print(f"  primary only: {unhedged * 1000:.0f} ms")
+    print(f"  hedged:       {hedged * 1000:.0f} ms")
+    print(f"  primary streams completed/aborted: {slow.completed}/{slow.aborted} (loser cancelled)")
+
+
+async def bench_early():
+    """Contract object followed by a long markdown tail the model keeps writing."""
+    tail = "\n\nAçıklama: Bu soruda önce oran kurulur, sonra işlem yapılır. " * 30
+    provider = FakeProvider(SOLVE_RESPONSE + tail, ttft=0.1, token_delay=0.01)
+    start_fake_provider(provider)
+
+    full_stream = 0.1 + len(SOLVE_RESPONSE + tail) / provider.chunk_size * provider.token_delay
+    t0 = time.perf_counter()
+    await run_with_contract_guard(prompt="solve", output_model=SolveV1, api_key="fake",
+                                  pipeline_name="bench", model_name="fake")
+    took = time.perf_counter() - t0
+    await asyncio.sleep(0.2)
+
+    print(f"\n[BENCH early] object {len(SOLVE_RESPONSE)} chars + tail {len(tail)} chars")
+    print(f"  waiting for [DONE] would take ~{full_stream * 1000:.0f} ms")
+    print(f"  early termination:  {took * 1000:.0f} ms (stream aborted: {provider.aborted == 1})")
+
+
+async def bench_retry():
+    """First answer breaks the contract in its first field; the retry is valid."""
+    bad = json.dumps({
+        "steps": "Tek parça çözüm metni, liste değil. " * 40,
+        "final_answer": "C"
+    }, ensure_ascii=False)
+    provider = FakeProvider([bad, SOLVE_RESPONSE], ttft=0.3, token_delay=0.01)
+    start_fake_provider(provider)
+
+    def stream_time(text):
+        return provider.ttft + len(text) / provider.chunk_size * provider.token_delay
+
+    t0 = time.perf_counter()
+    await run_with_contract_guard(prompt="solve", output_model=SolveV1, api_key="fake",
+                                  pipeline_name="bench", model_name="fake")
+    took = time.perf_counter() - t0
+
+    print("\n[BENCH retry] invalid 'steps' in the first attempt, valid retry")
+    print(f"  validate after full stream: ~{(stream_time(bad) + stream_time(SOLVE_RESPONSE)) * 1000:.0f} ms")
+    print(f"  streaming validation:        {took * 1000:.0f} ms")
+
+
+async def bench_repair():
+    """Typical broken contract outputs streamed through the guard: how many the local repair pass saves."""
+    import metrics
+
+    samples = [
+        r'{"steps": ["$\frac{3}{4}$ alınır", "$\sqrt{x} \times 2 = 6$"], "final_answer": "B"}',
+        '{"steps": ["a", "b",], "final_answer": "C",}',
+        "{'steps': ['Türkiye\\'nin nüfusu'], 'final_answer': 'D', 'confidence': None}",
+        '{"steps": ["ilk adım", "ikinci adım"], "final_answer": "A", "reasoning_checks": ["kontrol',
+        '{"steps": ["satır\\nsonu", "çok\nsatırlı"], "final_answer": "E"}',
+        '{"steps": "liste değil", "final_answer": "A"}',  # not repairable: wrong type
+    ]
+    # The live path: mid-stream validation first, then the repair pass; no retry
+    start_fake_provider(FakeProvider(samples, ttft=0.0, token_delay=0.0))
+    retries_avoided = 0
+    t0 = time.perf_counter()
+    for _ in samples:
+        try:
+            await run_with_contract_guard(prompt="Problem Data: {...}", output_model=SolveV1, api_key="fake",
+                                          pipeline_name="solve", model_name="fake", max_retries=0, cache=False)
+            retries_avoided += 1
+        except Exception:
+            pass
+    took = time.perf_counter() - t0
+
+    counters = metrics.snapshot()
+    print(f"\n[BENCH repair] {len(samples)} broken outputs")
+    print(f"  retries avoided: {retries_avoided}/{len(samples)}")
+    print(f"  repair time:     {counters.get('json_repair.ms_total', 0):.2f} ms total ({took * 1000:.2f} ms incl. streaming and validation)")
+    print(f"  fixes:           {', '.join(k.split('.')[-1] for k in counters if k.startswith('json_repair.fix.'))}")
+
+
+async def bench_cache():
+    """Same solve prompt three times: cold, warm memory tier, warm disk tier (fresh process state)."""
+    from llm_cache import llm_cache, hit_ratios
+    import metrics
+
+    provider = FakeProvider(SOLVE_RESPONSE, ttft=0.3, token_delay=0.01)
+    start_fake_provider(provider)
+
+    async def solve():
+        t0 = time.perf_counter()
+        await run_with_contract_guard(prompt="Problem Data: {...}", output_model=SolveV1, api_key="fake",
+                                      pipeline_name="solve", model_name="fake")
+        return (time.perf_counter() - t0) * 1000
+
+    cold = await solve()
+    warm_memory = await solve()
+    # Simulate a restart: empty memory tier, same SQLite file
+    llm_cache._memory.clear()
+    warm_disk = await solve()
+
+    counters = metrics.snapshot()
+    print("\n[BENCH cache] identical solve prompt x3")
+    print(f"  cold (provider):  {cold:.1f} ms")
+    print(f"  memory tier hit:  {warm_memory:.2f} ms")
+    print(f"  disk tier hit:    {warm_disk:.2f} ms")
+    print(f"  provider calls:   {provider.requests}")
+    print(f"  hit ratio:        {hit_ratios()}  latency saved: {counters.get('llm_cache.solve.latency_saved_ms', 0):.0f} ms")
+
+
+def _question_image(text: str, size=(1000, 700)):
+    from PIL import Image, ImageDraw, ImageFont
+    font = ImageFont.load_default(size=30)
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for row, line in enumerate(text.split("\n")):
+        draw.text((40, 40 + row * 42), line, fill="black", font=font)
+    return image
+
+
+def bench_phash(items: int):
+    """Near-duplicate lookup cost with `items` cached hashes, plus a real-image sanity check."""
+    import io
+    import random
+    from PIL import Image, ImageFilter
+    from ingest import perceptual_hashes
+    from logic.phash_index import MultiIndexHashTable, PerceptualCache
+
+    rng = random.Random(7)
+    index = MultiIndexHashTable(max_items=items)
+    hashes = [rng.getrandbits(64) for _ in range(items)]
+    t0 = time.perf_counter()
+    for i, h in enumerate(hashes):
+        index.add(h, i)
+    build_s = time.perf_counter() - t0
+
+    def near(h):
+        for bit in rng.sample(range(64), rng.randint(0, index.max_distance)):
+            h ^= 1 << bit
+        return h
+
+    queries = [near(rng.choice(hashes)) for _ in range(2000)]
+    misses = [rng.getrandbits(64) for _ in range(2000)]
+
+    def timed(qs):
+        out, found = [], 0
+        for q in qs:
+            t = time.perf_counter()
+            found += bool(index.candidates(q))
+            out.append((time.perf_counter() - t) * 1e6)
+        return out, found
+
+    hit_us, hit_found = timed(queries)
+    miss_us, miss_found = timed(misses)
+
+    t = time.perf_counter()
+    for q in queries[:50]:
+        min(((h ^ q).bit_count(), h) for h in hashes)
+    linear_us = (time.perf_counter() - t) / 50 * 1e6
+
+    # Same question re-photographed (rescaled, blurred, rotated, JPEG) vs. a different question
+    text = "12. x + 2y = 10 ve 3x - y = 2 ise\nx . y çarpımı kaçtır?\n\nA) 4\nB) 6\nC) 8\nD) 10\nE) 12"
+    other = "12. 2x + y = 11 ve x - 3y = 2 ise\nx + y toplamı kaçtır?\n\nA) 3\nB) 5\nC) 6\nD) 7\nE) 9"
+    original = _question_image(text)
+    buf = io.BytesIO()
+    original.rotate(1.0, fillcolor="white").resize((700, 490)).filter(ImageFilter.GaussianBlur(1)).save(buf, format="JPEG", quality=60)
+    rephoto = Image.open(io.BytesIO(buf.getvalue())).convert("RGB")
+    different = _question_image(other)
+
+    cache = PerceptualCache()
+    base = perceptual_hashes(original)
+    cache.add("bench", *base, "cached extraction")
+
+    print(f"\n[BENCH phash] {items} cached hashes (built in {build_s:.2f}s)")
+    print(f"  near-duplicate lookup: p50 {percentile(hit_us, 50):.1f} us  p99 {percentile(hit_us, 99):.1f} us  found {hit_found}/{len(queries)}")
+    print(f"  miss lookup:           p50 {percentile(miss_us, 50):.1f} us  p99 {percentile(miss_us, 99):.1f} us  false hits {miss_found}")
+    print(f"  linear scan:           {linear_us:.0f} us per lookup")
+    for label, image in (("re-photographed question", rephoto), ("different question", different)):
+        coarse, fine = perceptual_hashes(image)
+        result = cache.lookup("bench", coarse, fine)
+        print(f"  {label}: distance {(coarse ^ base[0]).bit_count()}/64, fine {(fine ^ base[1]).bit_count()}/256 -> {result}")
+
+def _phone_photo_jpeg(size=(4000, 3000)) -> bytes:
+    """A 12 MP JPEG that looks roughly like a photographed page."""
+    import io
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+    image = Image.radial_gradient("L").resize(size).point(lambda v: 255 - v // 3).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=90)
+    for row in range(20):
+        draw.text((200, 200 + row * 130), f"{row + 1}. x + {row}y = {row * 3} ise x kaçtır?  A) 1  B) 2  C) 3", fill="black", font=font)
+    image = image.filter(ImageFilter.GaussianBlur(1))
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+async def bench_images(images: int):
+    """/health and /chat latency while a burst of 12 MP photos is preprocessed."""
+    import io
+    import httpx
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+    from PIL import Image
+    from ingest import process_image, perceptual_hashes, ProcessedImage
+    from main import app
+
+    provider = FakeProvider(CHAT_RESPONSE, ttft=0.05, token_delay=0.0)
+    start_fake_provider(provider)
+    photo = _phone_photo_jpeg()
+
+    def process_inline(content: bytes) -> ProcessedImage:
+        # Previous behaviour: full decode on the event loop, no draft mode
+        image = Image.open(io.BytesIO(content))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((1024, 1024))
+        output = io.BytesIO()
+        image.save(output, format="PNG")
+        return ProcessedImage(output.getvalue(), *perceptual_hashes(image))
+
+    async def inline_upload():
+        await asyncio.sleep(0)
+        return process_inline(photo)
+
+    async def pooled_upload():
+        upload = UploadFile(file=io.BytesIO(photo), headers=Headers({"content-type": "image/jpeg"}))
+        return await process_image(upload)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+        await client.post("/chat", json={"message": "ısınma"})
+
+        async def probe(stop: asyncio.Event, path: str, latencies: list):
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                if path == "/health":
+                    await client.get(path)
+                else:
+                    await client.post(path, json={"message": "merhaba"})
+                latencies.append((time.perf_counter() - t0) * 1000)
+                await asyncio.sleep(0.01)
+
+        async def run(upload):
+            stop = asyncio.Event()
+            health, chat = [], []
+            probes = [asyncio.create_task(probe(stop, "/health", health)),
+                      asyncio.create_task(probe(stop, "/chat", chat))]
+            t0 = time.perf_counter()
+            await asyncio.gather(*(upload() for _ in range(images)))
+            wall = time.perf_counter() - t0
+            stop.set()
+            await asyncio.gather(*probes)
+            return wall, health, chat
+
+        print(f"\n[BENCH images] {images} x 12 MP JPEG uploads, probing /health and /chat")
+        for label, upload in (("inline (no draft)", inline_upload), ("pool + draft", pooled_upload)):
+            wall, health, chat = await run(upload)
+            print(f"  {label:18} images done in {wall * 1000:6.0f} ms | "
+                  f"/health p50 {percentile(health, 50):5.1f} p99 {percentile(health, 99):6.1f} ms | "
+                  f"/chat p50 {percentile(chat, 50):5.1f} p99 {percentile(chat, 99):6.1f} ms")
+
+
+def _sample_questions(n: int):
+    import random
+    import sqlite3
+    conn = sqlite3.connect(os.path.join(os.path.dirname(__file__), "data", "questions.db"))
+    rows = conn.execute("SELECT problem_text FROM questions WHERE length(problem_text) BETWEEN 80 AND 600").fetchall()
+    conn.close()
+    return [row[0] for row in random.Random(3).sample(rows, min(n, len(rows)))]
+
+
+def _photo_of(text: str, colored: bool, size=(3000, 4000)):
+    """Renders question text as a slightly blurred, shaded page photo."""
+    import textwrap
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+    image = Image.radial_gradient("L").resize(size).point(lambda v: 255 - v // 4).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=70)
+    y = 300
+    for paragraph in text.split("\n"):
+        for line in textwrap.wrap(paragraph, 60) or [""]:
+            draw.text((200, y), line, fill=(20, 20, 20), font=font)
+            y += 90
+    if colored:
+        draw.ellipse((1800, y + 100, 2600, y + 900), outline=(200, 30, 30), width=12)
+        draw.line((1800, y + 500, 2600, y + 500), fill=(30, 60, 200), width=12)
+    image = image.filter(ImageFilter.GaussianBlur(1.5))
+    # Sensor noise: real photos do not compress like clean renders
+    noise = Image.effect_noise(size, 12).convert("RGB")
+    return Image.blend(image, noise, 0.08)
+
+
+def _ink_f1(reference, candidate) -> float:
+    """Agreement of the dark (text) pixels after scaling back: a legibility proxy."""
+    from PIL import Image
+    ref = reference.convert("L").resize((1000, round(1000 * reference.height / reference.width)), Image.Resampling.BOX)
+    cand = candidate.convert("L").resize(ref.size, Image.Resampling.BOX)
+    a = [v < 128 for v in ref.tobytes()]
+    b = [v < 128 for v in cand.tobytes()]
+    tp = sum(x and y for x, y in zip(a, b))
+    fp = sum(y and not x for x, y in zip(a, b))
+    fn = sum(x and not y for x, y in zip(a, b))
+    return 2 * tp / (2 * tp + fp + fn) if tp else 0.0
+
+
+async def bench_encoding(samples: int, live: bool):
+    """Payload bytes / vision tokens per encoding profile vs. legibility (offline) or extraction accuracy (--live)."""
+    import difflib
+    import io
+    from PIL import Image
+    from config import IMAGE_PROFILES
+    from image_encoding import encode_for_vlm
+
+    texts = _sample_questions(samples)
+    photos = []
+    for i, text in enumerate(texts):
+        photo = _photo_of(text, colored=(i % 4 == 0))
+        buf = io.BytesIO()
+        photo.save(buf, format="JPEG", quality=90)
+        photos.append((text, photo, buf.getvalue()))
+
+    if live:
+        from ingest import ProcessedImage, perceptual_hashes
+        from pipelines.extract import _extract
+
+    print(f"\n[BENCH encoding] {len(photos)} rendered 12 MP exam photos, {sum(len(p[2]) for p in photos) / len(photos) / 1024:.0f} KiB avg upload ({'live extraction' if live else 'offline legibility proxy'})")
+    for profile in IMAGE_PROFILES:
+        sizes, tokens, quality, encode_ms, grays = [], [], [], [], 0
+        max_edge = IMAGE_PROFILES[profile]["max_long_edge"]
+        for text, photo, upload in photos:
+            t0 = time.perf_counter()
+            decoded = Image.open(io.BytesIO(upload))
+            decoded.draft("RGB", (max_edge, max_edge))
+            encoded = encode_for_vlm(decoded.convert("RGB"), profile)
+            encode_ms.append((time.perf_counter() - t0) * 1000)
+            sizes.append(len(encoded.data))
+            tokens.append(encoded.vision_tokens)
+            grays += encoded.grayscale
+            if live:
+                image = ProcessedImage(encoded.data, *perceptual_hashes(photo), mime_type=encoded.mime_type)
+                result = await _extract(image, f"bench-{profile}")
+                quality.append(difflib.SequenceMatcher(None, " ".join(text.split()), " ".join(result.question_text.split())).ratio())
+            else:
+                quality.append(_ink_f1(photo, Image.open(io.BytesIO(encoded.data))))
+        metric = "text match" if live else "ink F1"
+        print(f"  {profile:9} payload avg {sum(sizes) / len(sizes) / 1024:7.1f} KiB  max {max(sizes) / 1024:7.1f} KiB  "
+              f"tokens {sum(tokens) / len(tokens):6.0f}  grayscale {grays}/{len(photos)}  "
+              f"decode+encode {percentile(encode_ms, 50):5.0f} ms  {metric} {sum(quality) / len(quality):.3f}")
+
+
+def _desk_photo(text: str, skew: float, size=(4000, 3000)):
+    """A page (photographed by `_photo_of`) lying skewed on a dark desk."""
+    from PIL import Image
+    page = _photo_of(text, colored=False).resize((2100, 2800)).rotate(skew, expand=True, fillcolor=(85, 65, 50))
+    desk = Image.new("RGB", size, (85, 65, 50))
+    desk.paste(page, ((size[0] - page.width) // 2, (size[1] - page.height) // 2))
+    return desk
+
+
+def bench_crop(samples: int):
+    """Pixel reduction, skew recovery and payload savings of auto-crop + deskew."""
+    import io
+    import random
+    from config import IMAGE_PROFILE
+    from image_encoding import encode_for_vlm
+    from PIL import Image
+    from logic.page_layout import crop_and_deskew
+
+    rng = random.Random(5)
+    reductions, errors, crop_ms, bytes_before, bytes_after, tokens_before, tokens_after = [], [], [], [], [], [], []
+    for text in _sample_questions(samples):
+        skew = rng.uniform(-6, 6)
+        photo = _desk_photo(text, skew)
+        buf = io.BytesIO()
+        photo.save(buf, format="JPEG", quality=90)
+        decoded = Image.open(io.BytesIO(buf.getvalue()))
+        decoded.draft("RGB", (1536, 1536))
+        decoded = decoded.convert("RGB")
+
+        t0 = time.perf_counter()
+        layout = crop_and_deskew(decoded)
+        crop_ms.append((time.perf_counter() - t0) * 1000)
+        reductions.append(layout.pixel_reduction)
+        errors.append(abs(layout.skew_degrees - skew))
+        plain, cropped = encode_for_vlm(decoded, IMAGE_PROFILE), encode_for_vlm(layout.image, IMAGE_PROFILE)
+        bytes_before.append(len(plain.data))
+        bytes_after.append(len(cropped.data))
+        tokens_before.append(plain.vision_tokens)
+        tokens_after.append(cropped.vision_tokens)
+
+    n = len(reductions)
+    print(f"\n[BENCH crop] {n} skewed page photos on a desk (skew in [-6, 6] deg)")
+    print(f"  pixel reduction: avg {sum(reductions) / n:.0%}  min {min(reductions):.0%}")
+    print(f"  skew error:      avg {sum(errors) / n:.2f} deg  max {max(errors):.2f} deg")
+    print(f"  crop+deskew:     p50 {percentile(crop_ms, 50):.0f} ms  p99 {percentile(crop_ms, 99):.0f} ms")
+    print(f"  payload ({IMAGE_PROFILE}):   {sum(bytes_before) / n / 1024:.1f} KiB -> {sum(bytes_after) / n / 1024:.1f} KiB; "
+          f"vision tokens {sum(tokens_before) / n:.0f} -> {sum(tokens_after) / n:.0f}")
+
+
+def _exam_page(texts, skew: float, size=(2480, 3508)):
+    """A two-column test page with numbered questions and A-E choices, photographed on a desk."""
+    import textwrap
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+    page = Image.new("RGB", size, (245, 245, 240))
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=38)
+    column_width = (size[0] - 300) // 2
+    per_column = (len(texts) + 1) // 2
+    for column in range(2):
+        x = 120 + column * (column_width + 60)
+        y = 250
+        for k, text in enumerate(texts[column * per_column:(column + 1) * per_column]):
+            number = column * per_column + k + 1
+            draw.text((x, y), f"{number}.", fill=(20, 20, 20), font=font)
+            for line in textwrap.wrap(text, 48):
+                draw.text((x + 80, y), line, fill=(20, 20, 20), font=font)
+                y += 52
+            y += 20
+            for letter in "ABCDE":
+                draw.text((x + 80, y), f"{letter}) {number * 7 + ord(letter) % 5}", fill=(20, 20, 20), font=font)
+                y += 52
+            y += 160
+    page = page.filter(ImageFilter.GaussianBlur(1))
+    desk = Image.new("RGB", (size[0] + 500, size[1] + 500), (85, 65, 50))
+    desk.paste(page, (250, 250))
+    return desk.rotate(skew, resample=Image.Resampling.BILINEAR, fillcolor=(85, 65, 50))
+
+
+async def bench_page(pages: int):
+    """Segmentation accuracy on test pages, then one /solve/page vs. the same questions uploaded one by one."""
+    import io
+    import random
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+    from config import PAGE_PARALLELISM, LLM_CACHE_PIPELINES
+    from ingest import process_image, process_page
+    from logic.page_layout import split_page
+    from logic.phash_index import image_cache
+    from pipelines.page import solve_page_pipeline
+    from pipelines.solve import solve_pipeline
+
+    rng = random.Random(7)
+    texts = _sample_questions(pages * 8)
+    correct, split_ms, uploads = 0, [], []
+    for i in range(pages):
+        questions = texts[i * 8:(i + 1) * 8][:rng.choice([4, 6, 8])]
+        photo = _exam_page(questions, rng.uniform(-4, 4))
+        t0 = time.perf_counter()
+        crops, _ = split_page(photo)
+        split_ms.append((time.perf_counter() - t0) * 1000)
+        correct += len(crops) == len(questions)
+        buf = io.BytesIO()
+        photo.save(buf, format="JPEG", quality=90)
+        uploads.append((buf.getvalue(), len(questions)))
+
+    print(f"\n[BENCH page] {pages} photographed two-column test pages (4-8 questions, skew in [-4, 4] deg)")
+    print(f"  segmentation:    {correct}/{pages} pages split into the right number of questions")
+    print(f"  split time:      p50 {percentile(split_ms, 50):.0f} ms  p99 {percentile(split_ms, 99):.0f} ms")
+
+    extract = json.dumps({"schema": "extract_v1", "question_text": "Soru metni", "choices": {"A": "1", "B": "2", "C": "3", "D": "4", "E": "5"}})
+    start_fake_provider(FakeProvider(extract, ttft=0.8, token_delay=0.01))
+    start_fake_provider(FakeProvider(SOLVE_RESPONSE, ttft=1.5, token_delay=0.01), TOGETHER_FAKE_PORT)
+    # Every run must reach the providers
+    LLM_CACHE_PIPELINES.clear()
+
+    content, count = max(uploads, key=lambda upload: upload[1])
+    upload = lambda: UploadFile(file=io.BytesIO(content), headers=Headers({"content-type": "image/jpeg"}))
+
+    image_cache._indexes.clear()
+    questions = await process_page(upload())
+    t0 = time.perf_counter()
+    for image in questions:
+        await solve_pipeline(image)
+    sequential = time.perf_counter() - t0
+
+    image_cache._indexes.clear()
+    t0 = time.perf_counter()
+    result = await solve_page_pipeline(await process_page(upload()))
+    fan_out = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    single = await solve_pipeline(await process_image(upload()))
+    one = time.perf_counter() - t0
+
+    print(f"  {count} questions, extract ~0.8 s + solve ~1.5 s each (fake providers):")
+    print(f"    one by one:              {sequential * 1000:6.0f} ms")
+    print(f"    /solve/page (fan-out {PAGE_PARALLELISM}): {fan_out * 1000:6.0f} ms incl. segmentation, {result['question_count']} results in page order")
+    print(f"    single question:         {one * 1000:6.0f} ms ({single['status']})")
+
+
+async def bench_sse():
+    """Time to first content on /solve/stream and /chat/stream vs. the full response of /solve and /chat."""
+    import io
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+    from config import LLM_CACHE_PIPELINES
+    from ingest import process_image
+    from logic.phash_index import image_cache
+    from pipelines.chat import chat_pipeline
+    from pipelines.solve import solve_pipeline
+    from sse import stream_pipeline
+
+    extract = json.dumps({"schema": "extract_v1", "question_text": "Soru metni", "choices": {"A": "1", "B": "2", "C": "3", "D": "4", "E": "5"}})
+    solution = json.dumps({
+        "steps": [f"Adım {i}: verilen oranı kullanarak ara sonucu hesapla ve bir sonraki adıma taşı." for i in range(1, 9)],
+        "final_answer": "C",
+        "reasoning_checks": ["Birimler tutarlı.", "Sonuç şıklarda var."],
+        "confidence": 0.9
+    }, ensure_ascii=False)
+    reply = json.dumps({"response": "Harika bir soru! Bu konuyu adım adım birlikte inceleyelim. " * 12}, ensure_ascii=False)
+    fireworks = FakeProvider(extract, ttft=0.8, token_delay=0.01)
+    start_fake_provider(fireworks)
+    start_fake_provider(FakeProvider(solution, ttft=0.5, token_delay=0.01), TOGETHER_FAKE_PORT)
+    # Every run must reach the providers
+    LLM_CACHE_PIPELINES.clear()
+
+    buf = io.BytesIO()
+    _question_image("Bir sayının 3 katının 5 fazlası 20 ise\nbu sayı kaçtır?").save(buf, format="PNG")
+    image = await process_image(UploadFile(file=io.BytesIO(buf.getvalue()), headers=Headers({"content-type": "image/png"})))
+
+    async def blocking(run):
+        image_cache._indexes.clear()
+        t0 = time.perf_counter()
+        await run(None)
+        return time.perf_counter() - t0
+
+    async def streamed(run, name):
+        """Seconds until the first frame of each event type."""
+        image_cache._indexes.clear()
+        response = stream_pipeline(run, name)
+        t0 = time.perf_counter()
+        first = {}
+        async for frame in response.body_iterator:
+            event = frame.split("\n", 1)[0].removeprefix("event: ")
+            first.setdefault(event, time.perf_counter() - t0)
+        return first
+
+    print("\n[BENCH sse] fake providers: extract TTFT 0.8 s, solve TTFT 0.5 s, ~10 ms per 4-char chunk")
+    solve = lambda emit: solve_pipeline(image, emit)
+    total = await blocking(solve)
+    first = await streamed(solve, "solve")
+    print(f"  /solve         full response      {total * 1000:6.0f} ms")
+    print(f"  /solve/stream  extracted          {first['extracted'] * 1000:6.0f} ms")
+    print(f"                 first step         {first['item'] * 1000:6.0f} ms")
+    print(f"                 final              {first['final'] * 1000:6.0f} ms")
+
+    fireworks.text = reply
+    chat = lambda emit: chat_pipeline("Oran orantı nasıl çalışılır?", [], {}, emit)
+    total = await blocking(chat)
+    first = await streamed(chat, "chat")
+    print(f"  /chat          full response      {total * 1000:6.0f} ms")
+    print(f"  /chat/stream   first text delta   {first['delta'] * 1000:6.0f} ms")
+    print(f"                 final              {first['final'] * 1000:6.0f} ms")
+
+
+async def bench_pipelined(runs: int):
+    """/solve with extraction and solving in sequence vs. the solver started on the partial extraction."""
+    import io
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+    from config import LLM_CACHE_PIPELINES
+    from ingest import process_image
+    from logic.phash_index import image_cache
+    import metrics
+    import pipelines.solve as solve_module
+
+    question = "Bir sayının 3 katının 5 fazlası, aynı sayının 2 katının 12 fazlasına eşittir. Buna göre bu sayı kaçtır?"
+
+    def extraction(constraints):
+        # Field order of the extraction prompt: the late fields are what the pipelined mode overlaps
+        return json.dumps({
+            "schema": "extract_v1", "id": "q_001", "question_text": question,
+            "choices": {"A": "5", "B": "6", "C": "7", "D": "8", "E": "9"}, "figures_desc": None,
+            "topic_hint": "Denklem Kurma Problemleri", "constraints": constraints,
+            "extraction_notes": "Görsel net, soru metni ve şıklar eksiksiz okundu; sayfada başka soru parçası yok. " * 4,
+            "extraction_confidence": 0.97
+        }, ensure_ascii=False)
+
+    extract = FakeProvider(extraction(["sayının 3 katının 5 fazlası"]), ttft=0.8, token_delay=0.01)
+    solver = FakeProvider(SOLVE_RESPONSE, ttft=1.0, token_delay=0.01)
+    start_fake_provider(extract)
+    start_fake_provider(solver, TOGETHER_FAKE_PORT)
+    # Every run must reach the providers
+    LLM_CACHE_PIPELINES.clear()
+
+    buf = io.BytesIO()
+    _question_image(question[:40] + "\n" + question[40:]).save(buf, format="PNG")
+    image = await process_image(UploadFile(file=io.BytesIO(buf.getvalue()), headers=Headers({"content-type": "image/png"})))
+
+    async def timed(pipelined: bool):
+        solve_module.SOLVE_PIPELINED = pipelined
+        latencies = []
+        for _ in range(runs):
+            image_cache._indexes.clear()
+            t0 = time.perf_counter()
+            result = await solve_module.solve_pipeline(image)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            assert result["status"] == "success", result
+        return latencies
+
+    print(f"\n[BENCH pipelined] {runs} runs each; extract TTFT 0.8 s (~{len(extract.text)} chars), solve TTFT 1.0 s, ~10 ms per 4-char chunk")
+    sequential = await timed(False)
+    pipelined = await timed(True)
+    print(f"  sequential:            p50 {percentile(sequential, 50):6.0f} ms")
+    print(f"  pipelined:             p50 {percentile(pipelined, 50):6.0f} ms")
+
+    # A late constraint the question text does not state changes the problem
+    extract.text = extraction(["x bir asal sayıdır"])
+    reissued = await timed(True)
+    print(f"  pipelined, reissued:   p50 {percentile(reissued, 50):6.0f} ms (late constraint not in the question text)")
+    counters = metrics.snapshot()
+    print(f"  speculative solves: started {counters.get('solve.speculative.started', 0):.0f}, "
+          f"used {counters.get('solve.speculative.used', 0):.0f}, reissued {counters.get('solve.speculative.reissued', 0):.0f}")
+
+
+async def bench_ensemble(questions: int):
+    """Self-consistency ensemble: latency on an easy question, accuracy on simulated hard ones."""
+    from config import LLM_CACHE_PIPELINES, SOLVE_ENSEMBLE_TEMPERATURES
+    from schemas_contracts.models import ExtractV1
+    from pipelines.solve import solve_step
+    import metrics
+
+    def answer(letter):
+        return json.dumps({"steps": ["Denklemi kur.", "Çöz."], "final_answer": letter, "confidence": 0.9})
+
+    provider = FakeProvider(answer("C"), ttft=0.5, token_delay=0.01, ttft_jitter=1.0)
+    start_fake_provider(provider, TOGETHER_FAKE_PORT)
+    # Every call must reach the provider
+    LLM_CACHE_PIPELINES.clear()
+    extract = ExtractV1(question_text="3x + 5 = 20 ise x kaçtır?", choices={"A": "3", "B": "4", "C": "5", "D": "6", "E": "7"})
+    k = len(SOLVE_ENSEMBLE_TEMPERATURES)
+
+    async def latencies(ensemble: bool, runs: int = 10):
+        values = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            await solve_step(extract, "bench", ensemble=ensemble)
+            values.append((time.perf_counter() - t0) * 1000)
+        return values
+
+    print(f"\n[BENCH ensemble] k={k} solver calls, provider TTFT 0.5-1.5 s")
+    single = await latencies(False)
+    ensemble = await latencies(True)
+    cancelled = metrics.snapshot().get("solve.ensemble.calls_cancelled", 0)
+    print(f"  easy question (all calls agree):")
+    print(f"    single call:  p50 {percentile(single, 50):5.0f} ms  p99 {percentile(single, 99):5.0f} ms")
+    print(f"    ensemble:     p50 {percentile(ensemble, 50):5.0f} ms  p99 {percentile(ensemble, 99):5.0f} ms  ({cancelled / 10:.1f} of {k} calls cancelled per question)")
+
+    # Hard question: each call is right with probability 0.55, otherwise one of the 4 wrong letters
+    rng = random.Random(3)
+    provider.ttft, provider.ttft_jitter = 0.02, 0.05
+    provider.text = [answer("C" if rng.random() < 0.55 else rng.choice("ABDE")) for _ in range(questions * (k + 1))]
+    single_ok = ensemble_ok = 0
+    for _ in range(questions):
+        single_ok += (await solve_step(extract, "bench")).final_answer == "C"
+        ensemble_ok += (await solve_step(extract, "bench", ensemble=True)).final_answer == "C"
+    print(f"  hard questions (simulated, one call right 55% of the time, {questions} questions):")
+    print(f"    single call accuracy: {single_ok / questions:.0%}")
+    print(f"    ensemble accuracy:    {ensemble_ok / questions:.0%}")
+
+
+def _bank_extractions():
+    """(ExtractV1, difficulty label) for every question in data/questions.db."""
+    import re
+    import sqlite3
+    from schemas_contracts.models import ExtractV1
+    conn = sqlite3.connect(os.path.join(os.path.dirname(__file__), "data", "questions.db"))
+    rows = conn.execute("SELECT problem_text, choices, topic, difficulty, has_visual, problem_description FROM questions").fetchall()
+    conn.close()
+    items = []
+    for text, choices, topic, label, has_visual, description in rows:
+        parsed = {}
+        for choice in json.loads(choices or "[]"):
+            match = re.match(r"\s*([A-E])\)\s*(.*)", str(choice))
+            if match:
+                parsed[match.group(1)] = match.group(2)
+        extract = ExtractV1(question_text=text, choices=parsed, topic_hint=topic,
+                            figures_desc=description if has_visual else None)
+        items.append((extract, label))
+    return items
+
+
+async def bench_routing(questions: int):
+    """Difficulty router: tier split on the labelled question bank, then /solve latency with and without routing."""
+    from config import LLM_CACHE_PIPELINES, SOLVE_FAST_MAX_DIFFICULTY
+    import metrics
+    import pipelines.solve as solve_module
+
+    bank = _bank_extractions()
+    solve_module.SOLVE_ROUTING = True
+    t0 = time.perf_counter()
+    decisions = [(solve_module.solver_tier(extract)[0], label) for extract, label in bank]
+    decide_ms = (time.perf_counter() - t0) * 1000 / len(bank)
+
+    print(f"\n[BENCH routing] {len(bank)} labelled bank questions, fast tier at difficulty <= {SOLVE_FAST_MAX_DIFFICULTY}")
+    print(f"  routing decision: {decide_ms:.2f} ms per question (standardize + cognitive signature)")
+    for label in ("kolay", "orta", "zor"):
+        tiers = [tier for tier, l in decisions if l == label]
+        print(f"  {label:6} {len(tiers):4} questions -> fast {tiers.count('fast') / len(tiers):4.0%}")
+
+    def answer(confidence):
+        return json.dumps({"steps": ["Denklemi kur.", "Çöz."], "final_answer": "C", "confidence": confidence})
+
+    # Fast model: short TTFT, but 1 in 8 answers comes back unsure and is escalated
+    start_fake_provider(FakeProvider([answer(0.9)] * 7 + [answer(0.5)], ttft=0.25, token_delay=0.004, ttft_jitter=0.1))
+    start_fake_provider(FakeProvider(answer(0.9), ttft=1.0, token_delay=0.01, ttft_jitter=0.3), TOGETHER_FAKE_PORT)
+    # Every call must reach the providers
+    LLM_CACHE_PIPELINES.clear()
+
+    sample = [extract for extract, _ in random.Random(5).sample(bank, min(questions, len(bank)))]
+
+    async def run(routing: bool):
+        solve_module.SOLVE_ROUTING = routing
+        latencies = []
+        for extract in sample:
+            t0 = time.perf_counter()
+            await solve_module.solve_step(extract, "bench")
+            latencies.append((time.perf_counter() - t0) * 1000)
+        return latencies
+
+    full = await run(False)
+    routed = await run(True)
+    counters = metrics.snapshot()
+    print(f"  {len(sample)} questions, fast solver TTFT ~0.3 s vs. full solver ~1.15 s (fake providers):")
+    print(f"    all on full model:  mean {sum(full) / len(full):5.0f} ms  p50 {percentile(full, 50):5.0f} ms  p99 {percentile(full, 99):5.0f} ms")
+    print(f"    routed:             mean {sum(routed) / len(routed):5.0f} ms  p50 {percentile(routed, 50):5.0f} ms  p99 {percentile(routed, 99):5.0f} ms")
+    print(f"    fast {counters.get('solve.route.fast', 0):.0f} calls, escalated {counters.get('solve.route.escalated', 0):.0f}")
+
+
+async def bench_answerbank(items: int):
+    """Answer bank: matches on re-typed bank questions, false hits on altered ones, lookup cost at `items` entries."""
+    import re
+    from config import LLM_CACHE_PIPELINES
+    from logic.answer_bank import AnswerBank, answer_bank
+    from pipelines.solve import solve_step
+
+    rng = random.Random(11)
+    answer_bank.load()
+    bank = [extract for extract, _ in _bank_extractions() if len(extract.choices) >= 2]
+
+    def retyped(extract):
+        # OCR-style noise: LaTeX markup dropped, one letter in 80 misread, choices
+        # reordered (a misread digit is a different question to the bank)
+        chars = list(extract.question_text.replace("$", "").replace("\n", " "))
+        for _ in range(max(1, len(chars) // 80)):
+            i = rng.randrange(len(chars))
+            if not chars[i].isdigit():
+                chars[i] = rng.choice("ilo. ")
+        values = list(extract.choices.values())
+        rng.shuffle(values)
+        return extract.model_copy(update={"question_text": "".join(chars), "choices": dict(zip("ABCDE", values))})
+
+    def altered(extract):
+        # Same template, different numbers: the stored answer no longer applies
+        bump = lambda m: str(int(m.group()) + rng.randint(1, 9))
+        return extract.model_copy(update={
+            "question_text": re.sub(r"\d+", bump, extract.question_text),
+            "choices": {letter: re.sub(r"\d+", bump, value) for letter, value in extract.choices.items()},
+        })
+
+    def run(extracts):
+        found = [answer_bank.match(extract) for extract in extracts]
+        return [hit for hit in found if hit is not None]
+
+    hits = run([retyped(extract) for extract in bank])
+    numeric = [extract for extract in bank if re.search(r"\d", extract.question_text)]
+    false_hits = run([altered(extract) for extract in numeric])
+
+    # Lookup cost: the real bank plus synthetic questions up to `items`
+    # (bank words shuffled, so same vocabulary but distinct texts)
+    large = AnswerBank()
+    t0 = time.perf_counter()
+    for i in range(items):
+        extract = bank[i % len(bank)]
+        text = extract.question_text
+        if i >= len(bank):
+            words = text.split()
+            rng.shuffle(words)
+            text = " ".join(words)
+        values = [value or "-" for value in extract.choices.values()]
+        large.add(f"q{i}", text, values, ["-"], values[0])
+    build_s = time.perf_counter() - t0
+    large.min_score = answer_bank.min_score
+    queries = [retyped(rng.choice(bank)) for _ in range(500)]
+    lookup_ms = []
+    for extract in queries:
+        t = time.perf_counter()
+        large.match(extract)
+        lookup_ms.append((time.perf_counter() - t) * 1000)
+
+    # What a hit saves: one solver call on the fake provider
+    start_fake_provider(FakeProvider(json.dumps({"steps": ["Denklemi kur.", "Çöz."], "final_answer": "C", "confidence": 0.9}), ttft=1.0, token_delay=0.01), TOGETHER_FAKE_PORT)
+    LLM_CACHE_PIPELINES.clear()
+    solve_ms = []
+    for extract in bank[:5]:
+        t = time.perf_counter()
+        await solve_step(extract, "bench")
+        solve_ms.append((time.perf_counter() - t) * 1000)
+
+    print(f"\n[BENCH answerbank] {len(answer_bank)} bank questions indexed, match at score >= {answer_bank.min_score}")
+    print(f"  re-typed bank questions (OCR noise, shuffled choices): {len(hits)}/{len(bank)} answered from the bank")
+    print(f"  same questions with different numbers:                 {len(false_hits)}/{len(numeric)} false hits")
+    print(f"  {items} entries (built in {build_s:.1f}s): lookup p50 {percentile(lookup_ms, 50):.2f} ms  p99 {percentile(lookup_ms, 99):.2f} ms")
+    print(f"  solver call skipped on a hit: {sum(solve_ms) / len(solve_ms):.0f} ms (fake provider, TTFT 1 s)")
+
+
+def _generated(correct_answer: str) -> str:
+    """A generator response with one question whose stated answer is `correct_answer`."""
+    return json.dumps({"questions": [{
+        "problem_text": "Bir sayının 4 katının 7 eksiği 33 ise bu sayı kaçtır?",
+        "answer_choices": {"A": "8", "B": "9", "C": "10", "D": "11", "E": "12"},
+        "solution": "4x - 7 = 33, 4x = 40, x = 10",
+        "correct_answer": correct_answer,
+        "topic": "Denklem Kurma Problemleri",
+    }]}, ensure_ascii=False)
+
+
+def _generate_providers():
+    """
+    Generator (fireworks) whose stated answer is wrong 40% of the time and a
+    solver (together) that always says C; returns (generator, solver).
+    """
+    from config import LLM_CACHE_PIPELINES
+    import pipelines.solve as solve_module
+
+    rng = random.Random(9)
+    generator = FakeProvider([_generated("C" if rng.random() < 0.6 else rng.choice("ABDE")) for _ in range(101)],
+                             ttft=1.5, token_delay=0.01, ttft_jitter=1.0)
+    solver = FakeProvider(SOLVE_RESPONSE, ttft=1.0, token_delay=0.01, ttft_jitter=0.5)
+    start_fake_provider(generator)
+    start_fake_provider(solver, TOGETHER_FAKE_PORT)
+    LLM_CACHE_PIPELINES.clear()
+    # Validation must reach the together solver, not the fast tier on the generator's port
+    solve_module.SOLVE_ROUTING = False
+    return generator, solver
+
+
+async def bench_race(requests: int):
+    """/generate: sequential generate -> validate retries vs. racing candidates, with generator answers that fail validation."""
+    from config import GENERATE_RACE_CANDIDATES, GENERATE_MAX_CALLS
+    import metrics
+    import pipelines.generate as generate_module
+
+    generator, solver = _generate_providers()
+    generate_module.QUESTION_POOL_ENABLED = False  # live generation, not pool hits
+
+    async def run(race: bool):
+        generate_module.GENERATE_RACE = race
+        calls_before = generator.requests + solver.requests
+        latencies, ok = [], 0
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            result = await generate_module.generate_pipeline("Problemler", "medium")
+            latencies.append((time.perf_counter() - t0) * 1000)
+            ok += result["status"] == "success"
+        return latencies, ok, (generator.requests + solver.requests - calls_before) / requests
+
+    print(f"\n[BENCH race] {requests} /generate requests; generator TTFT 1.5-2.5 s (40% of answers wrong), solver TTFT 1.0-1.5 s")
+    for label, race in (("sequential", False), (f"race x{GENERATE_RACE_CANDIDATES}", True)):
+        latencies, ok, calls = await run(race)
+        print(f"  {label:11} p50 {percentile(latencies, 50):5.0f} ms  p99 {percentile(latencies, 99):5.0f} ms  "
+              f"success {ok}/{requests}  {calls:.1f} calls/request (ceiling {GENERATE_MAX_CALLS})")
+    counters = metrics.snapshot()
+    print(f"  race: {counters.get('generate.race.cancelled', 0) / requests:.1f} candidates cancelled per request")
+
+
+async def bench_batch(count: int):
+    """/generate with count: one request through the generator + validator pool vs. `count` single-question requests."""
+    from collections import Counter
+    from config import GENERATE_BATCH_CONCURRENCY
+    from pipelines.generate import generate_pipeline
+    import pipelines.generate as generate_module
+
+    generator, solver = _generate_providers()
+    generate_module.QUESTION_POOL_ENABLED = False  # live generation, not pool hits
+    print(f"\n[BENCH batch] {count} questions; generator TTFT 1.5-2.5 s (40% of answers wrong), solver TTFT 1.0-1.5 s, pool of {GENERATE_BATCH_CONCURRENCY}")
+
+    t0 = time.perf_counter()
+    singles = [await generate_pipeline("Problemler", "medium") for _ in range(count)]
+    one_by_one_ms = (time.perf_counter() - t0) * 1000
+    print(f"  {count} x count=1:  {one_by_one_ms:6.0f} ms, {sum(r['status'] == 'success' for r in singles)} questions")
+
+    statuses = []
+    calls_before = generator.requests + solver.requests
+    t0 = time.perf_counter()
+    result = await generate_pipeline("Problemler", "medium", count, lambda event, data: statuses.append(event))
+    batch_ms = (time.perf_counter() - t0) * 1000
+    calls = generator.requests + solver.requests - calls_before
+    questions = result["data"]["questions"]
+    print(f"  count={count}:     {batch_ms:6.0f} ms, {len(questions)} questions, all validated: "
+          f"{all(q['correct_answer'] == 'C' for q in questions)}, {calls} calls")
+    by_status = Counter(candidate["status"] for candidate in result["candidates"])
+    print(f"  candidates: {dict(by_status)}")
+    print(f"  streamed: {statuses.count('question')} question events, {statuses.count('candidate')} candidate status events")
+
+
+async def bench_prefilter(count: int):
+    """batch_generate with and without the local hakem prefilter, when a third of the candidates are malformed."""
+    from collections import Counter
+    from config import LLM_CACHE_PIPELINES
+    from pipelines.generate import prefilter_question
+    from schemas_contracts.models import GeneratedQuestion
+    import metrics
+    import pipelines.generate as generate_module
+    import pipelines.solve as solve_module
+
+    # Malformed candidates: duplicate choices, a missing choice, a figure the text refers to but nobody drew
+    broken = [
+        {"answer_choices": {"A": "8", "B": "10", "C": "10", "D": "11", "E": "12"}},
+        {"answer_choices": {"A": "8", "B": "9", "C": "10", "D": "11", "E": ""}},
+        {"problem_text": "Şekildeki ABC üçgeninde |AB| = 4 ve |BC| = 6 ise |AC| kaç olabilir?"},
+    ]
+    rng = random.Random(11)
+    texts = []
+    for _ in range(101):
+        question = json.loads(_generated("C" if rng.random() < 0.6 else rng.choice("ABDE")))
+        if rng.random() < 0.35:
+            question["questions"][0].update(rng.choice(broken))
+        texts.append(json.dumps(question, ensure_ascii=False))
+    generator = FakeProvider(texts, ttft=1.5, token_delay=0.01, ttft_jitter=1.0)
+    solver = FakeProvider(SOLVE_RESPONSE, ttft=1.0, token_delay=0.01, ttft_jitter=0.5)
+    start_fake_provider(generator)
+    start_fake_provider(solver, TOGETHER_FAKE_PORT)
+    LLM_CACHE_PIPELINES.clear()
+    solve_module.SOLVE_ROUTING = False
+
+    print(f"\n[BENCH prefilter] {count} questions; ~35% of candidates malformed, 40% of answers wrong; solver always says C")
+    for enabled in (False, True):
+        generate_module.GENERATE_PREFILTER = enabled
+        saved_before = metrics.snapshot().get("generate.prefilter.validations_saved", 0)
+        generator.requests = solver.requests = 0
+        t0 = time.perf_counter()
+        accepted, candidates = await generate_module.batch_generate("Problemler", "medium", count, "bench")
+        elapsed = (time.perf_counter() - t0) * 1000
+        saved = metrics.snapshot().get("generate.prefilter.validations_saved", 0) - saved_before
+        print(f"  prefilter {'on ' if enabled else 'off'}: {elapsed:6.0f} ms, {len(accepted)}/{count} accepted, "
+              f"{generator.requests} generator + {solver.requests} solver calls, "
+              f"validations saved {saved:.0f}")
+        print(f"    candidates: {dict(Counter(candidate.get('reason', candidate['status']) for candidate in candidates))}")
+        shipped_broken = sum(q.choices.get("E") == "" or q.problem_text.startswith("Şekil") or q.choices["B"] == q.choices["C"] for q in accepted)
+        print(f"    malformed questions accepted: {shipped_broken}")
+
+    question = GeneratedQuestion.model_validate(json.loads(_generated("C"))["questions"][0])
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        prefilter_question(question, "bench")
+    print(f"  prefilter cost: {(time.perf_counter() - t0):.3f} ms per candidate")
+
+
+async def bench_copyguard(items: int):
+    """Copy guard: copies of indexed and anchor questions caught, new questions passed, check cost at `items` entries."""
+    import re
+    import sqlite3
+    from config import ANSWER_BANK_DB_PATH
+    from logic.answer_bank import choice_values
+    from logic.copy_guard import CopyGuard
+
+    rng = random.Random(13)
+    conn = sqlite3.connect(ANSWER_BANK_DB_PATH)
+    rows = [(question_id, text, choice_values(raw)) for question_id, text, raw
+            in conn.execute("SELECT id, problem_text, choices FROM questions") if text]
+    conn.close()
+    # Half the bank is indexed; the other half stands in for new questions
+    rng.shuffle(rows)
+    indexed, unseen = rows[:len(rows) // 2], rows[len(rows) // 2:]
+    guard = CopyGuard()
+    for question_id, text, choices in indexed:
+        guard.add(question_id, text, list(choices.values()))
+
+    def shuffled(text, choices):
+        values = list(choices.values())
+        rng.shuffle(values)
+        return text, dict(zip("ABCDE", values))
+
+    def new_choices(text, choices):
+        return text, {letter: str(rng.randint(1, 99)) for letter in "ABCDE"}
+
+    def new_numbers(text, choices):
+        bump = lambda m: str(int(m.group()) + rng.randint(1, 9))
+        return re.sub(r"\d+", bump, text), {letter: re.sub(r"\d+", bump, value) for letter, value in choices.items()}
+
+    def caught(questions, anchors=None):
+        return sum(guard.check(text, choices, anchors(i) if anchors else ()) is not None
+                   for i, (text, choices) in enumerate(questions))
+
+    numeric = [row for row in indexed if re.search(r"\d", row[1])]
+    as_anchor = lambda i: [{"id": unseen[i][0], "problem_text": unseen[i][1],
+                            "choices": [f"{letter}) {value}" for letter, value in unseen[i][2].items()]}]
+    print(f"\n[BENCH copyguard] {len(indexed)} bank questions indexed, copy at score >= {guard.min_score} with the same numbers")
+    print(f"  bank copies, choices shuffled:       {caught([shuffled(t, c) for _, t, c in indexed])}/{len(indexed)} rejected")
+    print(f"  bank stems with new choices:         {caught([new_choices(t, c) for _, t, c in indexed])}/{len(indexed)} rejected")
+    print(f"  anchor copies (not in the index):    {caught([shuffled(t, c) for _, t, c in unseen], as_anchor)}/{len(unseen)} rejected")
+    print(f"  bank templates with new numbers:     {caught([new_numbers(t, c) for _, t, c in numeric])}/{len(numeric)} rejected")
+    print(f"  unseen questions:                    {caught([(t, c) for _, t, c in unseen])}/{len(unseen)} rejected")
+
+    # Check cost: the bank plus synthetic questions up to `items` (bank words
+    # shuffled, so same vocabulary but distinct texts)
+    large = CopyGuard()
+    t0 = time.perf_counter()
+    for i in range(items):
+        _, text, choices = rows[i % len(rows)]
+        if i >= len(rows):
+            words = text.split()
+            rng.shuffle(words)
+            text = " ".join(words)
+        large.add(f"q{i}", text, list(choices.values()))
+    build_s = time.perf_counter() - t0
+    check_ms = []
+    for _ in range(500):
+        _, text, choices = rng.choice(rows)
+        text, choices = new_choices(text, choices)
+        t = time.perf_counter()
+        large.check(text, choices, as_anchor(rng.randrange(len(unseen))))
+        check_ms.append((time.perf_counter() - t) * 1000)
+    print(f"  {items} entries (built in {build_s:.1f}s): check p50 {percentile(check_ms, 50):.2f} ms  p99 {percentile(check_ms, 99):.2f} ms")
+
+
+async def bench_question_pool(requests: int):
+    """/generate served from the pre-validated pool vs. generated live, with the background refill running."""
+    from config import QUESTION_POOL_LOW_WATERMARK, QUESTION_POOL_TARGET
+    from question_pool import question_pool
+    import metrics
+    import pipelines.generate as generate_module
+
+    _generate_providers()
+    refill = asyncio.create_task(generate_module.pool_refill_loop())
+    topic, difficulty = "oran - orantı", "medium"  # a question bank topic, so the key is pooled
+
+    t0 = time.perf_counter()
+    cold = await generate_module.generate_pipeline(topic, difficulty, user_id="student-0")
+    cold_ms = (time.perf_counter() - t0) * 1000
+    # The cold request registered the key; wait for the worker's first refill
+    t0 = time.perf_counter()
+    while not metrics.snapshot().get("question_pool.refills") and time.perf_counter() - t0 < 120:
+        await asyncio.sleep(0.2)
+    refill_s = time.perf_counter() - t0
+
+    # 10 students taking turns
+    pooled_ms, live_ms = [], []
+    for i in range(requests):
+        t = time.perf_counter()
+        result = await generate_module.generate_pipeline(topic, difficulty, user_id=f"student-{i % 10}")
+        (pooled_ms if result.get("pooled") else live_ms).append((time.perf_counter() - t) * 1000)
+    refill.cancel()
+    await asyncio.gather(refill, return_exceptions=True)
+
+    # The fake generator repeats its text, so repeats are counted by pool id
+    served, distinct = question_pool._db().execute(
+        "SELECT COUNT(*), COUNT(DISTINCT user_id || ':' || question_id) FROM question_pool_seen").fetchone()
+    print(f"\n[BENCH questionpool] watermark {QUESTION_POOL_LOW_WATERMARK}, target {QUESTION_POOL_TARGET}; same fake providers as race/batch")
+    print(f"  cold request (live generate + validate): {cold_ms:6.0f} ms; first refill done after {refill_s:.1f} s")
+    print(f"  {requests} requests from 10 students: {len(pooled_ms)} from the pool (p50 {percentile(pooled_ms or [0], 50):.1f} ms), "
+          f"{len(live_ms)} live (p50 {percentile(live_ms or [0], 50):.0f} ms)")
+    print(f"  seen-set: {served} questions served to known students, {served - distinct} repeats")
+    print(f"  pool: {question_pool.stats()}")
+
+
+def _peak_rss_mb(reset: bool = False) -> float:
+    """Peak resident memory of this process; reset=True restarts the peak (Linux)."""
+    if reset:
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return int(fields["VmHWM"].split()[0]) / 1024
+
+
+def _upload_memory_probe(path: str, mode: str, known_size: bool, results) -> None:
+    """Runs in a fresh process: one upload through the legacy or streaming path."""
+    import io
+    from fastapi import HTTPException, UploadFile
+    from starlette.datastructures import Headers
+    from PIL import Image
+    from ingest import process_image
+
+    async def legacy(upload):
+        # Previous behaviour: whole body into one bytes object, then a full decode
+        content = await upload.read()
+        image = Image.open(io.BytesIO(content))
+        image = image.convert("RGB")
+        image.thumbnail((1024, 1024))
+
+    async def run():
+        with open(path, "rb") as f:
+            upload = UploadFile(file=f, size=os.path.getsize(path) if known_size else None,
+                                headers=Headers({"content-type": "image/jpeg"}))
+            try:
+                await (legacy(upload) if mode == "legacy" else process_image(upload))
+                return "ok"
+            except HTTPException as e:
+                return str(e.status_code)
+            except Exception as e:
+                return type(e).__name__
+
+    baseline = _peak_rss_mb(reset=True)
+    t0 = time.perf_counter()
+    status = asyncio.run(run())
+    results.put((status, (time.perf_counter() - t0) * 1000, _peak_rss_mb() - baseline))
+
+
+def bench_upload():
+    """Peak memory and time-to-reject per upload: buffered read vs. streaming validation."""
+    import multiprocessing
+    import warnings
+    from PIL import Image
+    from config import UPLOAD_MAX_BYTES, IMAGE_MAX_PIXELS
+
+    workdir = tempfile.mkdtemp(prefix="yks-upload-")
+    files = {}
+    files["40 MB body"] = os.path.join(workdir, "big.jpg")
+    with open(files["40 MB body"], "wb") as f:
+        f.write(b"\xff\xd8\xff\xe0" + os.urandom(40 * 1024 * 1024))
+    files["pixel bomb PNG"] = os.path.join(workdir, "bomb.png")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        Image.new("1", (10_000, 10_000)).save(files["pixel bomb PNG"])
+    files["12 MP photo"] = os.path.join(workdir, "photo.jpg")
+    with open(files["12 MP photo"], "wb") as f:
+        f.write(_phone_photo_jpeg())
+
+    ctx = multiprocessing.get_context("spawn")
+    print(f"\n[BENCH upload] peak RSS per request, fresh process each (UPLOAD_MAX_BYTES={UPLOAD_MAX_BYTES // (1024 * 1024)} MB, IMAGE_MAX_PIXELS={IMAGE_MAX_PIXELS / 1e6:.0f} M)")
+    for label, path in files.items():
+        print(f"  {label} ({os.path.getsize(path) / (1024 * 1024):.1f} MB on disk)")
+        for mode, known_size in (("legacy", True), ("streaming", True), ("streaming", False)):
+            results = ctx.Queue()
+            proc = ctx.Process(target=_upload_memory_probe, args=(path, mode, known_size, results))
+            proc.start()
+            status, ms, peak = results.get()
+            proc.join()
+            variant = mode if mode == "legacy" else f"{mode} ({'size known' if known_size else 'chunked'})"
+            print(f"    {variant:27} -> {status:18} {ms:7.0f} ms  peak +{peak:6.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YKS backend local benchmarks")
+    sub = parser.add_subparsers(dest="scenario", required=True)
+    p_stream = sub.add_parser("stream", help="concurrent streaming calls vs. event loop lag")
+    p_stream.add_argument("--calls", type=int, default=50)
+    p_pool = sub.add_parser("pool", help="time-to-first-token with and without pooled connections")
+    p_pool.add_argument("--calls", type=int, default=20)
+    p_rate = sub.add_parser("ratelimit", help="burst against a provider that answers 429")
+    p_rate.add_argument("--calls", type=int, default=60)
+    sub.add_parser("hedge", help="hedged request to a second provider when the first is slow")
+    sub.add_parser("early", help="stop reading once the JSON object is complete")
+    sub.add_parser("retry", help="abort an invalid stream early and retry")
+    sub.add_parser("repair", help="local JSON repair on typical broken outputs (offline)")
+    sub.add_parser("cache", help="LLM response cache: cold vs memory vs disk tier")
+    p_phash = sub.add_parser("phash", help="perceptual-hash near-duplicate lookup cost (offline)")
+    p_phash.add_argument("--items", type=int, default=100_000)
+    p_images = sub.add_parser("images", help="/health and /chat latency under a burst of photo uploads")
+    p_images.add_argument("--images", type=int, default=24)
+    p_encoding = sub.add_parser("encoding", help="payload bytes vs. legibility per image encoding profile")
+    p_encoding.add_argument("--samples", type=int, default=20)
+    p_encoding.add_argument("--live", action="store_true", help="run the real extraction model (needs EXTRACT_API_KEY and real FIREWORKS_BASE_URL)")
+    p_crop = sub.add_parser("crop", help="auto-crop + deskew: pixel reduction and skew recovery")
+    p_crop.add_argument("--samples", type=int, default=12)
+    p_page = sub.add_parser("page", help="test page segmentation and per-question fan-out")
+    p_page.add_argument("--pages", type=int, default=6)
+    sub.add_parser("upload", help="peak memory of oversized / pixel-bomb / normal uploads (fresh process each)")
+    sub.add_parser("sse", help="time to first content on the streaming endpoints vs. full response")
+    p_pipelined = sub.add_parser("pipelined", help="/solve latency: solver started on the partial extraction vs. in sequence")
+    p_pipelined.add_argument("--runs", type=int, default=5)
+    p_ensemble = sub.add_parser("ensemble", help="self-consistency solve: latency on easy, accuracy on hard questions")
+    p_ensemble.add_argument("--questions", type=int, default=100)
+    p_routing = sub.add_parser("routing", help="difficulty-aware solver routing: tier split and latency")
+    p_routing.add_argument("--questions", type=int, default=40)
+    p_answerbank = sub.add_parser("answerbank", help="answer bank fast path: match rate, false hits, lookup cost")
+    p_answerbank.add_argument("--items", type=int, default=100000)
+    p_race = sub.add_parser("race", help="/generate: sequential retries vs. racing validated candidates")
+    p_race.add_argument("--requests", type=int, default=20)
+    p_batch = sub.add_parser("batch", help="/generate count=N through one pool vs. N single requests")
+    p_batch.add_argument("--count", type=int, default=10)
+    p_questionpool = sub.add_parser("questionpool", help="/generate from the pre-validated question pool vs. live, with background refill")
+    p_questionpool.add_argument("--requests", type=int, default=30)
+    p_prefilter = sub.add_parser("prefilter", help="solver calls saved by the local hakem prefilter on malformed candidates")
+    p_prefilter.add_argument("--count", type=int, default=10)
+    p_copyguard = sub.add_parser("copyguard", help="copy guard: copies caught, new questions passed, check cost (offline)")
+    p_copyguard.add_argument("--items", type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.scenario == "stream":
+        asyncio.run(bench_stream(args.calls))
+    elif args.scenario == "pool":
+        asyncio.run(bench_pool(args.calls))
+    elif args.scenario == "ratelimit":
+        asyncio.run(bench_ratelimit(args.calls))
+    elif args.scenario == "hedge":
+        asyncio.run(bench_hedge())
+    elif args.scenario == "early":
+        asyncio.run(bench_early())
+    elif args.scenario == "retry":
+        asyncio.run(bench_retry())
+    elif args.scenario == "repair":
+        asyncio.run(bench_repair())
+    elif args.scenario == "cache":
+        asyncio.run(bench_cache())
+    elif args.scenario == "phash":
+        bench_phash(args.items)
+    elif args.scenario == "images":
+        asyncio.run(bench_images(args.images))
+    elif args.scenario == "encoding":
+        asyncio.run(bench_encoding(args.samples, args.live))
+    elif args.scenario == "crop":
+        bench_crop(args.samples)
+    elif args.scenario == "page":
+        asyncio.run(bench_page(args.pages))
+    elif args.scenario == "upload":
+        bench_upload()
+    elif args.scenario == "sse":
+        asyncio.run(bench_sse())
+    elif args.scenario == "pipelined":
+        asyncio.run(bench_pipelined(args.runs))
+    elif args.scenario == "ensemble":
+        asyncio.run(bench_ensemble(args.questions))
+    elif args.scenario == "routing":
+        asyncio.run(bench_routing(args.questions))
+    elif args.scenario == "answerbank":
+        asyncio.run(bench_answerbank(args.items))
+    elif args.scenario == "race":
+        asyncio.run(bench_race(args.requests))
+    elif args.scenario == "batch":
+        asyncio.run(bench_batch(args.count))
+    elif args.scenario == "questionpool":
+        asyncio.run(bench_question_pool(args.requests))
+    elif args.scenario == "prefilter":
+        asyncio.run(bench_prefilter(args.count))
+    elif args.scenario == "copyguard":
+        asyncio.run(bench_copyguard(args.items))
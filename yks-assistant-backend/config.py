@@ -20,4 +20,223 @@ MODEL_ID = "accounts/fireworks/models/qwen2p5-vl-32b-instruct"
 TOGETHER_MODEL_ID = "kgegek_bb35/Qwen2.5-72B-Instruct-yks-llm-v3-456bd664"
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
 
+FIREWORKS_BASE_URL = os.getenv("FIREWORKS_BASE_URL", "https://api.fireworks.ai/inference/v1")
+TOGETHER_BASE_URL = os.getenv("TOGETHER_BASE_URL", "https://api.together.xyz/v1")
 
+# Streaming HTTP timeouts (seconds). Read timeout is the max gap between chunks.
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+
+# Pooled keep-alive HTTP clients (one per provider + API key)
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") == "1"
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+LLM_POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+
+# Per-provider admission limits, applied separately to every API key
+RATE_LIMITS = {
+    "fireworks": {
+        "max_concurrency": int(os.getenv("FIREWORKS_MAX_CONCURRENCY", "16")),
+        "rpm": float(os.getenv("FIREWORKS_RPM", "600")),
+        "tpm": float(os.getenv("FIREWORKS_TPM", "1000000")),
+    },
+    "together": {
+        "max_concurrency": int(os.getenv("TOGETHER_MAX_CONCURRENCY", "8")),
+        "rpm": float(os.getenv("TOGETHER_RPM", "600")),
+        "tpm": float(os.getenv("TOGETHER_TPM", "180000")),
+    },
+}
+RATE_LIMIT_MIN_SCALE = 0.05       # never throttle below 5% of the configured rate
+RATE_LIMIT_DEFAULT_BACKOFF = 2.0  # seconds, when a 429 has no Retry-After
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+
+# Ordered provider routes per pipeline. The first route is primary; later
+# routes are used for failover and as hedges when the primary is slow.
+SOLVE_FALLBACK_MODEL_ID = "accounts/fireworks/models/qwen2p5-72b-instruct"
+# Non-thinking variant: the thinking model spends its latency budget on a <think> block
+SOLVE_FAST_MODEL_ID = os.getenv("SOLVE_FAST_MODEL_ID", "accounts/fireworks/models/qwen3-30b-a3b-instruct-2507")
+GENERATE_FALLBACK_MODEL_ID = "openai/gpt-oss-120b"
+
+PIPELINE_ROUTES = {
+    "solve": [
+        {"provider": "together", "api_key": TOGETHER_API_KEY, "model": TOGETHER_MODEL_ID},
+        {"provider": "fireworks", "api_key": SOLVE_API_KEY, "model": SOLVE_FALLBACK_MODEL_ID},
+    ],
+    # Easy questions (difficulty router); fails over to the full solver
+    "solve_fast": [
+        {"provider": "fireworks", "api_key": SOLVE_API_KEY, "model": SOLVE_FAST_MODEL_ID},
+        {"provider": "together", "api_key": TOGETHER_API_KEY, "model": TOGETHER_MODEL_ID},
+    ],
+    "generate": [
+        {"provider": "fireworks", "api_key": GENERATE_API_KEY, "model": GENERATE_MODEL_ID},
+        {"provider": "together", "api_key": TOGETHER_API_KEY, "model": GENERATE_FALLBACK_MODEL_ID},
+    ],
+}
+
+# Time-to-first-token deadline (ms) after which a hedged request goes to the next route
+HEDGE_AFTER_MS = {
+    "solve": int(os.getenv("SOLVE_HEDGE_AFTER_MS", "4000")),
+    "generate": int(os.getenv("GENERATE_HEDGE_AFTER_MS", "6000")),
+}
+
+# Max chars of non-JSON prose tolerated before the contract object starts
+CONTRACT_PROSE_LIMIT = int(os.getenv("CONTRACT_PROSE_LIMIT", "400"))
+
+# Wall-clock budget (ms) for the local JSON repair pass before giving up and retrying
+JSON_REPAIR_MAX_MS = float(os.getenv("JSON_REPAIR_MAX_MS", "50"))
+
+# Content-addressed LLM response cache (memory LRU in front of SQLite).
+# Only deterministic pipelines opt in; coach / generate need variety.
+LLM_CACHE_PIPELINES = {p.strip() for p in os.getenv("LLM_CACHE_PIPELINES", "extract,solve,evaluate").split(",") if p.strip()}
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "512"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_DB_PATH = os.getenv("LLM_CACHE_DB_PATH", os.path.join(os.path.dirname(__file__), "data", "llm_cache.db"))
+# Disk tier upkeep: at most every LLM_CACHE_PURGE_INTERVAL_SECONDS a write
+# deletes expired rows, then the oldest ones beyond LLM_CACHE_DISK_MAX_ROWS
+LLM_CACHE_DISK_MAX_ROWS = int(os.getenv("LLM_CACHE_DISK_MAX_ROWS", "50000"))
+LLM_CACHE_PURGE_INTERVAL_SECONDS = float(os.getenv("LLM_CACHE_PURGE_INTERVAL_SECONDS", "600"))
+
+# Perceptual-hash cache for extraction results of near-identical uploads.
+# Max Hamming distance on the 64-bit dHash (index) and on the 256-bit dHash (verification).
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "6"))
+PHASH_VERIFY_MAX_DISTANCE = int(os.getenv("PHASH_VERIFY_MAX_DISTANCE", "10"))
+PHASH_CACHE_MAX_ITEMS = int(os.getenv("PHASH_CACHE_MAX_ITEMS", "20000"))
+
+# Upload limits. Bodies over UPLOAD_MAX_BYTES get a 413 (from Content-Length
+# before the form is parsed, otherwise while streaming through the upload);
+# images declaring more than IMAGE_MAX_PIXELS in their header get a 400.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(15 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "50000000"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+
+# Image preprocessing pool (Pillow work off the event loop)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+IMAGE_MAX_PENDING = int(os.getenv("IMAGE_MAX_PENDING", "32"))
+IMAGE_QUEUE_TIMEOUT = float(os.getenv("IMAGE_QUEUE_TIMEOUT", "10"))
+
+# Encoding profiles for images sent to vision models (see image_encoding.py).
+# Long edge is capped by max_long_edge and by the vision-token budget (28x28 px
+# patches); the format x quality ladder is walked until target_bytes fits.
+IMAGE_PROFILES = {
+    "vlm": {
+        "formats": ["JPEG"],
+        "qualities": [85, 75, 65],
+        "max_long_edge": 1280,
+        "min_long_edge": 768,
+        "max_vision_tokens": 1200,
+        "target_bytes": 250_000,
+        "grayscale_saturation": 40,
+    },
+    "vlm_webp": {
+        "formats": ["WEBP"],
+        "qualities": [80, 70, 60],
+        "max_long_edge": 1280,
+        "min_long_edge": 768,
+        "max_vision_tokens": 1200,
+        "target_bytes": 200_000,
+        "grayscale_saturation": 40,
+    },
+    # Previous behaviour: lossless PNG thumbnail
+    "lossless": {
+        "formats": ["PNG"],
+        "qualities": [None],
+        "max_long_edge": 1024,
+        "min_long_edge": 1024,
+        "max_vision_tokens": 10_000,
+        "target_bytes": 50_000_000,
+        "grayscale_saturation": None,
+    },
+}
+IMAGE_PROFILE = os.getenv("IMAGE_PROFILE", "vlm")
+
+# Crop-to-content and deskew before encoding (logic/page_layout.py)
+IMAGE_AUTO_CROP = os.getenv("IMAGE_AUTO_CROP", "1") == "1"
+CROP_PADDING = float(os.getenv("CROP_PADDING", "0.03"))
+DESKEW_MAX_ANGLE = float(os.getenv("DESKEW_MAX_ANGLE", "8"))
+DESKEW_MIN_ANGLE = float(os.getenv("DESKEW_MIN_ANGLE", "0.3"))
+
+# Whole exam pages (/solve/page, /measure/page): split into per-question crops
+# locally, then run the per-question pipeline with bounded fan-out
+PAGE_MAX_LONG_EDGE = int(os.getenv("PAGE_MAX_LONG_EDGE", "3200"))
+PAGE_MAX_QUESTIONS = int(os.getenv("PAGE_MAX_QUESTIONS", "12"))
+PAGE_PARALLELISM = int(os.getenv("PAGE_PARALLELISM", "8"))
+
+# Server-Sent Events (/solve/stream, /chat/stream, /coach/stream): a comment
+# line is sent after this many idle seconds so proxies keep the stream open
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+# Pipelined /solve: start the solver as soon as question_text / choices /
+# figures_desc have streamed out of the extraction, while it finishes
+SOLVE_PIPELINED = os.getenv("SOLVE_PIPELINED", "1") == "1"
+
+# Self-consistency ensemble (/solve?ensemble=true): one solver call per
+# temperature, majority vote on final_answer with early stopping
+SOLVE_ENSEMBLE_TEMPERATURES = [float(t) for t in os.getenv("SOLVE_ENSEMBLE_TEMPERATURES", "0.2,0.5,0.7,0.9,1.0").split(",") if t.strip()]
+
+# Difficulty-aware solver routing: questions whose hakem difficulty estimate
+# is at most SOLVE_FAST_MAX_DIFFICULTY go to PIPELINE_ROUTES["solve_fast"];
+# an answer below SOLVE_ESCALATE_BELOW_CONFIDENCE is re-solved on the full model.
+# Off by default: on the labelled bank the estimate keeps zor questions off
+# the fast tier (3% routed) but barely separates kolay from orta
+SOLVE_ROUTING = os.getenv("SOLVE_ROUTING", "0") == "1"
+SOLVE_FAST_MAX_DIFFICULTY = float(os.getenv("SOLVE_FAST_MAX_DIFFICULTY", "0.25"))
+SOLVE_ESCALATE_BELOW_CONFIDENCE = float(os.getenv("SOLVE_ESCALATE_BELOW_CONFIDENCE", "0.75"))
+
+# Answer bank fast path: extracted questions that match a data/questions.db
+# entry (MinHash Jaccard over text + choices) get the stored solution
+# instead of a solver call
+ANSWER_BANK_ENABLED = os.getenv("ANSWER_BANK_ENABLED", "1") == "1"
+ANSWER_BANK_MIN_SCORE = float(os.getenv("ANSWER_BANK_MIN_SCORE", "0.85"))
+ANSWER_BANK_DB_PATH = os.getenv("ANSWER_BANK_DB_PATH", os.path.join(os.path.dirname(__file__), "data", "questions.db"))
+
+# Copy guard: generated questions with the same numbers as one of their
+# anchors or any data/questions.db question, and text + choices at least this
+# similar (MinHash Jaccard), are rejected before validation
+COPY_GUARD_ENABLED = os.getenv("COPY_GUARD_ENABLED", "1") == "1"
+COPY_GUARD_MIN_SCORE = float(os.getenv("COPY_GUARD_MIN_SCORE", "0.6"))
+
+# Racing /generate: several generate -> validate chains at once, the first
+# validated question wins and the rest are cancelled. GENERATE_MAX_CALLS caps
+# generator + validator calls per request (the sequential mode makes up to 4)
+GENERATE_RACE = os.getenv("GENERATE_RACE", "1") == "1"
+GENERATE_RACE_CANDIDATES = int(os.getenv("GENERATE_RACE_CANDIDATES", "3"))
+GENERATE_RACE_CONCURRENCY = int(os.getenv("GENERATE_RACE_CONCURRENCY", "4"))
+GENERATE_MAX_CALLS = int(os.getenv("GENERATE_MAX_CALLS", "8"))
+
+# /generate with count > 1: one pool of generator + validator calls builds
+# the set; GENERATE_BATCH_SPARE extra generator calls run ahead of rejections
+GENERATE_MAX_COUNT = int(os.getenv("GENERATE_MAX_COUNT", "50"))
+GENERATE_BATCH_CONCURRENCY = int(os.getenv("GENERATE_BATCH_CONCURRENCY", "12"))
+GENERATE_BATCH_SPARE = int(os.getenv("GENERATE_BATCH_SPARE", "2"))
+GENERATE_BATCH_CALLS_PER_QUESTION = int(os.getenv("GENERATE_BATCH_CALLS_PER_QUESTION", "4"))
+
+# Local prefilter before the validator's solver call: candidates are run
+# through hakem (standardize -> clarity_guard / distractor_quality) and
+# rejected on any of these risk flags or below the distractor quality floor
+# (every data/questions.db question scores >= 0.33)
+GENERATE_PREFILTER = os.getenv("GENERATE_PREFILTER", "1") == "1"
+GENERATE_PREFILTER_REJECT_FLAGS = [f.strip() for f in os.getenv(
+    "GENERATE_PREFILTER_REJECT_FLAGS",
+    "QUESTION_EMPTY,MISSING_CHOICES,EMPTY_CHOICES,DUPLICATE_CHOICES,FIGURE_REFERENCED_BUT_MISSING"
+).split(",") if f.strip()]
+GENERATE_PREFILTER_MIN_DISTRACTOR_QUALITY = float(os.getenv("GENERATE_PREFILTER_MIN_DISTRACTOR_QUALITY", "0.3"))
+
+# Pool of validated generated questions per (topic, difficulty) in SQLite.
+# /generate serves from it first; a background worker refills keys requested
+# in the last QUESTION_POOL_KEY_TTL_SECONDS once their depth drops below the
+# low watermark. Each question is served to at most QUESTION_POOL_MAX_SERVES
+# students (never twice to the same user_id)
+QUESTION_POOL_ENABLED = os.getenv("QUESTION_POOL_ENABLED", "1") == "1"
+QUESTION_POOL_DB_PATH = os.getenv("QUESTION_POOL_DB_PATH", os.path.join(os.path.dirname(__file__), "data", "question_pool.db"))
+QUESTION_POOL_LOW_WATERMARK = int(os.getenv("QUESTION_POOL_LOW_WATERMARK", "5"))
+QUESTION_POOL_TARGET = int(os.getenv("QUESTION_POOL_TARGET", "15"))
+QUESTION_POOL_MAX_SERVES = int(os.getenv("QUESTION_POOL_MAX_SERVES", "25"))
+QUESTION_POOL_MAX_AGE_SECONDS = float(os.getenv("QUESTION_POOL_MAX_AGE_SECONDS", str(30 * 24 * 3600)))
+QUESTION_POOL_KEY_TTL_SECONDS = float(os.getenv("QUESTION_POOL_KEY_TTL_SECONDS", str(7 * 24 * 3600)))
+QUESTION_POOL_REFILL_INTERVAL_SECONDS = float(os.getenv("QUESTION_POOL_REFILL_INTERVAL_SECONDS", "60"))
+# Only keys with a question bank topic and one of these difficulties are
+# kept warm. A refill that adds nothing backs the key off (base * 2^failures)
+# and QUESTION_POOL_MAX_FAILURES in a row evict it
+QUESTION_POOL_DIFFICULTIES = [d.strip() for d in os.getenv("QUESTION_POOL_DIFFICULTIES", "easy,medium,hard").split(",") if d.strip()]
+QUESTION_POOL_RETRY_BASE_SECONDS = float(os.getenv("QUESTION_POOL_RETRY_BASE_SECONDS", "300"))
+QUESTION_POOL_MAX_FAILURES = int(os.getenv("QUESTION_POOL_MAX_FAILURES", "4"))
@@ -1,15 +1,384 @@
+import asyncio
 import json
 import time
-from typing import Type, TypeVar, Optional, Callable, Dict, Any
-from pydantic import BaseModel, ValidationError
-from llm_client import call_llm, call_together
+from contextlib import aclosing
+from functools import lru_cache
+import typing
+from typing import Type, TypeVar, Optional, Callable, Dict, Any, List, Tuple, Annotated, Union, Literal
+from pydantic import BaseModel, ValidationError, TypeAdapter
+from llm_client import call_route, RateLimitError
+from json_stream import JsonStreamScanner, TokenLimitExceeded, parse_member, decode_partial_string, strip_reasoning
+from json_repair import repair_json, has_misread_latex, RepairTimeout
+from llm_cache import llm_cache, cache_key
+from config import RATE_LIMIT_MAX_RETRIES, CONTRACT_PROSE_LIMIT, LLM_CACHE_PIPELINES
+import metrics
 
 T = TypeVar('T', bound=BaseModel)
 
+# Partial-output callback: (event, data) with event in field / item / delta / reset
+PartialCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class ContractViolation(Exception):
+    """Raised mid-stream when the output can no longer satisfy the contract."""
+    pass
+
+
+@lru_cache(maxsize=None)
+def _field_adapters(output_model: Type[BaseModel]) -> Dict[str, Tuple[TypeAdapter, bool]]:
+    """Per-field validators keyed by JSON name (alias if set): {name: (adapter, required)}."""
+    adapters = {}
+    for name, field in output_model.model_fields.items():
+        key = field.alias or name
+        annotation = Annotated[(field.annotation, *field.metadata)] if field.metadata else field.annotation
+        adapters[key] = (TypeAdapter(annotation), field.is_required())
+    return adapters
+
+
+# Pydantic validates in lax mode: numbers may arrive as numeric strings
+# ("0.9"), booleans as strings or 0 / 1
+_NUMBER_CHARS = frozenset('-0123456789"')
+_BOOL_CHARS = frozenset('tf01"')
+# Starts the repair pass turns into the strict one: single-quoted strings
+# and Python literals (True / False / None)
+_REPAIRABLE_STARTS = {'"': "'", "t": "T", "f": "F", "n": "N"}
+
+
+def _json_start_chars(annotation: Any) -> Optional[frozenset]:
+    """
+    Characters a JSON value of this type may start with (as the contract
+    model would accept it), or None when the type is too loose to tell.
+    """
+    origin = typing.get_origin(annotation)
+    if annotation is type(None):
+        return frozenset("n")
+    if origin is Union:
+        chars = set()
+        for arg in typing.get_args(annotation):
+            arg_chars = _json_start_chars(arg)
+            if arg_chars is None:
+                return None
+            chars |= arg_chars
+        return frozenset(chars)
+    if origin is Literal:
+        return frozenset('"') if all(isinstance(arg, str) for arg in typing.get_args(annotation)) else None
+    if annotation is str:
+        return frozenset('"')
+    if origin in (list, tuple, set) or annotation in (list, tuple, set):
+        return frozenset("[")
+    if origin is dict or annotation is dict or (isinstance(annotation, type) and issubclass(annotation, BaseModel)):
+        return frozenset("{")
+    if annotation in (int, float):
+        return _NUMBER_CHARS
+    if annotation is bool:
+        return _BOOL_CHARS
+    return None
+
+
+@lru_cache(maxsize=None)
+def _field_start_chars(output_model: Type[BaseModel]) -> Dict[str, frozenset]:
+    starts = {}
+    for name, field in output_model.model_fields.items():
+        chars = _json_start_chars(field.annotation)
+        if chars is not None:
+            repairable = {_REPAIRABLE_STARTS[ch] for ch in chars if ch in _REPAIRABLE_STARTS}
+            starts[field.alias or name] = chars | repairable
+    return starts
+
+
+class _StreamValidator:
+    """
+    Checks the contract while the object is still streaming:
+    - prose (not JSON) where the object should start
+    - the JSON kind of each top-level value as soon as it starts
+    - each top-level member against its field type/constraints as it closes
+    - required keys once the object has closed, if it is strict JSON
+    Only problems the repair pass (json_repair) cannot fix abort the stream;
+    single quotes and Python literals are left to _load_contract.
+    Validated members are passed to `emit` as "field" events.
+    """
+
+    def __init__(self, output_model: Type[BaseModel], emit: Optional[PartialCallback] = None):
+        self.output_model = output_model
+        self.adapters = _field_adapters(output_model)
+        self.start_chars = _field_start_chars(output_model)
+        self.emit = emit
+        self.seen = set()
+
+    def check(self, scanner: JsonStreamScanner) -> None:
+        if not scanner.started:
+            preamble = scanner.preamble().replace("```json", "").replace("```", "").strip()
+            if len(preamble) > CONTRACT_PROSE_LIMIT:
+                raise ContractViolation(f"{len(preamble)} chars of prose before any JSON object")
+            return
+
+        for key, first_char in scanner.pop_value_starts():
+            allowed = self.start_chars.get(key)
+            if allowed is not None and first_char not in allowed:
+                raise ContractViolation(f"'{key}' has the wrong JSON type (starts with {first_char!r})")
+
+        for key, raw_value in scanner.pop_members():
+            self.seen.add(key)
+            if key not in self.adapters:
+                continue
+            ok, value = parse_member(raw_value)
+            if not ok:
+                continue  # may still be recoverable once the whole object is parsed
+            adapter, _ = self.adapters[key]
+            try:
+                adapter.validate_python(value)
+            except ValidationError as e:
+                raise ContractViolation(f"invalid '{key}': {e.errors()[0]['msg']}")
+            if self.emit is not None:
+                self.emit("field", {"field": key, "value": value})
+
+        if scanner.complete:
+            missing = [key for key, (_, required) in self.adapters.items() if required and key not in self.seen]
+            # The scanner only sees double-quoted keys; an object that needs
+            # repair may still have them, and _load_contract decides
+            if missing and parse_member(scanner.object_text())[0]:
+                raise ContractViolation(f"missing required keys: {', '.join(missing)}")
+
+
+class _PartialOutput:
+    """
+    Partial output of one attempt while it streams: an "item" event for each
+    closed element of a top-level array (e.g. a solution step) and a "delta"
+    event for new text of the top-level string being written. Both are
+    previews; the "field" event for the member carries the checked value.
+    """
+
+    def __init__(self, emit: PartialCallback):
+        self.emit = emit
+        self.sent: Dict[str, int] = {}
+
+    def update(self, scanner: JsonStreamScanner) -> None:
+        for key, index, raw_item in scanner.pop_items():
+            ok, value = parse_member(raw_item)
+            if ok:
+                self.emit("item", {"field": key, "index": index, "value": value})
+
+        open_string = scanner.open_string()
+        if open_string is not None:
+            key, raw_text = open_string
+            text = decode_partial_string(raw_text)
+            sent = self.sent.get(key, 0)
+            if len(text) > sent:
+                self.emit("delta", {"field": key, "text": text[sent:]})
+                self.sent[key] = len(text)
+
+
+class _PartialRelay:
+    """
+    Forwards partial output to `on_partial` from one attempt at a time.
+    Hedged attempts stream side by side and failed attempts are retried, so
+    the first attempt to produce output owns the relay. When the owner fails
+    or loses the race, a "reset" event tells the client to drop what it has
+    shown, and the output of the next attempt so far is replayed.
+    """
+
+    def __init__(self, on_partial: PartialCallback):
+        self.on_partial = on_partial
+        self.owner: Optional[object] = None
+        self.logs: Dict[object, List[Tuple[str, Dict[str, Any]]]] = {}
+
+    def emitter(self) -> Tuple[PartialCallback, object]:
+        token = object()
+        log = self.logs[token] = []
+
+        def emit(event: str, data: Dict[str, Any]) -> None:
+            log.append((event, data))
+            if self.owner is None:
+                self.owner = token
+            if self.owner is token:
+                self.on_partial(event, data)
+
+        return emit, token
+
+    def release(self, token: object) -> None:
+        self.logs.pop(token, None)
+        if self.owner is not token:
+            return
+        self.owner = None
+        self.on_partial("reset", {})
+        for other, log in self.logs.items():
+            if log:
+                self.owner = other
+                for event, data in log:
+                    self.on_partial(event, data)
+                return
+
+
+def _load_contract(json_str: str, output_model: Type[T]) -> T:
+    """
+    Strict json.loads + validation first; the local repair pass only runs
+    when that fails, or when the parsed strings hold a backspace / form feed
+    (a LaTeX `\\frac` read as an escape). A repaired object that validates
+    saves a full LLM retry.
+    """
+    parse_error = None
+    try:
+        parsed_json = json.loads(json_str)
+    except json.JSONDecodeError as e:
+        parse_error = e
+    else:
+        if not has_misread_latex(parsed_json):
+            return output_model(**parsed_json)
+    strict_json = parsed_json if parse_error is None else None
+
+    start = min((i for i in (json_str.find("{"), json_str.find("[")) if i >= 0), default=0)
+    metrics.incr("json_repair.attempts")
+    started_at = time.perf_counter()
+    try:
+        repaired, fixes = repair_json(json_str[start:])
+        parsed_json = json.loads(repaired)
+    except (RepairTimeout, json.JSONDecodeError) as e:
+        metrics.incr("json_repair.timeouts" if isinstance(e, RepairTimeout) else "json_repair.failed")
+        if parse_error is None:
+            # Only the misread LaTeX asked for repair; take the strict parse
+            return output_model(**strict_json)
+        raise parse_error
+    finally:
+        metrics.incr("json_repair.ms_total", (time.perf_counter() - started_at) * 1000)
+
+    for fix in fixes:
+        metrics.incr(f"json_repair.fix.{fix}")
+    try:
+        validated = output_model(**parsed_json)
+    except ValidationError:
+        metrics.incr("json_repair.failed")
+        raise
+    if parse_error is not None:
+        metrics.incr("json_repair.saved_retry")
+        print(f"[REPAIR] fixed JSON locally ({', '.join(fixes)}), retry avoided")
+    return validated
+
+
+def _parse_contract(raw_output: str, output_model: Type[T]) -> T:
+    """Extracts the JSON payload from raw model output and validates it."""
+    json_str = strip_reasoning(raw_output)
+    if "```json" in json_str:
+        json_str = json_str.split("```json")[1].split("```")[0].strip()
+    elif "```" in json_str:
+         json_str = json_str.split("```")[1].split("```")[0].strip()
+
+
+    return _load_contract(json_str, output_model)
+
+
+async def _attempt_route(
+    route: Dict[str, Any],
+    prompt: str,
+    output_model: Type[T],
+    image_b64: Optional[str],
+    image_mime_type: str,
+    max_tokens: int,
+    temperature: float,
+    first_token: asyncio.Event,
+    emit: Optional[PartialCallback] = None
+) -> T:
+    """
+    Streams one call on `route` and validates the result.
+    Reading stops as soon as the first top-level JSON object closes; the
+    connection is closed so trailing commentary is never generated or billed.
+    Fields are validated as they stream in, and an unrecoverable problem
+    aborts the stream with ContractViolation so the retry can start at once.
+    With `emit`, validated fields and partial output are reported as they arrive.
+    """
+    scanner = JsonStreamScanner(max_tokens=max_tokens)
+    validator = _StreamValidator(output_model, emit)
+    partial = _PartialOutput(emit) if emit is not None else None
+    stream = call_route(route, prompt=prompt, image_b64=image_b64, image_mime_type=image_mime_type, max_tokens=max_tokens, temperature=temperature)
+    async with aclosing(stream):
+        try:
+            async for chunk in stream:
+                first_token.set()
+                complete = scanner.feed(chunk)
+                if partial is not None:
+                    partial.update(scanner)
+                validator.check(scanner)
+                if complete:
+                    break
+        except TokenLimitExceeded as e:
+            # Out of budget mid-object: let the repair pass try to close it
+            print(f"[WARN] {e}")
+
+    if scanner.complete:
+        return _load_contract(scanner.object_text(), output_model)
+
+    # No balanced object found (truncated or fenced oddly); fall back to
+    # fence-based extraction, which repairs what it can
+    return _parse_contract(scanner.text(), output_model)
+
+
+async def _race_routes(
+    routes: List[Dict[str, Any]],
+    hedge_after_ms: Optional[int],
+    attempt: Callable[[Dict[str, Any], asyncio.Event], Any],
+    log_ctx: str
+) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Runs `attempt` on routes[0]. A failed attempt fails over to the next route;
+    if no first token arrives within `hedge_after_ms`, a hedged duplicate is
+    launched on the next route. The first valid result wins and every other
+    in-flight stream is cancelled so its tokens stop being billed.
+    Returns (result, winning_route).
+    """
+    launched = []  # (task, first_token, route, launched_at)
+    next_route = 0
+    last_error: Optional[BaseException] = None
+
+    def launch():
+        nonlocal next_route
+        route = routes[next_route]
+        next_route += 1
+        first_token = asyncio.Event()
+        task = asyncio.create_task(attempt(route, first_token))
+        launched.append((task, first_token, route, time.monotonic()))
+
+    launch()
+    try:
+        while True:
+            pending = [task for task, *_ in launched if not task.done()]
+            if not pending:
+                if next_route < len(routes):
+                    print(f"[FAILOVER] {log_ctx} switching to provider={routes[next_route]['provider']}")
+                    launch()
+                    continue
+                raise last_error
+
+            timeout = None
+            _, newest_first_token, newest_route, newest_at = launched[-1]
+            if hedge_after_ms is not None and next_route < len(routes) and not newest_first_token.is_set():
+                timeout = max(0.0, newest_at + hedge_after_ms / 1000 - time.monotonic())
+
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                if not newest_first_token.is_set():
+                    print(f"[HEDGE] {log_ctx} provider={newest_route['provider']} no first token after {hedge_after_ms}ms, hedging to provider={routes[next_route]['provider']}")
+                    launch()
+                continue
+
+            for task, _, route, _ in launched:
+                if task in done and task.exception() is None:
+                    return task.result(), route
+            for task, _, route, _ in launched:
+                if task in done:
+                    last_error = task.exception()
+                    print(f"[WARN] {log_ctx} provider={route['provider']} attempt failed: {last_error}")
+    finally:
+        losers = [task for task, *_ in launched if not task.done()]
+        for task in losers:
+            task.cancel()
+        if losers:
+            await asyncio.gather(*losers, return_exceptions=True)
+
+
 async def run_with_contract_guard(
     prompt: str,
     output_model: Type[T],
-    api_key: str,
+    api_key: Optional[str] = None,
     image_b64: Optional[str] = None,
     image_mime_type: str = "image/jpeg",
     pipeline_name: str = "unknown",
@@ -17,7 +386,13 @@ async def run_with_contract_guard(
     request_id: str = "unknown",
     max_retries: int = 1,
     use_together: bool = False,
-    model: Optional[str] = None
+    model: Optional[str] = None,
+    routes: Optional[List[Dict[str, Any]]] = None,
+    hedge_after_ms: Optional[int] = None,
+    max_tokens: int = 2000,
+    temperature: float = 0.6,
+    cache: Optional[bool] = None,
+    on_partial: Optional[PartialCallback] = None
 ) -> T:
     """
     Executes an LLM call and enforces a strict Pydantic contract on the output.
@@ -26,51 +401,86 @@ async def run_with_contract_guard(
     2. Try to parse JSON and validate against output_model
     3. If fail, log and Retry ONCE (with same input)
     4. If fail again, raise Exception (caller handles graceful error)
-    
+
+    Provider 429s are not contract failures: they are retried separately
+    (up to RATE_LIMIT_MAX_RETRIES) once the provider limiter has backed off.
+
+    `routes` is an ordered provider list ({"provider", "api_key", "model"}).
+    Each attempt fails over along it and, with `hedge_after_ms`, hedges to the
+    next route when time-to-first-token passes the deadline. Without `routes`
+    a single route is built from `api_key` / `model` / `use_together`.
+
+    The stream is closed as soon as the first JSON object is complete, and
+    `max_tokens` is enforced locally as well as by the provider. Contract
+    problems detected mid-stream abort the attempt early (ContractViolation).
+
+    Validated outputs are cached by content (routes, prompt, image, temperature,
+    output model) for pipelines in LLM_CACHE_PIPELINES; `cache` overrides
+    the per-pipeline default.
+
+    `on_partial(event, data)` receives the output while it streams (see
+    _PartialOutput / _PartialRelay); a cache hit produces no partial events.
+
     Returns the validated Pydantic model instance.
     """
-    
+    if routes is None:
+        routes = [{"provider": "together" if use_together else "fireworks", "api_key": api_key, "model": model}]
+    else:
+        # Skip routes whose key is not configured
+        routes = [route for route in routes if route.get("api_key")] or routes[:1]
+
+    log_ctx = f"req_id={request_id} pipeline={pipeline_name} model={model_name}"
+
+    use_cache = pipeline_name in LLM_CACHE_PIPELINES if cache is None else cache
+    if use_cache:
+        key = cache_key(routes, prompt, image_b64, temperature, output_model)
+        cached = await llm_cache.get(key, output_model, pipeline_name)
+        if cached is not None:
+            print(f"[LOG] {log_ctx} cache=hit")
+            return cached
+
+    relay = _PartialRelay(on_partial) if on_partial is not None else None
+
+    async def attempt(route: Dict[str, Any], first_token: asyncio.Event) -> T:
+        if relay is None:
+            return await _attempt_route(route, prompt, output_model, image_b64, image_mime_type, max_tokens, temperature, first_token)
+        emit, token = relay.emitter()
+        try:
+            return await _attempt_route(route, prompt, output_model, image_b64, image_mime_type, max_tokens, temperature, first_token, emit)
+        except BaseException:
+            # Failed, or cancelled after losing the race
+            relay.release(token)
+            raise
+
     retries = 0
-    
+    rate_limit_retries = 0
+
     while retries <= max_retries:
         start_time = time.time()
-        raw_output = ""
-        
+
         try:
+            validated_obj, route = await _race_routes(routes, hedge_after_ms, attempt, log_ctx)
 
-            chunks = []
-            if use_together:
-                llm_args = {"prompt": prompt, "api_key": api_key}
-                if model: llm_args["model"] = model
-                for chunk in call_together(**llm_args):
-                    chunks.append(chunk)
-            else:
-                llm_args = {"prompt": prompt, "api_key": api_key, "image_b64": image_b64, "image_mime_type": image_mime_type}
-                if model: llm_args["model"] = model
-                for chunk in call_llm(**llm_args):
-                    chunks.append(chunk)
-            raw_output = "".join(chunks)
-            
-
-            json_str = raw_output
-            if "```json" in json_str:
-                json_str = json_str.split("```json")[1].split("```")[0].strip()
-            elif "```" in json_str:
-                 json_str = json_str.split("```")[1].split("```")[0].strip()
-
-
-            parsed_json = json.loads(json_str)
-            validated_obj = output_model(**parsed_json)
-            
 
             latency = int((time.time() - start_time) * 1000)
-            print(f"[LOG] req_id={request_id} pipeline={pipeline_name} model={model_name} latency={latency}ms parse_valid=True contract_valid=True retry={retries}")
+            print(f"[LOG] {log_ctx} provider={route['provider']} latency={latency}ms parse_valid=True contract_valid=True retry={retries}")
+            if use_cache:
+                await llm_cache.put(key, validated_obj, latency)
             return validated_obj
-            
-        except (json.JSONDecodeError, ValidationError, Exception) as e:
+
+        except RateLimitError as e:
+            rate_limit_retries += 1
+            print(f"[WARN] {log_ctx} rate_limited retry_after={e.retry_after} rate_limit_retry={rate_limit_retries}")
+            if rate_limit_retries > RATE_LIMIT_MAX_RETRIES:
+                print(f"[ERROR] Rate limit retries exhausted for {pipeline_name}/{model_name}")
+                raise e
+            # The limiter holds the next attempt back until the provider window reopens
+            continue
+
+        except (json.JSONDecodeError, ValidationError, ContractViolation, Exception) as e:
             latency = int((time.time() - start_time) * 1000)
-            print(f"[WARN] req_id={request_id} pipeline={pipeline_name} model={model_name} latency={latency}ms parse_valid=False contract_valid=False retry={retries} error={str(e)}")
-            
+            print(f"[WARN] {log_ctx} latency={latency}ms parse_valid=False contract_valid=False retry={retries} error={str(e)}")
+
             retries += 1
             if retries > max_retries:
                 print(f"[ERROR] Max retries reached for {pipeline_name}/{model_name}")
@@ -0,0 +1,107 @@
+"""
+Encoding profiles for images sent to vision models.
+
+A profile picks the resolution, colour mode, format and quality that keep
+an exam photo legible while fitting a byte budget (upload time) and a
+vision-token budget (provider cost). Qwen-VL style models bill one token per
+28x28 patch, so tokens scale with pixel count, not with file size.
+"""
+
+import io
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+from PIL import Image
+
+from config import IMAGE_PROFILES
+
+VISION_PATCH = 28
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    mime_type: str
+    size: Tuple[int, int]
+    vision_tokens: int
+    grayscale: bool
+
+
+def vision_tokens(size: Tuple[int, int]) -> int:
+    width, height = size
+    return math.ceil(width / VISION_PATCH) * math.ceil(height / VISION_PATCH)
+
+
+def is_grayscale(image: Image.Image, saturation: int, max_colored_fraction: float = 0.002) -> bool:
+    """True when (almost) no pixel carries colour, e.g. black-and-white scans."""
+    small = image.copy()
+    small.thumbnail((384, 384))
+    sat = small.convert("HSV").getchannel("S")
+    colored = sum(sat.histogram()[saturation:])
+    return colored <= max_colored_fraction * small.width * small.height
+
+
+def _fit_long_edge(size: Tuple[int, int], profile: Dict[str, Any]) -> int:
+    """Largest long edge within max_long_edge and the vision-token budget."""
+    width, height = size
+    long_edge = min(max(width, height), profile["max_long_edge"])
+    aspect = min(width, height) / max(width, height)
+    # tokens ~= (L / 28) * (L * aspect / 28) <= budget
+    budget_edge = int(VISION_PATCH * math.sqrt(profile["max_vision_tokens"] / aspect))
+    long_edge = min(long_edge, budget_edge)
+    # Patch rounding can push the count just over the budget
+    while long_edge > VISION_PATCH and vision_tokens((long_edge, max(1, round(long_edge * aspect)))) > profile["max_vision_tokens"]:
+        long_edge -= VISION_PATCH // 2
+    return max(long_edge, min(profile["min_long_edge"], max(width, height)))
+
+
+def _resize(image: Image.Image, long_edge: int) -> Image.Image:
+    scale = long_edge / max(image.size)
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def _save(image: Image.Image, fmt: str, quality) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "PNG":
+        image.save(buf, format="PNG", optimize=False)
+    elif fmt == "WEBP":
+        image.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buf, format="JPEG", quality=quality, optimize=True, progressive=False)
+    return buf.getvalue()
+
+
+def encode_for_vlm(image: Image.Image, profile_name: str) -> EncodedImage:
+    """
+    Encodes `image` (RGB) with the named profile:
+    1. grayscale if the picture carries no colour (grayscale_saturation=None
+       keeps colour)
+    2. downscale to the long edge allowed by max_long_edge / max_vision_tokens
+    3. walk the format x quality ladder until the payload fits target_bytes,
+       then shrink the long edge (down to min_long_edge) if it still does not
+    The last (smallest) attempt is used when nothing fits.
+    """
+    profile = IMAGE_PROFILES[profile_name]
+    saturation = profile["grayscale_saturation"]
+    grayscale = saturation is not None and is_grayscale(image, saturation)
+    if grayscale:
+        image = image.convert("L")
+
+    long_edge = _fit_long_edge(image.size, profile)
+    while True:
+        resized = _resize(image, long_edge)
+        for fmt in profile["formats"]:
+            for quality in profile["qualities"]:
+                data = _save(resized, fmt, quality)
+                if len(data) <= profile["target_bytes"]:
+                    return EncodedImage(data, _MIME_TYPES[fmt], resized.size, vision_tokens(resized.size), grayscale)
+        next_edge = int(long_edge * 0.8)
+        if next_edge < profile["min_long_edge"]:
+            return EncodedImage(data, _MIME_TYPES[fmt], resized.size, vision_tokens(resized.size), grayscale)
+        long_edge = next_edge
@@ -1,36 +1,313 @@
 import uuid
 import io
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional, Tuple
 from fastapi import UploadFile, HTTPException
-from PIL import Image
+from fastapi.responses import JSONResponse
+from PIL import Image, ImageOps
+from config import IMAGE_WORKERS, IMAGE_MAX_PENDING, IMAGE_QUEUE_TIMEOUT, IMAGE_PROFILE, IMAGE_PROFILES, IMAGE_AUTO_CROP, PAGE_MAX_LONG_EDGE, PAGE_MAX_QUESTIONS
+from config import UPLOAD_MAX_BYTES, IMAGE_MAX_PIXELS, UPLOAD_CHUNK_SIZE
+from image_encoding import encode_for_vlm
+from logic.page_layout import crop_and_deskew, split_page, LayoutResult
+import metrics
+
+
+@dataclass
+class ProcessedImage:
+    """Normalized upload plus its perceptual hashes."""
+    data: bytes
+    dhash: int        # 64-bit dHash (near-duplicate index key)
+    dhash_fine: int   # 256-bit dHash (verification)
+    mime_type: str = "image/png"
+    vision_tokens: int = 0
+    pixel_reduction: float = 0.0   # share of decoded pixels removed by auto-crop
+    skew_degrees: float = 0.0
 
 def generate_request_id() -> str:
     """Generates a unique request ID."""
     return str(uuid.uuid4())
 
-async def process_image(file: UploadFile, max_size=(1024, 1024)) -> bytes:
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash: grayscale, resize to (hash_size+1) x hash_size and set
+    one bit per horizontally adjacent pixel pair (left brighter than right).
+    Robust to rescaling, recompression and mild lighting changes.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def perceptual_hashes(image: Image.Image) -> tuple:
+    """
+    (64-bit, 256-bit) dHash of the content area. Pages are mostly blank
+    paper, so the hashes are taken on the bounding box of the ink; otherwise
+    margins dominate and different questions in the same layout collide.
+    """
+    gray = ImageOps.autocontrast(image.convert("L"))
+    box = ImageOps.invert(gray).point(lambda v: 255 if v > 96 else 0).getbbox()
+    if box:
+        gray = gray.crop(box)
+    return dhash(gray), dhash(gray, hash_size=16)
+
+# ------------------------------------------------------------------------
+# UPLOAD LIMITS
+# ------------------------------------------------------------------------
+
+# Leading bytes of the formats we decode
+_MAGIC_BYTES = {
+    b"\xff\xd8\xff": "JPEG",
+    b"\x89PNG\r\n\x1a\n": "PNG",
+    b"GIF87a": "GIF",
+    b"GIF89a": "GIF",
+    b"BM": "BMP",
+    b"II*\x00": "TIFF",
+    b"MM\x00*": "TIFF",
+}
+# Image headers (JPEG SOF after EXIF / ICC blocks) are probed this far
+_HEADER_PROBE_BYTES = 512 * 1024
+# Multipart boundaries and part headers on top of the file itself
+_FORM_OVERHEAD = 64 * 1024
+
+_TOO_LARGE_DETAIL = f"Upload exceeds {UPLOAD_MAX_BYTES // (1024 * 1024)} MB."
+
+class _BodyTooLarge(HTTPException):
+    """Raised from receive(); an HTTPException so FastAPI's body parsing passes it on as a 413."""
+
+    def __init__(self):
+        super().__init__(status_code=413, detail=_TOO_LARGE_DETAIL)
+
+class UploadSizeLimit:
     """
-    Validates and optionally resizes the uploaded image.
-    Ensures the image is a PNG or converts it.
-    Returns the image bytes.
+    ASGI middleware: answers 413 to requests whose body exceeds
+    UPLOAD_MAX_BYTES. A declared Content-Length is checked before the body is
+    read; chunked bodies and bodies without one are counted as they arrive,
+    so oversized uploads are never fully parsed or spooled.
     """
-    if not file.content_type.startswith("image/"):
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_BYTES + _FORM_OVERHEAD):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def _reject(self, scope, receive, send) -> None:
+        response = JSONResponse(status_code=413, content={"detail": _TOO_LARGE_DETAIL})
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                metrics.incr("upload.rejected_size")
+                await self._reject(scope, receive, send)
+                return
+
+        received = 0
+        started = False
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    metrics.incr("upload.rejected_size")
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, tracking_send)
+        except _BodyTooLarge:
+            if started:
+                raise
+            await self._reject(scope, receive, send)
+
+def _sniff_format(head: bytes) -> Optional[str]:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for magic, fmt in _MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return fmt
+    return None
+
+def _check_pixels(size: Tuple[int, int]) -> None:
+    width, height = size
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ValueError(f"Image is {width}x{height} pixels (max {IMAGE_MAX_PIXELS}).")
+
+def _declared_size(head: bytes) -> Optional[Tuple[int, int]]:
+    """Dimensions from the image header, or None while the header is incomplete."""
+    try:
+        with Image.open(io.BytesIO(head)) as image:
+            return image.size
+    except Image.DecompressionBombError as e:
+        raise ValueError(str(e))
+    except Exception:
+        return None
+
+async def validate_upload(file: UploadFile) -> None:
+    """
+    Streams through an upload in UPLOAD_CHUNK_SIZE chunks without buffering
+    it, rejecting as early as possible:
+    - 413 when it is over UPLOAD_MAX_BYTES (up front when the size is known)
+    - 400 when the first bytes are not a supported image format
+    - 400 when the header declares more than IMAGE_MAX_PIXELS (decompression bomb)
+    The file is left rewound for decoding.
+    """
+    if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image.")
+    too_large = HTTPException(status_code=413, detail=f"Upload exceeds {UPLOAD_MAX_BYTES // (1024 * 1024)} MB.")
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        metrics.incr("upload.rejected_size")
+        raise too_large
+
+    head = b""
+    declared = None
+    total = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > UPLOAD_MAX_BYTES:
+            metrics.incr("upload.rejected_size")
+            raise too_large
+        if declared is None and len(head) < _HEADER_PROBE_BYTES:
+            head += chunk
+            if total == len(chunk) and _sniff_format(head) is None:
+                metrics.incr("upload.rejected_format")
+                raise HTTPException(status_code=400, detail="Unsupported image format (JPEG, PNG, WebP, GIF, BMP or TIFF expected).")
+            try:
+                declared = _declared_size(head)
+                if declared is not None:
+                    _check_pixels(declared)
+            except ValueError as e:
+                metrics.incr("upload.rejected_pixels")
+                raise HTTPException(status_code=400, detail=f"Invalid image file: {e}")
+        elif file.size is not None:
+            break  # size known to be within the limit, nothing left to check
+    if total == 0:
+        raise HTTPException(status_code=400, detail="Empty upload.")
+    await file.seek(0)
+
+# ------------------------------------------------------------------------
+# IMAGE POOL
+# ------------------------------------------------------------------------
+
+# Pillow work runs here, off the event loop. Pillow releases the GIL while
+# decoding, resampling and encoding, so threads scale across cores.
+_image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+# Backpressure: at most IMAGE_MAX_PENDING images running or queued
+_image_slots = asyncio.Semaphore(IMAGE_MAX_PENDING)
+
+def shutdown_image_pool() -> None:
+    _image_pool.shutdown(wait=False, cancel_futures=True)
+
+def _decode(source: BinaryIO, max_edge: int) -> Image.Image:
+    image = Image.open(source)
+    # Headers past the probe window were not checked while streaming
+    _check_pixels(image.size)
+    # JPEG: let the decoder downscale by 1/2, 1/4 or 1/8 while decoding, so a
+    # 12 MP photo is never fully materialized. No-op for other formats.
+    image.draft("RGB", (max_edge, max_edge))
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+def _encode(image: Image.Image, profile: str, pixel_reduction: float = 0.0, skew: float = 0.0) -> ProcessedImage:
+    coarse_hash, fine_hash = perceptual_hashes(image)
+    encoded = encode_for_vlm(image, profile)
+    return ProcessedImage(
+        data=encoded.data,
+        dhash=coarse_hash,
+        dhash_fine=fine_hash,
+        mime_type=encoded.mime_type,
+        vision_tokens=encoded.vision_tokens,
+        pixel_reduction=pixel_reduction,
+        skew_degrees=skew
+    )
+
+def _process_image_sync(source: BinaryIO, profile: str) -> ProcessedImage:
+    image = _decode(source, IMAGE_PROFILES[profile]["max_long_edge"])
+
+    pixel_reduction, skew = 0.0, 0.0
+    if IMAGE_AUTO_CROP:
+        # Desk, margins and neighbouring questions never reach the VLM
+        layout = crop_and_deskew(image)
+        image, pixel_reduction, skew = layout.image, layout.pixel_reduction, layout.skew_degrees
+        metrics.incr("ingest.pixels_in", layout.original_pixels)
+        metrics.incr("ingest.pixels_out", layout.output_pixels)
+
+    return _encode(image, profile, pixel_reduction, skew)
+
+def _split_page_sync(source: BinaryIO) -> Tuple[List[Image.Image], LayoutResult]:
+    # Questions are a small part of the page: decode at a higher resolution
+    return split_page(_decode(source, PAGE_MAX_LONG_EDGE))
+
+async def process_image(file: UploadFile, profile: str = IMAGE_PROFILE) -> ProcessedImage:
+    """
+    Validates the uploaded image (validate_upload) and re-encodes it with an
+    encoding profile (format, quality and resolution tuned for the vision
+    model). Returns the encoded bytes, their MIME type and perceptual hashes.
+    Decoding (straight from the spooled upload, never copied into one bytes
+    object) and re-encoding run in the bounded image pool; when the pool is
+    saturated for IMAGE_QUEUE_TIMEOUT seconds the request gets a 503.
+    """
+    await validate_upload(file)
+
+    try:
+        await asyncio.wait_for(_image_slots.acquire(), timeout=IMAGE_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Sunucu şu an yoğun, lütfen tekrar deneyin.")
 
     try:
-        content = await file.read()
-        image = Image.open(io.BytesIO(content))
-        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_image_pool, _process_image_sync, file.file, profile)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+    finally:
+        _image_slots.release()
 
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-            
+async def process_page(file: UploadFile, profile: str = IMAGE_PROFILE) -> List[ProcessedImage]:
+    """
+    Splits a photographed test page into questions (logic/page_layout.py)
+    and encodes each crop like process_image. Returns them in page order,
+    at most PAGE_MAX_QUESTIONS. The page holds one image-pool slot; its
+    crops are encoded in parallel on the pool.
+    """
+    await validate_upload(file)
 
-        image.thumbnail(max_size)
-        
+    try:
+        await asyncio.wait_for(_image_slots.acquire(), timeout=IMAGE_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Sunucu şu an yoğun, lütfen tekrar deneyin.")
 
-        output = io.BytesIO()
-        image.save(output, format="PNG")
-        return output.getvalue()
-        
+    try:
+        loop = asyncio.get_running_loop()
+        crops, layout = await loop.run_in_executor(_image_pool, _split_page_sync, file.file)
+        if len(crops) > PAGE_MAX_QUESTIONS:
+            print(f"[INGEST] page has {len(crops)} question regions, keeping the first {PAGE_MAX_QUESTIONS}")
+            crops = crops[:PAGE_MAX_QUESTIONS]
+        page_pixels = layout.original_pixels
+        return list(await asyncio.gather(*(
+            loop.run_in_executor(_image_pool, _encode, crop, profile, 1 - crop.width * crop.height / page_pixels, layout.skew_degrees)
+            for crop in crops
+        )))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+    finally:
+        _image_slots.release()
@@ -0,0 +1,213 @@
+"""
+Deterministic repair pass for almost-valid JSON from LLM output.
+
+Fixes the failure modes we see most often in contract logs, so the guard
+does not have to pay for a second LLM round trip:
+- LaTeX backslashes (`\\frac`, `\\sqrt`, `\\times`) that are invalid or
+  misread JSON escapes
+- raw newlines / control characters inside strings
+- single-quoted strings and Python literals (True / False / None)
+- trailing commas before `}` or `]`
+- output truncated mid-string / mid-object (closes what is open)
+
+The pass is a single linear scan with a wall-clock budget; it raises
+RepairTimeout rather than spend unbounded CPU on a pathological input.
+"""
+
+import re
+import time
+from typing import Any, List, Tuple
+
+from config import JSON_REPAIR_MAX_MS
+
+
+class RepairTimeout(Exception):
+    """The repair pass ran past its time budget."""
+    pass
+
+
+# LaTeX commands whose first letter forms a *valid* JSON escape
+# (\b \f \n \r \t), so json.loads would silently turn them into control chars.
+# Short commands that are also words after an escaped newline/tab ("\ne",
+# "\top", "\tan", "\not", ...) are left out: a real line break followed by
+# Turkish text must never be rewritten.
+_LATEX_COMMANDS = {
+    "beta", "binom", "bigl", "bigr", "boxed",
+    "frac", "forall",
+    "neq", "nabla", "notin", "nless", "ngtr", "nearrow",
+    "rho", "rightarrow", "rangle", "rfloor", "rceil",
+    "theta", "times", "tau", "text", "tilde", "textbf", "therefore", "triangle", "tfrac",
+}
+
+_ESCAPES = set('"\\/bfnrtu')
+_HEX = set("0123456789abcdefABCDEF")
+_WORD = re.compile(r"[A-Za-z]+")
+_CHECK_EVERY = 2048
+_TAIL_WINDOW = 4096
+
+
+def _latex_command_at(text: str, i: int) -> bool:
+    """
+    True if text[i] is a backslash starting a known LaTeX command, as a whole
+    word ("\\neşit" is a newline before "eşit", not "\\ne" + "şit").
+    """
+    match = _WORD.match(text, i + 1)
+    if not match or match.group(0) not in _LATEX_COMMANDS:
+        return False
+    return match.end() >= len(text) or not text[match.end()].isalpha()
+
+
+def has_misread_latex(value: Any) -> bool:
+    """
+    True if a json.loads result holds a backspace or form feed. Models never
+    mean those; they are a LaTeX `\\beta` / `\\frac` read as a JSON escape,
+    so the raw text needs the repair pass even though it parsed.
+    """
+    if isinstance(value, str):
+        return "\b" in value or "\f" in value
+    if isinstance(value, dict):
+        return any(has_misread_latex(item) for item in value.values())
+    if isinstance(value, list):
+        return any(has_misread_latex(item) for item in value)
+    return False
+
+
+def repair_json(text: str, max_ms: float = JSON_REPAIR_MAX_MS) -> Tuple[str, List[str]]:
+    """
+    Rewrites `text` (expected to start at the first `{` or `[`) into valid
+    JSON where the damage is recognisable.
+    Returns (repaired_text, fixes_applied). Raises RepairTimeout.
+    """
+    deadline = time.perf_counter() + max_ms / 1000
+    fixes = set()
+    out: List[str] = []
+    stack: List[str] = []     # open containers: "{" or "["
+    quote = None              # active string delimiter, if inside a string
+    i = 0
+    n = len(text)
+    steps = 0
+
+    while i < n:
+        steps += 1
+        if steps % _CHECK_EVERY == 0 and time.perf_counter() > deadline:
+            raise RepairTimeout(f"JSON repair exceeded {max_ms}ms on {n} chars")
+
+        ch = text[i]
+
+        if quote is not None:
+            if ch == "\\":
+                nxt = text[i + 1] if i + 1 < n else ""
+                if nxt == "'" and quote == "'":
+                    out.append("'")
+                    i += 2
+                    continue
+                if nxt in ("b", "f", "n", "r", "t") and _latex_command_at(text, i):
+                    out.append("\\\\")
+                    fixes.add("latex_escape")
+                elif nxt == "u" and not (i + 5 < n and all(c in _HEX for c in text[i + 2:i + 6])):
+                    out.append("\\\\")
+                    fixes.add("invalid_escape")
+                elif nxt not in _ESCAPES:
+                    out.append("\\\\")
+                    fixes.add("invalid_escape")
+                    i += 1
+                    continue
+                else:
+                    out.append("\\" + nxt)
+                    i += 2
+                    continue
+                i += 1
+                continue
+            if ch == quote:
+                out.append('"')
+                quote = None
+            elif ch == '"':
+                out.append('\\"')  # literal double quote inside a single-quoted string
+            elif ch < " ":
+                out.append({"\n": "\\n", "\r": "\\r", "\t": "\\t"}.get(ch, "\\u%04x" % ord(ch)))
+                fixes.add("control_char")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch == '"':
+            quote = '"'
+            out.append('"')
+        elif ch == "'":
+            quote = "'"
+            out.append('"')
+            fixes.add("single_quotes")
+        elif ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+        elif ch in "}]":
+            _strip_trailing_comma(out, fixes)
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                if text[i + 1:].strip():
+                    fixes.add("trailing_text")
+                break
+        elif ch.isalpha():
+            match = _WORD.match(text, i)
+            word = match.group(0)
+            literal = {"True": "true", "False": "false", "None": "null"}.get(word)
+            if literal:
+                fixes.add("python_literal")
+            out.append(literal or word)
+            i = match.end()
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if quote is not None or stack:
+        fixes.add("truncated")
+        if quote is not None:
+            out.append('"')
+        _drop_dangling(out, stack)
+        for opener in reversed(stack):
+            out.append("}" if opener == "{" else "]")
+
+    return "".join(out), sorted(fixes)
+
+
+def _strip_trailing_comma(out: List[str], fixes: set) -> None:
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ",":
+        del out[j:]
+        fixes.add("trailing_comma")
+
+
+def _drop_dangling(out: List[str], stack: List[str]) -> None:
+    """
+    After truncation, removes an incomplete trailing member of the innermost
+    object: a lone key (`"k"`), a key with no value (`"k":`), a cut-off
+    literal (`tr`, `1.`) or a dangling comma, so closing the brackets
+    yields valid JSON.
+    """
+    joined = "".join(out).rstrip()
+    # Only the tail can be dangling; keep the regexes off the full text
+    head, text = joined[:-_TAIL_WINDOW], joined[-_TAIL_WINDOW:]
+    if stack and stack[-1] == "{":
+        # "key" or "key": with nothing after it
+        match = re.search(r'[{,]\s*"(?:[^"\\]|\\.)*"\s*:?\s*$', text)
+        if match:
+            text = text[:match.start() + 1]
+    # Cut-off bare literal / number
+    match = re.search(r"[:,\[]\s*(t|tr|tru|f|fa|fal|fals|n|nu|nul|-|[-\d.]*[.eE][-+]?)$", text)
+    if match:
+        text = text[:match.start() + 1]
+    if text.endswith(":"):
+        text = text[:-1].rstrip()
+        key = re.search(r'[{,]\s*"(?:[^"\\]|\\.)*"$', text)
+        if key:
+            text = text[:key.start() + 1]
+    text = text.rstrip()
+    if text.endswith(","):
+        text = text[:-1]
+    out[:] = [head + text]
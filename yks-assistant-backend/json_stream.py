@@ -0,0 +1,236 @@
+"""
+Incremental scanner for JSON objects embedded in streamed LLM output.
+
+Models wrap the contract object in prose or markdown fences and often keep
+writing after the closing brace. The scanner tracks brace depth and string
+state chunk by chunk, so the caller can stop reading the stream the moment
+the first top-level object closes. Completed top-level members are reported
+as they close, which lets callers validate fields mid-stream; elements of
+top-level arrays and the text of the top-level string being written are
+exposed too, so partial output can be shown while the object streams.
+Reasoning models write a <think>...</think> block first; braces inside it
+are not the contract object and its text is not counted as prose.
+"""
+
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+
+_REASONING = re.compile(r"<think>.*?(?:</think>|$)", re.DOTALL)
+
+
+def strip_reasoning(text: str) -> str:
+    """`text` without <think> blocks (an unclosed one runs to the end)."""
+    return _REASONING.sub("", text)
+
+
+class TokenLimitExceeded(Exception):
+    """The stream used up max_tokens before the JSON object was complete."""
+    pass
+
+
+class JsonStreamScanner:
+    """
+    Feed chunks with `feed()`; it returns True once the first top-level
+    `{...}` is complete. Each chunk counts as one token towards `max_tokens`
+    (providers stream roughly one token per delta).
+
+    `pop_members()` returns the (key, raw_value_text) pairs of the object's
+    top-level members that closed since the last call; `pop_value_starts()`
+    returns (key, first_char) as soon as each member's value begins;
+    `pop_items()` returns (key, index, raw_item_text) for each closed element
+    of a top-level array; `open_string()` is (key, raw_text_so_far) while a
+    top-level string value is being written.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None):
+        self.max_tokens = max_tokens
+        self.tokens = 0
+        self.complete = False
+
+        self._buffer = ""
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+        # Top-level member tracking (depth 1 of the object)
+        self._expect = "key"      # key -> colon -> value -> key ...
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._await_value_char = False
+        self._members: List[Tuple[str, str]] = []
+        self._value_starts: List[Tuple[str, str]] = []
+
+        # Elements of a top-level array value, and a top-level string value
+        self._array_key: Optional[str] = None
+        self._item_start: Optional[int] = None
+        self._item_index = 0
+        self._items: List[Tuple[str, int, str]] = []
+        self._string_key: Optional[str] = None
+        self._string_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> bool:
+        if self.complete:
+            return True
+
+        self.tokens += 1
+        offset = len(self._buffer)
+        self._buffer += chunk
+
+        for i, ch in enumerate(chunk):
+            pos = offset + i
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._string_key = None
+                    if self._depth == 1 and self._expect == "key" and self._key_start is not None:
+                        self._key = self._decode_key(self._buffer[self._key_start:pos + 1])
+                        self._key_start = None
+                        self._expect = "colon"
+                continue
+
+            if self._start is None:
+                if ch == "{" and not self._in_reasoning(pos):
+                    self._start = pos
+                    self._depth = 1
+                continue
+
+            if self._await_value_char and not ch.isspace():
+                self._await_value_char = False
+                self._value_starts.append((self._key, ch))
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect == "key":
+                    self._key_start = pos
+                elif self._depth == 1 and self._expect == "value":
+                    self._string_key = self._key
+                    self._string_start = pos + 1
+            elif ch == ":" and self._depth == 1 and self._expect == "colon":
+                self._expect = "value"
+                self._value_start = pos + 1
+                self._await_value_char = True
+            elif ch == "," and self._depth == 1 and self._expect == "value":
+                self._close_member(pos)
+            elif ch == "," and self._depth == 2 and self._array_key is not None:
+                self._close_item(pos)
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._expect == "value":
+                    self._array_key = self._key
+                    self._item_start = pos + 1
+                    self._item_index = 0
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._array_key is not None:
+                    self._close_item(pos)
+                    self._array_key = None
+                if self._depth == 0:
+                    if self._expect == "value":
+                        self._close_member(pos)
+                    self._end = pos + 1
+                    self.complete = True
+                    return True
+
+        if self.max_tokens is not None and self.tokens >= self.max_tokens:
+            raise TokenLimitExceeded(f"max_tokens={self.max_tokens} reached before the JSON object closed")
+        return False
+
+    def _in_reasoning(self, pos: int) -> bool:
+        return self._buffer.rfind("<think>", 0, pos) > self._buffer.rfind("</think>", 0, pos)
+
+    def _close_member(self, end: int) -> None:
+        if self._key is not None and self._value_start is not None:
+            self._members.append((self._key, self._buffer[self._value_start:end].strip()))
+        self._key = None
+        self._value_start = None
+        self._expect = "key"
+
+    def _close_item(self, end: int) -> None:
+        raw = self._buffer[self._item_start:end].strip()
+        if raw:
+            self._items.append((self._array_key, self._item_index, raw))
+            self._item_index += 1
+        self._item_start = end + 1
+
+    @staticmethod
+    def _decode_key(quoted: str) -> str:
+        try:
+            return json.loads(quoted)
+        except json.JSONDecodeError:
+            return quoted[1:-1]
+
+    def pop_members(self) -> List[Tuple[str, str]]:
+        members, self._members = self._members, []
+        return members
+
+    def pop_value_starts(self) -> List[Tuple[str, str]]:
+        starts, self._value_starts = self._value_starts, []
+        return starts
+
+    def pop_items(self) -> List[Tuple[str, int, str]]:
+        items, self._items = self._items, []
+        return items
+
+    def open_string(self) -> Optional[Tuple[str, str]]:
+        """(key, raw text so far) of the top-level string value being written, or None."""
+        if self._string_key is None or not self._in_string:
+            return None
+        return self._string_key, self._buffer[self._string_start:]
+
+    @property
+    def started(self) -> bool:
+        return self._start is not None
+
+    def preamble(self) -> str:
+        """Text received before the object started (or everything, if it has not), reasoning blocks removed."""
+        return strip_reasoning(self._buffer if self._start is None else self._buffer[:self._start])
+
+    def text(self) -> str:
+        """Everything received so far."""
+        return self._buffer
+
+    def object_text(self) -> Optional[str]:
+        """The first complete top-level object, or None."""
+        if not self.complete:
+            return None
+        return self._buffer[self._start:self._end]
+
+    def tail_length(self) -> int:
+        """Characters received after the object closed (within the last chunk)."""
+        if not self.complete:
+            return 0
+        return len(self._buffer) - self._end
+
+
+def parse_member(raw_value: str) -> Tuple[bool, Any]:
+    """Decodes a raw member value. Returns (ok, value)."""
+    try:
+        return True, json.loads(raw_value)
+    except json.JSONDecodeError:
+        return False, None
+
+
+_LENIENT = json.JSONDecoder(strict=False)
+
+
+def decode_partial_string(raw: str) -> str:
+    """
+    Decodes the body of an unterminated JSON string as far as it is
+    complete: an escape sequence cut by the chunk boundary is left for
+    later. Falls back to the raw text when the escapes are invalid.
+    """
+    for cut in range(len(raw), max(-1, len(raw) - 7), -1):
+        try:
+            return _LENIENT.decode('"' + raw[:cut] + '"')
+        except json.JSONDecodeError:
+            continue
+    return raw[:raw.rfind("\\")] if "\\" in raw else raw
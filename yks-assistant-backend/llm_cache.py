@@ -0,0 +1,191 @@
+"""
+Content-addressed cache for validated LLM contract outputs.
+
+Key: sha256 over (routes/models, prompt, image hash, temperature, output
+model). Two tiers:
+- memory: OrderedDict LRU with a TTL, checked first
+- disk: SQLite table under data/, survives restarts; hits are promoted.
+  Writes purge expired rows and cap the table at LLM_CACHE_DISK_MAX_ROWS
+  (oldest first), at most once per LLM_CACHE_PURGE_INTERVAL_SECONDS
+
+Entries store the validated object's JSON plus the latency of the call that
+produced it, so a hit can report the time it saved.
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+import metrics
+from config import (LLM_CACHE_MEMORY_ITEMS, LLM_CACHE_TTL_SECONDS, LLM_CACHE_DB_PATH, LLM_CACHE_DISK_MAX_ROWS,
+                    LLM_CACHE_PURGE_INTERVAL_SECONDS)
+
+
+def cache_key(routes: List[Dict[str, Any]], prompt: str, image_b64: Optional[str], temperature: float, output_model: Type[BaseModel]) -> str:
+    image_hash = hashlib.sha256(image_b64.encode("ascii")).hexdigest() if image_b64 else None
+    models = [f"{route['provider']}:{route.get('model') or ''}" for route in routes]
+    material = json.dumps([models, prompt, image_hash, temperature, output_model.__name__], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, db_path: str = LLM_CACHE_DB_PATH, max_items: int = LLM_CACHE_MEMORY_ITEMS, ttl: float = LLM_CACHE_TTL_SECONDS,
+                 max_rows: int = LLM_CACHE_DISK_MAX_ROWS, purge_interval: float = LLM_CACHE_PURGE_INTERVAL_SECONDS):
+        self.db_path = db_path
+        self.max_items = max_items
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.purge_interval = purge_interval
+        self._purged_at = 0.0
+        self._memory: "OrderedDict[str, Tuple[float, str, float]]" = OrderedDict()  # key -> (expires_at, payload, latency_ms)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+    # --- disk tier (runs in worker threads) ---------------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, output_model TEXT, payload TEXT,"
+                " latency_ms REAL, created_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache(created_at)")
+        return self._conn
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, str, float]]:
+        with self._db_lock:
+            row = self._db().execute(
+                "SELECT payload, latency_ms, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            payload, latency_ms, created_at = row
+            if created_at + self.ttl < time.time():
+                self._db().execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._db().commit()
+                return None
+            return created_at + self.ttl, payload, latency_ms
+
+    def _disk_put(self, key: str, output_model: str, payload: str, latency_ms: float) -> None:
+        now = time.time()
+        with self._db_lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO llm_cache (key, output_model, payload, latency_ms, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, output_model, payload, latency_ms, now)
+            )
+            if now - self._purged_at >= self.purge_interval:
+                self._purged_at = now
+                self._purge(now)
+            self._db().commit()
+
+    def _purge(self, now: float) -> None:
+        """Deletes expired rows, then the oldest rows beyond max_rows (caller holds the lock)."""
+        db = self._db()
+        expired = db.execute("DELETE FROM llm_cache WHERE created_at + ? < ?", (self.ttl, now)).rowcount
+        excess = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_rows
+        evicted = 0
+        if excess > 0:
+            evicted = db.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY created_at LIMIT ?)", (excess,)
+            ).rowcount
+        if expired or evicted:
+            metrics.incr("llm_cache.disk_expired", expired)
+            metrics.incr("llm_cache.disk_evicted", evicted)
+            print(f"[CACHE] disk purge expired={expired} evicted={evicted}")
+
+    def _disk_delete(self, key: str) -> None:
+        with self._db_lock:
+            self._db().execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._db().commit()
+
+    # --- memory tier ----------------------------------------------------------
+
+    def _remember(self, key: str, entry: Tuple[float, str, float]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    # --- public API -----------------------------------------------------------
+
+    async def get(self, key: str, output_model: Type[BaseModel], pipeline: str) -> Optional[BaseModel]:
+        """Returns the cached, re-validated object or None (and records hit/miss)."""
+        started_at = time.perf_counter()
+        tier = "memory"
+        entry = self._memory.get(key)
+        if entry is not None and entry[0] < time.time():
+            del self._memory[key]
+            entry = None
+        if entry is None:
+            tier = "disk"
+            try:
+                entry = await asyncio.to_thread(self._disk_get, key)
+            except sqlite3.Error as e:
+                print(f"[CACHE] disk read failed: {e}")
+                entry = None
+            if entry is not None:
+                self._remember(key, entry)
+        else:
+            self._memory.move_to_end(key)
+
+        if entry is None:
+            metrics.incr(f"llm_cache.{pipeline}.miss")
+            return None
+
+        _, payload, latency_ms = entry
+        try:
+            value = output_model.model_validate_json(payload)
+        except ValidationError:
+            # Contract changed since the entry was written
+            self._memory.pop(key, None)
+            await asyncio.to_thread(self._disk_delete, key)
+            metrics.incr(f"llm_cache.{pipeline}.miss")
+            return None
+
+        lookup_ms = (time.perf_counter() - started_at) * 1000
+        metrics.incr(f"llm_cache.{pipeline}.hit")
+        metrics.incr(f"llm_cache.{pipeline}.hit_{tier}")
+        metrics.incr(f"llm_cache.{pipeline}.latency_saved_ms", max(0.0, latency_ms - lookup_ms))
+        return value
+
+    async def put(self, key: str, value: BaseModel, latency_ms: float) -> None:
+        payload = value.model_dump_json(by_alias=True)
+        self._remember(key, (time.time() + self.ttl, payload, latency_ms))
+        try:
+            await asyncio.to_thread(self._disk_put, key, type(value).__name__, payload, latency_ms)
+        except sqlite3.Error as e:
+            print(f"[CACHE] disk write failed: {e}")
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+llm_cache = LLMCache()
+
+
+def hit_ratios() -> Dict[str, float]:
+    """Per-pipeline hit ratio derived from the metrics counters."""
+    counters = metrics.snapshot()
+    pipelines = {
+        name.split(".")[1] for name in counters
+        if name.startswith("llm_cache.") and name.endswith((".hit", ".miss"))
+    }
+    ratios = {}
+    for pipeline in sorted(pipelines):
+        hits = counters.get(f"llm_cache.{pipeline}.hit", 0)
+        misses = counters.get(f"llm_cache.{pipeline}.miss", 0)
+        ratios[pipeline] = round(hits / (hits + misses), 4)
+    return ratios
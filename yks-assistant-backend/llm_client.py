@@ -1,19 +1,224 @@
-import requests
+import httpx
 import json
-import os
-from together import Together
-from config import MODEL_ID, TOGETHER_MODEL_ID
+import ssl
+import time
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, Optional, Tuple
+from config import (
+    MODEL_ID, TOGETHER_MODEL_ID, FIREWORKS_BASE_URL, TOGETHER_BASE_URL,
+    LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT,
+    LLM_HTTP2, LLM_POOL_MAX_CONNECTIONS, LLM_POOL_MAX_KEEPALIVE, LLM_POOL_KEEPALIVE_EXPIRY,
+    DEFAULT_API_KEY, SOLVE_API_KEY, GENERATE_API_KEY, COACH_API_KEY, EVALUATE_API_KEY,
+    MEASURE_API_KEY, EXTRACT_API_KEY, TOGETHER_API_KEY
+)
+
+from rate_limiter import get_limiter, estimate_tokens
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 support in httpx)
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
 
 class LLMClientError(Exception):
     pass
 
 
+class RateLimitError(LLMClientError):
+    """Provider answered 429. Not a contract failure; retry after backing off."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Building an SSL context loads the CA bundle (~60ms of blocking CPU), so it is
+# created once per process instead of once per request.
+_SSL_CONTEXT = ssl.create_default_context()
+
+
+def _new_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        verify=_SSL_CONTEXT,
+        http2=LLM_HTTP2 and _HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY
+        )
+    )
+
+
+class ClientRegistry:
+    """
+    Process-wide registry of pooled keep-alive clients.
+    One HTTP client per (provider, api_key), so back-to-back calls reuse
+    warm TCP/TLS connections instead of paying setup on every request.
+    """
+
+    def __init__(self):
+        self._http: Dict[Tuple[str, str], httpx.AsyncClient] = {}
+
+    def http_client(self, provider: str, api_key: str) -> httpx.AsyncClient:
+        key = (provider, api_key)
+        client = self._http.get(key)
+        if client is None or client.is_closed:
+            client = _new_http_client()
+            self._http[key] = client
+        return client
+
+    def open(self) -> None:
+        """Pre-creates clients for every configured key."""
+        fireworks_keys = {
+            DEFAULT_API_KEY, SOLVE_API_KEY, GENERATE_API_KEY, COACH_API_KEY,
+            EVALUATE_API_KEY, MEASURE_API_KEY, EXTRACT_API_KEY
+        }
+        for api_key in filter(None, fireworks_keys):
+            self.http_client("fireworks", api_key)
+        if TOGETHER_API_KEY:
+            self.http_client("together", TOGETHER_API_KEY)
+
+    async def aclose(self) -> None:
+        clients = list(self._http.values())
+        self._http.clear()
+        for client in clients:
+            await client.aclose()
+
+
+clients = ClientRegistry()
+
+
+async def startup_clients() -> None:
+    clients.open()
+    print(f"[LLM] Client pool ready (http2={LLM_HTTP2 and _HTTP2_AVAILABLE}, max_connections={LLM_POOL_MAX_CONNECTIONS}, keepalive_expiry={LLM_POOL_KEEPALIVE_EXPIRY}s)")
+
+
+async def shutdown_clients() -> None:
+    await clients.aclose()
+    print("[LLM] Client pool closed")
+
+
+async def iter_sse_data(lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Minimal Server-Sent Events parser.
+    Consumes decoded lines and yields the `data` payload of each event.
+    Stops at the OpenAI-style `[DONE]` sentinel.
+    """
+    data_lines = []
+    async for line in lines:
+        if not line:
+            # Blank line terminates an event
+            if data_lines:
+                payload = "\n".join(data_lines)
+                data_lines = []
+                if payload == "[DONE]":
+                    # Drain the (empty) remainder so a pooled connection can be reused
+                    async for _ in lines:
+                        pass
+                    return
+                yield payload
+            continue
+
+        if line.startswith(":"):
+            continue  # comment / keep-alive ping
+
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "data":
+            data_lines.append(value)
+
+    # Stream closed without a trailing blank line
+    if data_lines:
+        payload = "\n".join(data_lines)
+        if payload != "[DONE]":
+            yield payload
+
+
+def _delta_content(data_str: str) -> Optional[str]:
+    """Extracts choices[0].delta.content from a chat.completion.chunk payload."""
+    try:
+        data_json = json.loads(data_str)
+    except json.JSONDecodeError:
+        return None
+
+    choices = data_json.get("choices") or []
+    if choices:
+        delta = choices[0].get("delta") or {}
+        return delta.get("content") or None
+    return None
+
 
-def call_llm(prompt: str, api_key: str, image_b64: str = None, image_mime_type: str = "image/jpeg", max_tokens: int = 2000, temperature: float = 0.6, model: str = MODEL_ID):
+async def _stream_chat_completion(provider: str, label: str, url: str, api_key: str, payload: dict, estimated_tokens: int) -> AsyncIterator[str]:
+    """
+    POSTs a streaming chat.completions request on the pooled client for
+    (provider, api_key) and yields the content deltas.
+    Admission goes through the provider's limiter; 429s raise RateLimitError.
+    A call whose response was accepted counts as a success for the limiter
+    even when the caller closes the stream early (contract complete).
+    """
+    headers = {
+        "Accept": "text/event-stream",
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+
+    client = clients.http_client(provider, api_key)
+    limiter = get_limiter(provider, api_key)
+    async with limiter.slot(estimated_tokens):
+        output_chunks = 0
+        accepted = False
+        try:
+            async with client.stream("POST", url, headers=headers, content=json.dumps(payload)) as response:
+                if response.status_code == 429:
+                    retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                    limiter.on_rate_limited(retry_after)
+                    raise RateLimitError(f"{label} API rate limited (HTTP 429)", retry_after=retry_after)
+
+                if response.is_error:
+                    # Read error body if possible
+                    error_body = (await response.aread()).decode("utf-8", errors="replace")
+                    print(f"[DEBUG API ERROR] {error_body}")
+                    raise LLMClientError(f"{label} API Request failed: HTTP {response.status_code}\nResponse: {error_body}")
+
+                accepted = True
+                async for data_str in iter_sse_data(response.aiter_lines()):
+                    content_chunk = _delta_content(data_str)
+                    if content_chunk:
+                        output_chunks += 1
+                        yield content_chunk
+
+        except httpx.HTTPError as e:
+            accepted = False
+            raise LLMClientError(f"{label} API Connection failed: {e}")
+        finally:
+            # Also runs on GeneratorExit when the guard stops reading early
+            if accepted:
+                limiter.on_success()
+            # One streamed delta is roughly one token
+            limiter.charge_tokens(output_chunks)
+
+
+async def call_llm(prompt: str, api_key: str, image_b64: str = None, image_mime_type: str = "image/jpeg", max_tokens: int = 2000, temperature: float = 0.6, model: str = MODEL_ID):
     """
     Calls Fireworks AI API (Qwen3-VL) with streaming support.
-    Yields chunks of text as they arrive.
-    Enforces a strict limit locally.
+    Async generator: yields chunks of text as they arrive without blocking the event loop.
+    max_tokens is sent to the provider; run_with_contract_guard also enforces it locally.
     """
     if not api_key:
         raise LLMClientError("API Key is missing.")
@@ -22,17 +227,17 @@ def call_llm(prompt: str, api_key: str, image_b64: str = None, image_mime_type:
     print(f"[Fireworks] Request being sent to {model} (STREAMING)...")
 
 
-    url = "https://api.fireworks.ai/inference/v1/chat/completions"
-    
+    url = f"{FIREWORKS_BASE_URL}/chat/completions"
+
     # Construct content payload
     content = []
-    
+
 
     content.append({
         "type": "text",
         "text": prompt
     })
-    
+
 
     if image_b64:
         content.append({
@@ -41,7 +246,7 @@ def call_llm(prompt: str, api_key: str, image_b64: str = None, image_mime_type:
                 "url": f"data:{image_mime_type};base64,{image_b64}"
             }
         })
-    
+
     payload = {
         "model": model,
         "max_tokens": max_tokens,
@@ -58,50 +263,16 @@ def call_llm(prompt: str, api_key: str, image_b64: str = None, image_mime_type:
             }
         ]
     }
-    headers = {
-        "Accept": "text/event-stream",
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
 
+    estimated_tokens = estimate_tokens(prompt, has_image=bool(image_b64))
+    async for content_chunk in _stream_chat_completion("fireworks", "Fireworks", url, api_key, payload, estimated_tokens):
+        yield content_chunk
 
-    try:
-        with requests.post(url, headers=headers, data=json.dumps(payload), stream=True) as response:
-            try:
-                response.raise_for_status()
-            except requests.RequestException as e:
-                # Read error body if possible
-                error_body = response.text
-                print(f"[DEBUG API ERROR] {error_body}")
-                raise LLMClientError(f"Fireworks API Request failed: {e}\nResponse: {error_body}")
-
-
-            for line in response.iter_lines():
-                if line:
-                    line_decoded = line.decode("utf-8")
-                    if line_decoded.startswith("data: "):
-                        data_str = line_decoded[6:]
-                        if data_str == "[DONE]":
-                            break
-                        try:
-                            data_json = json.loads(data_str)
-
-                            if "choices" in data_json and len(data_json["choices"]) > 0:
-                                delta = data_json["choices"][0].get("delta", {})
-                                content_chunk = delta.get("content", "")
-                                if content_chunk:
-                                    yield content_chunk
-                        except json.JSONDecodeError:
-                            continue
-                            
-    except requests.RequestException as e:
-         raise LLMClientError(f"Fireworks API Connection failed: {e}")
-
-
-def call_together(prompt: str, api_key: str, model: str = TOGETHER_MODEL_ID, max_tokens: int = 2000, temperature: float = 0.6):
+
+async def call_together(prompt: str, api_key: str, model: str = TOGETHER_MODEL_ID, max_tokens: int = 2000, temperature: float = 0.6):
     """
-    Calls Together AI API using the SDK.
-    Yields chunks of text (streaming).
+    Calls Together AI's OpenAI-compatible endpoint on the pooled client.
+    Async generator: yields chunks of text (streaming).
     """
     if not api_key:
         raise LLMClientError("Together API Key is missing.")
@@ -110,22 +281,29 @@ def call_together(prompt: str, api_key: str, model: str = TOGETHER_MODEL_ID, max
     print(f"[Together] Request being sent to {model} (STREAMING)...")
 
 
-    client = Together(api_key=api_key)
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=max_tokens,
-            temperature=temperature,
-            stream=True
-        )
+    payload = {
+        "model": model,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": True,
+        "messages": [{"role": "user", "content": prompt}]
+    }
+
+    url = f"{TOGETHER_BASE_URL}/chat/completions"
+    async for content_chunk in _stream_chat_completion("together", "Together AI", url, api_key, payload, estimate_tokens(prompt)):
+        yield content_chunk
+
+
+def call_route(route: dict, prompt: str, image_b64: str = None, image_mime_type: str = "image/jpeg", max_tokens: int = 2000, temperature: float = 0.6):
+    """
+    Dispatches to the provider named in `route` ({"provider", "api_key", "model"}).
+    Returns the provider's async chunk generator.
+    """
+    model_kwargs = {"model": route["model"]} if route.get("model") else {}
 
-        for chunk in response:
-            if hasattr(chunk.choices[0], 'delta') and hasattr(chunk.choices[0].delta, 'content'):
-                content = chunk.choices[0].delta.content
-                if content:
-                    yield content
-                    
-    except Exception as e:
-         raise LLMClientError(f"Together AI API Request failed: {e}")
+    if route["provider"] == "together":
+        if image_b64:
+            raise LLMClientError("Together route does not accept images.")
+        return call_together(prompt=prompt, api_key=route["api_key"], max_tokens=max_tokens, temperature=temperature, **model_kwargs)
 
+    return call_llm(prompt=prompt, api_key=route["api_key"], image_b64=image_b64, image_mime_type=image_mime_type, max_tokens=max_tokens, temperature=temperature, **model_kwargs)
@@ -5,6 +5,7 @@ Anchor Selector - Selects random anchor questions from DB based on topic.
 import sqlite3
 import json
 import os
+from functools import lru_cache
 from typing import Optional
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "questions.db")
@@ -64,6 +65,21 @@ def get_random_anchors(
     return anchors
 
 
+@lru_cache(maxsize=1)
+def known_topics() -> frozenset:
+    """
+    Topics that have anchor questions in the DB.
+    """
+    if not os.path.exists(DB_PATH):
+        return frozenset()
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        rows = conn.execute("SELECT DISTINCT topic FROM questions WHERE topic IS NOT NULL").fetchall()
+    finally:
+        conn.close()
+    return frozenset(topic for (topic,) in rows)
+
+
 def _get_similar_topics(topic: str) -> list[str]:
     """
     Get similar topics based on keyword matching.
@@ -0,0 +1,142 @@
+"""
+Answer Bank - Stored solutions for questions that are already in the bank.
+
+Students photograph published questions, many of which are in
+data/questions.db with a worked solution. After extraction, the question
+text plus its choices is looked up in a MinHash index over the bank
+(logic/minhash_index.py); a close enough match answers the request without
+calling the solver.
+
+A match is only used when it is unambiguous on the student's sheet: the
+extracted choices must be the stored ones (in any order), the question must
+contain the same numbers, and the stored correct answer must be exactly one
+of the choices. A reprint with shuffled choices still gets the right letter;
+the same template with different numbers falls through to the solver.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import metrics
+from config import ANSWER_BANK_DB_PATH, ANSWER_BANK_ENABLED, ANSWER_BANK_MIN_SCORE
+from logic.minhash_index import MinHashIndex, normalize_text
+from schemas_contracts.models import ExtractV1, SolveV1
+
+LETTERS = ("A", "B", "C", "D", "E")
+
+_NUMBER = re.compile(r"\d+")
+
+
+def choice_values(raw: Union[str, List[str], None]) -> Dict[str, str]:
+    """'["A) 5", "B) 7", ...]' (or the parsed list) -> {"A": "5", "B": "7", ...}"""
+    try:
+        choices = json.loads(raw) if isinstance(raw, str) else raw or []
+    except ValueError:
+        return {}
+    values = {}
+    for choice in choices if isinstance(choices, list) else []:
+        letter, sep, value = str(choice).partition(")")
+        if sep and letter.strip() in LETTERS:
+            values[letter.strip()] = value.strip()
+    return values
+
+
+def question_key(question_text: str, choices: List[str]) -> str:
+    """Text indexed for a question: the stem followed by its choice values (sorted, so order does not matter)."""
+    return " ".join([question_text, *sorted(choices)])
+
+
+def _choice_set(choices: List[str]) -> frozenset:
+    return frozenset(normalize_text(choice) for choice in choices)
+
+
+def question_numbers(question_text: str) -> Tuple[str, ...]:
+    return tuple(sorted(_NUMBER.findall(question_text)))
+
+
+class AnswerBank:
+    """
+    question text + choices -> stored solution.
+    Values are (question id, solution steps, correct choice text, normalized
+    choice set, numbers in the question).
+    """
+
+    def __init__(self, min_score: float = ANSWER_BANK_MIN_SCORE):
+        self.min_score = min_score
+        self._index = MinHashIndex()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def add(self, question_id: str, question_text: str, choices: List[str], steps: List[str], answer: str) -> None:
+        self._index.add(question_id, question_key(question_text, choices), (question_id, steps, answer, _choice_set(choices), question_numbers(question_text)))
+
+    def load(self, db_path: str = ANSWER_BANK_DB_PATH) -> int:
+        """Index every bank question with a usable solution; returns the count."""
+        if not os.path.exists(db_path):
+            print(f"[WARN] answer bank not found: {db_path}")
+            return 0
+        t0 = time.perf_counter()
+        conn = sqlite3.connect(db_path)
+        try:
+            rows = conn.execute(
+                "SELECT id, problem_text, choices, answer_key, final_answer, solution_steps FROM questions"
+            ).fetchall()
+        finally:
+            conn.close()
+
+        for question_id, problem_text, raw_choices, answer_key, final_answer, raw_steps in rows:
+            choices = choice_values(raw_choices)
+            # answer_key is the letter; final_answer is usually the choice text,
+            # sometimes just the letter
+            letter = (answer_key or "").strip()
+            if letter not in choices and (final_answer or "").strip() in choices:
+                letter = final_answer.strip()
+            answer = choices.get(letter) or (final_answer or "").strip()
+            try:
+                steps = [str(step) for step in json.loads(raw_steps or "[]")]
+            except ValueError:
+                steps = []
+            if problem_text and answer and steps:
+                self.add(question_id, problem_text, list(choices.values()), steps, answer)
+
+        print(f"[ANSWER_BANK] loaded={len(self)} rows={len(rows)} latency={(time.perf_counter() - t0) * 1000:.0f}ms")
+        return len(self)
+
+    def match(self, extract_data: ExtractV1, request_id: str = "-") -> Optional[Tuple[SolveV1, Dict[str, Any]]]:
+        """
+        (SolveV1, {"id", "score"}) for a bank question matching the
+        extraction, or None. confidence is the match score.
+        """
+        if not ANSWER_BANK_ENABLED or not len(self):
+            return None
+        t0 = time.perf_counter()
+        choices = {letter: value for letter, value in extract_data.choices.items() if value}
+        found = self._index.query(question_key(extract_data.question_text, list(choices.values())), self.min_score)
+
+        result, outcome = None, "miss"
+        extracted = _choice_set(list(choices.values()))
+        numbers = question_numbers(extract_data.question_text)
+        for score, _, (question_id, steps, answer, stored, stored_numbers) in found:
+            target = normalize_text(answer)
+            letters = [letter for letter, value in choices.items() if normalize_text(value) == target]
+            # Bank rows without stored choices only need the answer among the extracted ones
+            if (stored and stored != extracted) or numbers != stored_numbers or len(letters) != 1:
+                outcome = f"rejected id={question_id} score={score:.2f}"
+                continue
+            solution = SolveV1(steps=steps, final_answer=letters[0], confidence=round(score, 2))
+            result, outcome = (solution, {"id": question_id, "score": round(score, 3)}), f"hit id={question_id} score={score:.2f}"
+            break
+
+        latency = (time.perf_counter() - t0) * 1000
+        metrics.incr("answer_bank.hit" if result else "answer_bank.miss")
+        metrics.incr("answer_bank.ms_total", latency)
+        print(f"[ANSWER_BANK] req_id={request_id} {outcome} latency={latency:.2f}ms")
+        return result
+
+
+answer_bank = AnswerBank()
@@ -0,0 +1,97 @@
+"""
+Copy Guard - Catches generated questions that copy a bank question.
+
+The generator is shown anchor questions from data/questions.db and told not
+to copy them, but sometimes does. A copy would still pass validation (the
+solver agrees with a bank answer) and then ship a published question as a
+new one. Before validation, a generated question's text plus its choices is
+compared with:
+- the anchors it was generated from (exact Jaccard, only a few texts)
+- the whole bank, through a MinHash index built at startup
+  (logic/minhash_index.py)
+
+The comparison key is the same as the answer bank's (logic/answer_bank.py),
+so a copy with shuffled choices still matches. Like the answer bank, a match
+also needs the same numbers in the question: short stems sharing boilerplate
+("... denkleminin çözüm kümesi aşağıdakilerden hangisidir?") are similar as
+text, and the anchor's template with new numbers is a new question.
+"""
+
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from config import ANSWER_BANK_DB_PATH, COPY_GUARD_ENABLED, COPY_GUARD_MIN_SCORE
+from logic.answer_bank import choice_values, question_key, question_numbers
+from logic.minhash_index import MinHashIndex, jaccard, normalize_text, shingles
+
+
+def _shingles(question_text: str, choices: List[str]):
+    return shingles(normalize_text(question_key(question_text, choices)))
+
+
+class CopyGuard:
+    """question text + choices -> id of the bank question it copies, if any."""
+
+    def __init__(self, min_score: float = COPY_GUARD_MIN_SCORE):
+        self.min_score = min_score
+        self._index = MinHashIndex()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def add(self, question_id: str, question_text: str, choices: List[str]) -> None:
+        self._index.add(question_id, question_key(question_text, choices), question_numbers(question_text))
+
+    def load(self, db_path: str = ANSWER_BANK_DB_PATH) -> int:
+        """Index every bank question; returns the count."""
+        if not os.path.exists(db_path):
+            print(f"[WARN] copy guard bank not found: {db_path}")
+            return 0
+        t0 = time.perf_counter()
+        conn = sqlite3.connect(db_path)
+        try:
+            rows = conn.execute("SELECT id, problem_text, choices FROM questions").fetchall()
+        finally:
+            conn.close()
+        for question_id, problem_text, raw_choices in rows:
+            if problem_text:
+                self.add(question_id, problem_text, list(choice_values(raw_choices).values()))
+        print(f"[COPY_GUARD] loaded={len(self)} rows={len(rows)} latency={(time.perf_counter() - t0) * 1000:.0f}ms")
+        return len(self)
+
+    def check(self, question_text: str, choices: Dict[str, str], anchors: List[dict] = ()) -> Optional[Tuple[float, str]]:
+        """
+        (score, copied question id) for the closest anchor or bank question
+        with the same numbers and at least min_score similar, or None.
+        `anchors` are get_random_anchors rows.
+        """
+        if not COPY_GUARD_ENABLED:
+            return None
+        t0 = time.perf_counter()
+        values = [value for value in choices.values() if value]
+        numbers = question_numbers(question_text)
+        hashes = _shingles(question_text, values)
+
+        found = None
+        for anchor in anchors:
+            anchor_text = anchor.get("problem_text") or ""
+            if question_numbers(anchor_text) != numbers:
+                continue
+            score = jaccard(hashes, _shingles(anchor_text, list(choice_values(anchor.get("choices")).values())))
+            if score >= self.min_score and (found is None or score > found[0]):
+                found = (score, anchor.get("id"))
+        if found is None:
+            for score, question_id, stored_numbers in self._index.query(question_key(question_text, values), self.min_score):
+                if stored_numbers == numbers:
+                    found = (score, question_id)
+                    break
+
+        metrics.incr("copy_guard.copies" if found else "copy_guard.clean")
+        metrics.incr("copy_guard.ms_total", (time.perf_counter() - t0) * 1000)
+        return found
+
+
+copy_guard = CopyGuard()
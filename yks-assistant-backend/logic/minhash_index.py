@@ -0,0 +1,118 @@
+"""
+MinHash Index - Near-duplicate lookup for question texts.
+
+Texts are normalized (case, punctuation, whitespace) and cut into
+overlapping character shingles. A MinHash signature of NUM_PERM values
+estimates the Jaccard similarity of two shingle sets; locality-sensitive
+hashing splits the signature into BANDS bands of ROWS values, and two texts
+become candidates when any band matches exactly. With 16 x 4, pairs above
+~0.5 similarity almost always collide while unrelated texts almost never do,
+so a lookup touches a handful of candidates however large the index is.
+Candidates are ranked by how many bands they share and the best few are scored
+exactly on their shingle sets (rebuilt from the stored normalized text, so
+memory stays at one string + band keys per entry).
+"""
+
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes; a < 2^31
+# keeps a * x + b inside uint64
+_PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(20240611)
+_A = _rng.integers(1, 2 ** 31, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+
+# Shingle hash: polynomial over the code points, mod 2^32 (code points < 2^21,
+# so every product and the sum fit in uint64)
+_SHINGLE_WEIGHTS = np.array([pow(0x01000193, k, 2 ** 32) for k in reversed(range(SHINGLE_SIZE))], dtype=np.uint64)
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_text(text: str) -> str:
+    """Case-folded words separated by single spaces (Turkish dotted I kept as i)."""
+    return _NON_WORD.sub(" ", text.replace("İ", "i").replace("I", "ı").casefold()).strip()
+
+
+def shingles(normalized: str) -> np.ndarray:
+    """Sorted unique 32-bit hashes of the character shingles of a normalized text."""
+    if not normalized:
+        return np.empty(0, dtype=np.uint64)
+    codes = np.frombuffer(normalized.ljust(SHINGLE_SIZE).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    count = len(codes) - SHINGLE_SIZE + 1
+    hashes = codes[:count] * _SHINGLE_WEIGHTS[0]
+    for k in range(1, SHINGLE_SIZE):
+        hashes += codes[k:k + count] * _SHINGLE_WEIGHTS[k]
+    return np.unique(hashes & np.uint64(0xFFFFFFFF))
+
+
+def signature(hashes: np.ndarray) -> np.ndarray:
+    return ((hashes[:, None] * _A + _B) % _PRIME).min(axis=0)
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    if not a.size or not b.size:
+        return 0.0
+    shared = np.intersect1d(a, b, assume_unique=True).size
+    return shared / (a.size + b.size - shared)
+
+
+class MinHashIndex:
+    """
+    LSH index over texts: add(key, text, value), then query(text) for the
+    stored entries most similar to it.
+    """
+
+    def __init__(self):
+        self._bands: List[Dict[bytes, List[int]]] = [{} for _ in range(BANDS)]
+        self._keys: List[Any] = []
+        self._values: List[Any] = []
+        self._texts: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: Any, text: str, value: Any = None) -> None:
+        normalized = normalize_text(text)
+        hashes = shingles(normalized)
+        if not hashes.size:
+            return
+        doc = len(self._keys)
+        sig = signature(hashes).astype(np.uint32)
+        self._keys.append(key)
+        self._values.append(value)
+        self._texts.append(normalized)
+        for band in range(BANDS):
+            self._bands[band].setdefault(sig[band * ROWS:(band + 1) * ROWS].tobytes(), []).append(doc)
+
+    def query(self, text: str, min_score: float = 0.0, limit: int = 3) -> List[Tuple[float, Any, Any]]:
+        """(exact Jaccard, key, value) of the best LSH candidates, best first."""
+        hashes = shingles(normalize_text(text))
+        if not hashes.size:
+            return []
+        sig = signature(hashes).astype(np.uint32)
+        # Matching bands per candidate; more bands = higher estimated
+        # similarity, so only the front runners get exact scoring
+        band_hits: Counter = Counter()
+        for band in range(BANDS):
+            band_hits.update(self._bands[band].get(sig[band * ROWS:(band + 1) * ROWS].tobytes(), ()))
+        scored = []
+        for doc, _ in band_hits.most_common(limit):
+            score = jaccard(hashes, shingles(self._texts[doc]))
+            if score >= min_score:
+                scored.append((score, self._keys[doc], self._values[doc]))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:limit]
+
+    def best(self, text: str, min_score: float = 0.0) -> Optional[Tuple[float, Any, Any]]:
+        found = self.query(text, min_score, limit=1)
+        return found[0] if found else None
@@ -0,0 +1,368 @@
+"""
+Page Layout - NumPy analysis of photographed exam pages.
+
+Works on a downscaled grayscale copy of the photo:
+- ink mask: pixels clearly darker than the local background (handles shading
+  and a dark desk around the paper)
+- skew: the rotation that makes the row projection profile of the ink
+  sharpest (text lines collapse into narrow peaks)
+- content box: the span of rows / columns with ink, ignoring thin runs at
+  the border (paper edges, desk)
+- question boxes: a whole test page split into columns (empty vertical
+  gutter) and then into questions, at question-number anchors (lines that
+  hang left of the body text) or, without anchors, at large line gaps
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from config import CROP_PADDING, DESKEW_MAX_ANGLE, DESKEW_MIN_ANGLE
+
+ANALYSIS_EDGE = 800
+# Whole pages need more resolution: a text line must stay several pixels tall
+SEGMENT_ANALYSIS_EDGE = 1600
+_MAX_POINTS = 40_000
+# Min gray-level gap below the paper level for an area to count as desk
+_PAPER_CONTRAST = 80
+
+
+@dataclass
+class LayoutResult:
+    image: Image.Image
+    original_pixels: int
+    output_pixels: int
+    skew_degrees: float
+
+    @property
+    def pixel_reduction(self) -> float:
+        return 1 - self.output_pixels / self.original_pixels if self.original_pixels else 0.0
+
+
+def _window_count(mask: np.ndarray, size: int, axis: int) -> np.ndarray:
+    """Number of True values in a centred window of `size` along `axis`."""
+    before = size // 2
+    pad = [(0, 0), (0, 0)]
+    pad[axis] = (before + 1, size - 1 - before)
+    padded = np.pad(mask, pad, mode="edge")
+    padded[(slice(None),) * axis + (0,)] = False
+    sums = np.cumsum(padded, axis=axis, dtype=np.int32)
+    n = mask.shape[axis]
+    upper = sums[(slice(None),) * axis + (slice(size, size + n),)]
+    lower = sums[(slice(None),) * axis + (slice(0, n),)]
+    return upper - lower
+
+
+def _all_within(mask: np.ndarray, size: int, axis: int) -> np.ndarray:
+    return _window_count(mask, size, axis) == size
+
+
+def _any_within(mask: np.ndarray, size: int, axis: int) -> np.ndarray:
+    return _window_count(mask, size, axis) > 0
+
+
+def _wide_dark(dark: np.ndarray, size: int) -> np.ndarray:
+    """
+    Dark areas at least `size` px thick (desk, shadow), grown by `size` to
+    cover the blurred paper edge. Text strokes are thinner and drop out.
+    """
+    core = _all_within(_all_within(dark, size, 0), size, 1)
+    if not core.any():
+        return core
+    return _any_within(_any_within(core, size * 2 + 1, 0), size * 2 + 1, 1)
+
+
+def ink_mask(gray: Image.Image) -> np.ndarray:
+    """Boolean mask of ink pixels on the paper in a grayscale image."""
+    arr = np.asarray(gray, dtype=np.float32)
+    # Local background: heavy downscale + upscale is a cheap wide blur
+    small = gray.resize((max(1, gray.width // 24), max(1, gray.height // 24)), Image.Resampling.BOX)
+    background = np.asarray(small.resize(gray.size, Image.Resampling.BILINEAR).filter(ImageFilter.BoxBlur(2)), dtype=np.float32)
+    ink = arr < background * 0.75
+
+    # Only count ink on the paper
+    return ink & ~_desk(arr)
+
+
+def _edge_dark(dark: np.ndarray) -> np.ndarray:
+    """Dark runs starting at the image border: desk seen past the paper edge, however thin."""
+    runs = np.logical_and.accumulate(dark, axis=1)
+    runs |= np.logical_and.accumulate(dark[:, ::-1], axis=1)[:, ::-1]
+    runs |= np.logical_and.accumulate(dark, axis=0)
+    runs |= np.logical_and.accumulate(dark[::-1], axis=0)[::-1]
+    return runs
+
+
+def _desk(arr: np.ndarray) -> np.ndarray:
+    """
+    The desk around the paper: far darker than the paper and either much
+    thicker than a pen stroke or reaching the image border. Grown a little
+    to cover the blurred paper edge.
+    """
+    paper_level = float(np.percentile(arr, 90))
+    dark = arr < paper_level - _PAPER_CONTRAST
+    edge = _edge_dark(dark)
+    if edge.any():
+        edge = _any_within(_any_within(edge, 5, 0), 5, 1)
+    return _wide_dark(dark, max(5, max(arr.shape) // 80)) | edge
+
+
+def _paint_desk(image: Image.Image) -> Image.Image:
+    """
+    Paints the desk in paper colour, so rotating the crop leaves no dark
+    strip along the paper edge (it would look like a pen stroke).
+    """
+    gray, _ = _analysis_copy(image)
+    arr = np.asarray(gray, dtype=np.float32)
+    desk = _desk(arr)
+    if not desk.any():
+        return image
+    paper = np.asarray(image.convert("RGB").resize(gray.size, Image.Resampling.BOX))[arr >= np.percentile(arr, 90)]
+    mask = Image.fromarray(desk.astype(np.uint8) * 255).resize(image.size, Image.Resampling.BILINEAR).point(lambda v: 255 if v else 0)
+    image = image.copy()
+    image.paste(tuple(int(v) for v in np.median(paper, axis=0)), mask=mask)
+    return image
+
+
+def estimate_skew(mask: np.ndarray, max_angle: float = DESKEW_MAX_ANGLE) -> float:
+    """
+    Counter-clockwise tilt of the text lines in degrees (PIL convention),
+    searched in [-max_angle, max_angle]; rotate by -skew to level them.
+    """
+    ys, xs = np.nonzero(mask)
+    if len(ys) < 200:
+        return 0.0
+    if len(ys) > _MAX_POINTS:
+        pick = np.random.default_rng(0).choice(len(ys), _MAX_POINTS, replace=False)
+        ys, xs = ys[pick], xs[pick]
+    ys = ys.astype(np.float32)
+    xs = xs.astype(np.float32) - mask.shape[1] / 2
+    bins = mask.shape[0] + int(mask.shape[1] * np.sin(np.radians(max_angle))) * 2
+
+    left = xs < 0
+
+    def sharpness(angle: float) -> float:
+        theta = np.radians(angle)
+        projected = ys * np.cos(theta) + xs * np.sin(theta)
+        projected = (projected - projected.min()).astype(np.int32)
+        # Left and right halves separately: on two-column pages the columns'
+        # baselines do not line up and would blur a shared profile
+        score = 0.0
+        for half in (projected[left], projected[~left]):
+            hist = np.bincount(half, minlength=bins)
+            score += float(np.dot(hist, hist))
+        return score
+
+    # Coarse search, then refine around the best angle
+    angles = np.arange(-max_angle, max_angle + 1e-6, 0.5)
+    best = max(angles, key=sharpness)
+    fine = np.arange(best - 0.5, best + 0.5 + 1e-6, 0.1)
+    return float(max(fine, key=sharpness))
+
+
+def _active_span(profile: np.ndarray, threshold: float, edge_run: int) -> Optional[Tuple[int, int]]:
+    """First/last index above threshold, skipping thin runs that touch the border."""
+    active = profile > threshold
+    if not active.any():
+        return None
+    idx = np.nonzero(active)[0]
+    start, end = int(idx[0]), int(idx[-1])
+    # A short run starting at the very border is a paper / desk edge
+    if start == 0:
+        gap = np.nonzero(~active)[0]
+        run_end = int(gap[0]) if len(gap) else len(active)
+        if run_end <= edge_run and active[run_end:].any():
+            start = int(np.nonzero(active[run_end:])[0][0]) + run_end
+    if end == len(active) - 1:
+        gap = np.nonzero(~active[::-1])[0]
+        run_len = int(gap[0]) if len(gap) else len(active)
+        if run_len <= edge_run and active[:len(active) - run_len].any():
+            end = int(np.nonzero(active[:len(active) - run_len])[0][-1])
+    return start, end
+
+
+def content_box(mask: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """(left, top, right, bottom) of the inked area in mask coordinates."""
+    height, width = mask.shape
+    rows = _active_span(mask.sum(axis=1), max(2, width * 0.004), max(2, height // 50))
+    cols = _active_span(mask.sum(axis=0), max(2, height * 0.004), max(2, width // 50))
+    if rows is None or cols is None:
+        return None
+    return cols[0], rows[0], cols[1] + 1, rows[1] + 1
+
+
+def _analysis_copy(image: Image.Image) -> Tuple[Image.Image, float]:
+    scale = min(1.0, ANALYSIS_EDGE / max(image.size))
+    gray = image.convert("L")
+    if scale < 1.0:
+        gray = gray.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.Resampling.BOX)
+    return gray, scale
+
+
+def _crop_to_content(image: Image.Image, mask: np.ndarray, scale: float) -> Image.Image:
+    box = content_box(mask)
+    if box is None:
+        return image
+    left, top, right, bottom = (v / scale for v in box)
+    pad_x = (right - left) * CROP_PADDING + 8
+    pad_y = (bottom - top) * CROP_PADDING + 8
+    return image.crop((
+        max(0, int(left - pad_x)), max(0, int(top - pad_y)),
+        min(image.width, int(right + pad_x)), min(image.height, int(bottom + pad_y))
+    ))
+
+
+def crop_and_deskew(image: Image.Image) -> LayoutResult:
+    """
+    Crops the photo to its text region plus CROP_PADDING (fraction of the
+    content size) and rotates small skews out. The rotation is applied to the
+    first crop only, which is much cheaper than rotating the whole photo.
+    Returns the input unchanged when no content is found.
+    """
+    original_pixels = image.width * image.height
+    gray, scale = _analysis_copy(image)
+    mask = ink_mask(gray)
+    angle = estimate_skew(mask)
+
+    image = _crop_to_content(image, mask, scale)
+    if abs(angle) >= DESKEW_MIN_ANGLE:
+        image = _paint_desk(image)
+        fill = tuple(int(v) for v in np.median(np.asarray(image.convert("RGB"))[[0, -1]].reshape(-1, 3), axis=0))
+        image = image.rotate(-angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=fill)
+        gray, scale = _analysis_copy(image)
+        image = _crop_to_content(image, ink_mask(gray), scale)
+    else:
+        angle = 0.0
+
+    return LayoutResult(image, original_pixels, image.width * image.height, angle)
+
+
+def _runs(active: np.ndarray) -> List[Tuple[int, int]]:
+    """(start, end) of every run of True values; end is exclusive."""
+    padded = np.concatenate(([False], active, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return [(int(a), int(b)) for a, b in zip(edges[::2], edges[1::2])]
+
+
+def _columns(mask: np.ndarray, line_height: float) -> List[Tuple[int, int]]:
+    """
+    Splits at the widest empty vertical gutter in the middle half, if any.
+    A gutter is much wider than a word space.
+    """
+    height, width = mask.shape
+    active = mask.sum(axis=0) > max(1, height * 0.002)
+    if not active.any():
+        return []
+    idx = np.flatnonzero(active)
+    left, right = int(idx[0]), int(idx[-1]) + 1
+    gutters = [
+        (start, end) for start, end in _runs(~active[left:right])
+        if end - start >= max((right - left) * 0.03, line_height * 1.5)
+        and 0.25 <= (start + end) / 2 / (right - left) <= 0.75
+    ]
+    if not gutters:
+        return [(left, right)]
+    start, end = max(gutters, key=lambda run: run[1] - run[0])
+    return [(left, left + start), (left + end, right)]
+
+
+def _lines(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """Text lines (and figures) of one column as row spans, accents merged in."""
+    active = mask.sum(axis=1) > max(1, mask.shape[1] * 0.004)
+    lines = _runs(active)
+    if not lines:
+        return []
+    line_height = float(np.median([end - start for start, end in lines]))
+    merged = [lines[0]]
+    for start, end in lines[1:]:
+        # Dots and accents (i, ş, ğ) sit just above the line
+        if start - merged[-1][1] < line_height * 0.3 and min(end - start, merged[-1][1] - merged[-1][0]) < line_height * 0.5:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _question_blocks(mask: np.ndarray, lines: List[Tuple[int, int]]) -> List[List[Tuple[int, int]]]:
+    """
+    Groups the lines of a column into questions. Question numbers hang left
+    of the body text, so a line starting clearly left of the usual line start
+    opens a new question. Without such anchors, gaps much taller than the
+    usual line spacing separate questions.
+    """
+    if len(lines) < 2:
+        return [lines] if lines else []
+    line_height = float(np.median([end - start for start, end in lines]))
+    starts = np.array([int(np.flatnonzero(mask[top:bottom].any(axis=0))[0]) for top, bottom in lines])
+    body_start = float(np.median(starts))
+    # A number needs some ink in the margin; stray specks do not count
+    margin = max(1, int(body_start - line_height * 0.3))
+    anchors = [
+        i for i, (top, bottom) in enumerate(lines)
+        if starts[i] < body_start - line_height * 0.6 and mask[top:bottom, :margin].sum() >= line_height
+    ]
+
+    if anchors:
+        cuts = [i for i in anchors if i > 0]
+    else:
+        gaps = np.array([lines[i + 1][0] - lines[i][1] for i in range(len(lines) - 1)])
+        threshold = max(float(np.median(gaps)) * 2.5, line_height * 1.2)
+        cuts = [i + 1 for i, gap in enumerate(gaps) if gap > threshold]
+
+    blocks, previous = [], 0
+    for cut in cuts + [len(lines)]:
+        blocks.append(lines[previous:cut])
+        previous = cut
+    return blocks
+
+
+def question_boxes(image: Image.Image) -> List[Tuple[int, int, int, int]]:
+    """
+    (left, top, right, bottom) of every question on a levelled page, in
+    reading order: column by column, top to bottom.
+    """
+    scale = min(1.0, SEGMENT_ANALYSIS_EDGE / max(image.size))
+    gray = image.convert("L")
+    if scale < 1.0:
+        gray = gray.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.Resampling.BOX)
+    mask = ink_mask(gray)
+    page_lines = _lines(mask)
+    if not page_lines:
+        return []
+    line_height = float(np.median([end - start for start, end in page_lines]))
+    # Long vertical strokes (paper edge, table borders) would merge lines
+    # and shift where lines start
+    tall = max(int(line_height * 3), mask.shape[0] // 30)
+    strokes = _all_within(_any_within(mask, 3, 1), tall, 0)  # 3 px wide: tolerate slight tilt
+    mask &= ~_any_within(_any_within(strokes, tall, 0), 3, 1)
+
+    boxes = []
+    for col_left, col_right in _columns(mask, line_height):
+        column = mask[:, col_left:col_right]
+        lines = _lines(column)
+        if not lines:
+            continue
+        column_line_height = float(np.median([end - start for start, end in lines]))
+        pad = column_line_height * 0.5
+        for block in _question_blocks(column, lines):
+            top, bottom = block[0][0], block[-1][1]
+            if column[top:bottom].sum() < column_line_height ** 2:
+                continue  # specks, not a question
+            xs = np.flatnonzero(column[top:bottom].any(axis=0))
+            left, right = col_left + int(xs[0]), col_left + int(xs[-1]) + 1
+            boxes.append((
+                max(0, int((left - pad) / scale)), max(0, int((top - pad) / scale)),
+                min(image.width, int((right + pad) / scale)), min(image.height, int((bottom + pad) / scale))
+            ))
+    return boxes
+
+
+def split_page(image: Image.Image) -> Tuple[List[Image.Image], LayoutResult]:
+    """
+    Levels a photographed test page (crop_and_deskew) and cuts it into one
+    image per question, in page order.
+    """
+    layout = crop_and_deskew(image)
+    return [layout.image.crop(box) for box in question_boxes(layout.image)], layout
@@ -0,0 +1,135 @@
+"""
+Perceptual Hash Index - Near-duplicate lookup for uploaded question images.
+
+Students photograph the same published question, so extraction results are
+reused for images whose 64-bit dHash is within a small Hamming distance.
+
+Lookup uses multi-index hashing: the 64-bit hash is split into 4 bands of
+16 bits. If two hashes differ in at most d bits, at least one band differs
+in at most d // 4 bits (pigeonhole), so probing every band with all masks of
+up to d // 4 flipped bits finds every match without scanning the table.
+A finer 256-bit dHash is checked on the candidate to avoid confusing two
+different questions printed in the same layout.
+"""
+
+from collections import OrderedDict, defaultdict
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import metrics
+from config import PHASH_MAX_DISTANCE, PHASH_VERIFY_MAX_DISTANCE, PHASH_CACHE_MAX_ITEMS
+
+HASH_BITS = 64
+BANDS = 4
+BAND_BITS = HASH_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def _flip_masks(radius: int) -> List[int]:
+    """All BAND_BITS-wide masks with at most `radius` bits set."""
+    masks = [0]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(BAND_BITS), r):
+            mask = 0
+            for bit in bits:
+                mask |= 1 << bit
+            masks.append(mask)
+    return masks
+
+
+class MultiIndexHashTable:
+    """
+    Hamming-space index over 64-bit hashes with LRU eviction.
+    Values are stored per hash; adding an existing hash replaces its value.
+    """
+
+    def __init__(self, max_distance: int = PHASH_MAX_DISTANCE, max_items: int = PHASH_CACHE_MAX_ITEMS):
+        self.max_distance = max_distance
+        self.max_items = max_items
+        self._masks = _flip_masks(max_distance // BANDS)
+        self._bands: List[Dict[int, Set[int]]] = [defaultdict(set) for _ in range(BANDS)]
+        self._items: "OrderedDict[int, Any]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @staticmethod
+    def _band(value: int, band: int) -> int:
+        return (value >> (band * BAND_BITS)) & BAND_MASK
+
+    def add(self, value_hash: int, value: Any) -> None:
+        if value_hash not in self._items:
+            for band in range(BANDS):
+                self._bands[band][self._band(value_hash, band)].add(value_hash)
+        self._items[value_hash] = value
+        self._items.move_to_end(value_hash)
+        while len(self._items) > self.max_items:
+            self._remove(next(iter(self._items)))
+
+    def _remove(self, value_hash: int) -> None:
+        del self._items[value_hash]
+        for band in range(BANDS):
+            key = self._band(value_hash, band)
+            bucket = self._bands[band][key]
+            bucket.discard(value_hash)
+            if not bucket:
+                del self._bands[band][key]
+
+    def candidates(self, query_hash: int) -> List[Tuple[int, int, Any]]:
+        """All (distance, hash, value) within max_distance, nearest first."""
+        seen = set()
+        found = []
+        for band in range(BANDS):
+            table = self._bands[band]
+            key = self._band(query_hash, band)
+            for mask in self._masks:
+                for candidate in table.get(key ^ mask, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    distance = (candidate ^ query_hash).bit_count()
+                    if distance <= self.max_distance:
+                        found.append((distance, candidate, self._items[candidate]))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def touch(self, value_hash: int) -> None:
+        self._items.move_to_end(value_hash)
+
+
+class PerceptualCache:
+    """
+    Per-pipeline near-duplicate cache: dhash -> (dhash_fine, payload).
+    Payloads are stored as-is (the pipelines store validated model JSON).
+    """
+
+    def __init__(self, max_distance: int = PHASH_MAX_DISTANCE, verify_max_distance: int = PHASH_VERIFY_MAX_DISTANCE, max_items: int = PHASH_CACHE_MAX_ITEMS):
+        self.max_distance = max_distance
+        self.verify_max_distance = verify_max_distance
+        self.max_items = max_items
+        self._indexes: Dict[str, MultiIndexHashTable] = {}
+
+    def _index(self, namespace: str) -> MultiIndexHashTable:
+        index = self._indexes.get(namespace)
+        if index is None:
+            index = MultiIndexHashTable(self.max_distance, self.max_items)
+            self._indexes[namespace] = index
+        return index
+
+    def lookup(self, namespace: str, dhash: int, dhash_fine: int) -> Optional[Any]:
+        index = self._index(namespace)
+        for distance, candidate, (candidate_fine, payload) in index.candidates(dhash):
+            fine_distance = (candidate_fine ^ dhash_fine).bit_count()
+            if fine_distance <= self.verify_max_distance:
+                index.touch(candidate)
+                metrics.incr(f"phash_cache.{namespace}.hit")
+                print(f"[PHASH] {namespace} near-duplicate image: distance={distance} fine_distance={fine_distance}")
+                return payload
+        metrics.incr(f"phash_cache.{namespace}.miss")
+        return None
+
+    def add(self, namespace: str, dhash: int, dhash_fine: int, payload: Any) -> None:
+        self._index(namespace).add(dhash, (dhash_fine, payload))
+
+
+image_cache = PerceptualCache()
@@ -1,13 +1,43 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File, Form, Body
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any
 
-from router import route_solve, route_generate, route_coach, route_evaluate, route_measure, route_chat
-from ingest import process_image
-
-app = FastAPI(title="YKS AI Asistan Backend")
-
+from router import route_solve, route_generate, route_coach, route_evaluate, route_measure, route_chat, route_solve_page, route_measure_page
+from ingest import process_image, process_page, shutdown_image_pool, UploadSizeLimit
+from llm_client import startup_clients, shutdown_clients
+import metrics
+from llm_cache import llm_cache, hit_ratios
+from sse import stream_pipeline
+from logic.answer_bank import answer_bank
+from logic.copy_guard import copy_guard
+from config import GENERATE_MAX_COUNT, QUESTION_POOL_ENABLED
+from question_pool import question_pool
+from pipelines.generate import pool_refill_loop
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup_clients()
+    answer_bank.load()
+    copy_guard.load()
+    refill = asyncio.create_task(pool_refill_loop()) if QUESTION_POOL_ENABLED else None
+    yield
+    if refill is not None:
+        refill.cancel()
+        await asyncio.gather(refill, return_exceptions=True)
+    await shutdown_clients()
+    llm_cache.close()
+    question_pool.close()
+    shutdown_image_pool()
+
+
+app = FastAPI(title="YKS AI Asistan Backend", lifespan=lifespan)
+
+# Added first so CORS wraps it: browsers can read the 413
+app.add_middleware(UploadSizeLimit)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -20,6 +50,9 @@ app.add_middleware(
 class GenerateRequest(BaseModel):
     topic: str
     difficulty: str = "medium"
+    count: int = Field(1, ge=1, le=GENERATE_MAX_COUNT)
+    # Optional student id: pooled questions are never served to the same id twice
+    user_id: Optional[str] = None
 
 class CoachRequest(BaseModel):
     context: Dict[str, Any]
@@ -38,25 +71,67 @@ class ChatRequest(BaseModel):
 def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics_endpoint():
+    """
+    In-process counters (JSON repair, LLM cache, ...), plus question pool
+    depth / age / refill rate.
+    """
+    return {**metrics.snapshot(), "llm_cache.hit_ratio": hit_ratios(), **question_pool.stats()}
+
 @app.post("/solve")
-async def solve_endpoint(file: UploadFile = File(...)):
+async def solve_endpoint(file: UploadFile = File(...), ensemble: bool = False):
     """
     Multimodal solve endpoint.
-    Input: PNG Image
+    Input: PNG Image (?ensemble=true: majority vote over several solver calls)
     Output: Solution JSON
     """
 
-    image_bytes = await process_image(file)
+    image = await process_image(file)
     
 
-    return await route_solve(image_bytes)
+    return await route_solve(image, ensemble=ensemble)
+
+@app.post("/solve/stream")
+async def solve_stream_endpoint(file: UploadFile = File(...), ensemble: bool = False):
+    """
+    Streaming solve endpoint (Server-Sent Events).
+    Input: PNG Image (?ensemble=true as for /solve)
+    Output: stage / extracted / field / item / delta / reset events (vote
+    events with ?ensemble=true, answer_bank when the stored solution is
+    used), then "final" with the same JSON as /solve
+    """
+    image = await process_image(file)
+    return stream_pipeline(lambda emit: route_solve(image, emit, ensemble), "solve")
+
+@app.post("/solve/page")
+async def solve_page_endpoint(file: UploadFile = File(...)):
+    """
+    Solves every question on a photographed test page.
+    Input: Page image
+    Output: Solution JSON per question, in page order
+    """
+    questions = await process_page(file)
+    return await route_solve_page(questions)
 
 @app.post("/generate")
 async def generate_endpoint(req: GenerateRequest):
     """
     Generate questions endpoint.
+    count > 1 returns up to `count` validated questions, with the status of
+    every candidate tried. Questions come from the pre-validated pool when it
+    has enough ("pooled": how many did).
+    """
+    return await route_generate(req.topic, req.difficulty, req.count, user_id=req.user_id)
+
+@app.post("/generate/stream")
+async def generate_stream_endpoint(req: GenerateRequest):
+    """
+    Streaming generate endpoint (Server-Sent Events): a "question" event per
+    validated question (plus "candidate" status events when count > 1),
+    then "final" with the same JSON as /generate.
     """
-    return await route_generate(req.topic, req.difficulty)
+    return stream_pipeline(lambda emit: route_generate(req.topic, req.difficulty, req.count, emit, req.user_id), "generate")
 
 @app.post("/coach")
 async def coach_endpoint(req: CoachRequest):
@@ -65,6 +140,14 @@ async def coach_endpoint(req: CoachRequest):
     """
     return await route_coach(req.context)
 
+@app.post("/coach/stream")
+async def coach_stream_endpoint(req: CoachRequest):
+    """
+    Streaming coach endpoint (Server-Sent Events): plan sections as they are
+    written, then "final" with the same JSON as /coach.
+    """
+    return stream_pipeline(lambda emit: route_coach(req.context, emit), "coach")
+
 @app.post("/events")
 async def events_endpoint(event: Dict[str, Any] = Body(...)):
     """
@@ -89,13 +172,32 @@ async def measure_endpoint(file: UploadFile = File(...)):
     Output: Similarity Score JSON
     """
 
-    image_bytes = await process_image(file)
+    image = await process_image(file)
     
 
-    return await route_measure(image_bytes)
+    return await route_measure(image)
+
+@app.post("/measure/page")
+async def measure_page_endpoint(file: UploadFile = File(...)):
+    """
+    Measures OSYM similarity of every question on a test page.
+    Input: Page image
+    Output: Similarity Score JSON per question, in page order
+    """
+    questions = await process_page(file)
+    return await route_measure_page(questions)
+
 @app.post("/chat")
 async def chat_endpoint(req: ChatRequest):
     """
     General chat endpoint.
     """
     return await route_chat(req.message, req.history, req.context)
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest):
+    """
+    Streaming chat endpoint (Server-Sent Events): response text deltas, then
+    "final" with the same JSON as /chat.
+    """
+    return stream_pipeline(lambda emit: route_chat(req.message, req.history, req.context, emit), "chat")
@@ -0,0 +1,26 @@
+"""
+In-process counters for the /metrics endpoint.
+
+Plain dict counters keyed by dotted names (e.g. "json_repair.saved_retry").
+Updates come from coroutines and from the image worker threads, so they
+take a lock.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+_counters: Dict[str, float] = defaultdict(float)
+_lock = threading.Lock()
+
+
+def incr(name: str, amount: float = 1) -> None:
+    with _lock:
+        _counters[name] += amount
+
+
+def snapshot() -> Dict[str, float]:
+    """Current counter values, sorted by name."""
+    with _lock:
+        return {name: _counters[name] for name in sorted(_counters)}
@@ -1,5 +1,6 @@
+from typing import Optional
 from schemas_contracts.models import ChatV1
-from contract_guard import run_with_contract_guard
+from contract_guard import run_with_contract_guard, PartialCallback
 from ingest import generate_request_id
 from config import SOLVE_API_KEY # Reusing Solve API Key for general chat
 
@@ -14,7 +15,8 @@ Return ONLY valid JSON matching this schema:
 }
 """
 
-async def chat_pipeline(message: str, history: list, context: dict) -> dict:
+async def chat_pipeline(message: str, history: list, context: dict, on_event: Optional[PartialCallback] = None) -> dict:
+    """`on_event` receives the response text as it is written (see run_with_contract_guard)."""
     req_id = generate_request_id()
     
     # Construct conversation prompt
@@ -30,7 +32,8 @@ async def chat_pipeline(message: str, history: list, context: dict) -> dict:
             output_model=ChatV1,
             pipeline_name="chat",
             model_name="chat_v1",
-            request_id=req_id
+            request_id=req_id,
+            on_partial=on_event
         )
         
         return {
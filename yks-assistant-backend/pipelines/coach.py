@@ -1,5 +1,6 @@
+from typing import Optional
 from schemas_contracts.models import CoachV1
-from contract_guard import run_with_contract_guard
+from contract_guard import run_with_contract_guard, PartialCallback
 from ingest import generate_request_id
 from config import COACH_API_KEY, COACH_MODEL_ID
 
@@ -45,7 +46,8 @@ Sadece ve sadece aşağıdaki JSON şemasını döndür:
 # PIPELINE STEPS
 # ------------------------------------------------------------------------
 
-async def coach_pipeline(context: dict) -> dict:
+async def coach_pipeline(context: dict, on_event: Optional[PartialCallback] = None) -> dict:
+    """`on_event` receives each plan section as it is written (see run_with_contract_guard)."""
     req_id = generate_request_id()
     
     # Serialize context
@@ -60,7 +62,8 @@ async def coach_pipeline(context: dict) -> dict:
             pipeline_name="coach",
             model_name="gpt_oss_120b_coach",
             request_id=req_id,
-            model=COACH_MODEL_ID  # Explicitly use GPT-OSS-120B
+            model=COACH_MODEL_ID,  # Explicitly use GPT-OSS-120B
+            on_partial=on_event
         )
         
         return {
@@ -0,0 +1,100 @@
+import asyncio
+import base64
+import hashlib
+from typing import Dict, Optional
+from schemas_contracts.models import ExtractV1
+from contract_guard import run_with_contract_guard, PartialCallback
+from ingest import ProcessedImage
+from logic.phash_index import image_cache
+from config import EXTRACT_API_KEY, EXTRACT_MODEL_ID
+import metrics
+
+# ------------------------------------------------------------------------
+# PROMPTS
+# ------------------------------------------------------------------------
+
+# One superset prompt for solve and measure, so both reuse the same extraction
+EXTRACT_SYSTEM_PROMPT = """
+Sen uzman bir soru analiz sistemisin. Görevin, verilen bir test sorusu görselini (TYT/AYT/YKS tarzı) analiz etmek ve içerikleri yapılandırılmış JSON formatında çıkarmaktır.
+
+HEDEF JSON FORMATI:
+{
+  "schema": "extract_v1",
+  "id": "q_001",
+  "question_text": "...",
+  "choices": {
+    "A": "...",
+    "B": "...",
+    "C": "...",
+    "D": "...",
+    "E": "..."
+  },
+  "figures_desc": "Varsa şekil/grafik/tablo açıklaması. Yoksa null.",
+  "topic_hint": "Sorunun konusu (örn. Problemler, Fonksiyonlar). Emin değilsen null.",
+  "constraints": ["Soruda verilen koşullar (örn. x pozitif tam sayıdır)"],
+  "extraction_notes": "Varsa ek notlar.",
+  "extraction_confidence": 0.95
+}
+
+KURALLAR:
+1. "question_text": Soru metnini eksiksiz çıkar. Soru numarasını (1., 2. vb) metnin başına ekleme.
+2. "choices": Şık harflerini (A, B...) value kısmına dahil etme. Sadece metni al.
+3. "figures_desc": Şekil, grafik veya tablo varsa detaylı betimle (görme engelli biri için anlatır gibi). Şekil yoksa null.
+4. "constraints": Soruda açıkça verilen koşulları ayrı maddeler olarak yaz. Yoksa [].
+5. "extraction_confidence": 0.0 ile 1.0 arasında bir güven skoru ver.
+6. Sadece ve sadece geçerli JSON döndür. Markdown bloğu (```json) içine alma.
+"""
+
+# ------------------------------------------------------------------------
+# EXTRACTION SERVICE
+# ------------------------------------------------------------------------
+
+# Extractions currently running, keyed by image content hash. A /solve and a
+# /measure for the same image at the same time share one VLM call.
+_in_flight: Dict[str, "asyncio.Future[ExtractV1]"] = {}
+
+
+async def _extract(image: ProcessedImage, request_id: str, on_partial: Optional[PartialCallback]) -> ExtractV1:
+    print(f"[INGEST] req_id={request_id} pixel_reduction={image.pixel_reduction:.0%} skew={image.skew_degrees:.1f}deg vision_tokens={image.vision_tokens} bytes={len(image.data)}")
+    image_b64 = base64.b64encode(image.data).decode("utf-8")
+
+    extract_result = await run_with_contract_guard(
+        prompt=EXTRACT_SYSTEM_PROMPT,
+        api_key=EXTRACT_API_KEY,
+        image_b64=image_b64,
+        image_mime_type=image.mime_type,
+        output_model=ExtractV1,
+        pipeline_name="extract",
+        model_name="qwen_vl_235b",
+        request_id=request_id,
+        model=EXTRACT_MODEL_ID,
+        on_partial=on_partial
+    )
+    image_cache.add("extract", image.dhash, image.dhash_fine, extract_result.model_dump_json(by_alias=True))
+    return extract_result
+
+
+async def extract_step(image: ProcessedImage, request_id: str, on_partial: Optional[PartialCallback] = None) -> ExtractV1:
+    """
+    Image -> ExtractV1, shared by the solve and measure pipelines.
+    Memoized per image: the perceptual-hash cache returns the stored
+    extraction for the same (or a near-identical) image, and concurrent
+    requests for the same bytes wait on the call already in flight.
+    `on_partial` sees the extraction stream (see run_with_contract_guard)
+    only when this request makes the VLM call itself.
+    """
+    cached = image_cache.lookup("extract", image.dhash, image.dhash_fine)
+    if cached is not None:
+        return ExtractV1.model_validate_json(cached)
+
+    key = hashlib.sha256(image.data).hexdigest()
+    pending = _in_flight.get(key)
+    if pending is not None:
+        metrics.incr("extract.in_flight_shared")
+        print(f"[EXTRACT] req_id={request_id} waiting on in-flight extraction of the same image")
+        return await asyncio.shield(pending)
+
+    task = asyncio.ensure_future(_extract(image, request_id, on_partial))
+    _in_flight[key] = task
+    task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(task)
@@ -1,10 +1,23 @@
-import json
-from schemas_contracts.models import GenerateV1, SolveV1
-from contract_guard import run_with_contract_guard
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from schemas_contracts.models import GenerateV1, GeneratedQuestion
+from contract_guard import run_with_contract_guard, PartialCallback
 from ingest import generate_request_id
 from pipelines.solve import solve_step, ExtractV1
-from config import GENERATE_API_KEY, GENERATE_MODEL_ID
+from config import (GENERATE_API_KEY, GENERATE_MODEL_ID, PIPELINE_ROUTES, HEDGE_AFTER_MS,
+                    GENERATE_RACE, GENERATE_RACE_CANDIDATES, GENERATE_RACE_CONCURRENCY, GENERATE_MAX_CALLS,
+                    GENERATE_BATCH_CONCURRENCY, GENERATE_BATCH_SPARE, GENERATE_BATCH_CALLS_PER_QUESTION,
+                    GENERATE_PREFILTER, GENERATE_PREFILTER_REJECT_FLAGS, GENERATE_PREFILTER_MIN_DISTRACTOR_QUALITY,
+                    QUESTION_POOL_ENABLED, QUESTION_POOL_TARGET, QUESTION_POOL_REFILL_INTERVAL_SECONDS,
+                    QUESTION_POOL_MAX_FAILURES)
+from pipelines.hakem.standardizer import standardize
+from pipelines.hakem.clarity_guard import evaluate_guard
+from pipelines.hakem.distractor_quality import analyze_distractors
 from logic.anchor_selector import get_random_anchors, format_anchors_for_prompt
+from logic.copy_guard import copy_guard
+from question_pool import question_pool
+import metrics
 
 # ------------------------------------------------------------------------
 # PROMPTS
@@ -41,9 +54,10 @@ JSON formatında 'questions' listesi içinde cevap ver:
 # PIPELINE STEPS
 # ------------------------------------------------------------------------
 
-async def generate_step(topic: str, difficulty: str, request_id: str) -> GenerateV1:
-    # 1. Get anchors
-    anchors = get_random_anchors(topic, k=3)
+async def generate_step(topic: str, difficulty: str, request_id: str, anchors: Optional[List[dict]] = None) -> GenerateV1:
+    # 1. Get anchors (callers pass them in to check the result against them)
+    if anchors is None:
+        anchors = get_random_anchors(topic, k=3)
     anchors_text = format_anchors_for_prompt(anchors)
     
     # 2. Build prompt
@@ -56,14 +70,54 @@ async def generate_step(topic: str, difficulty: str, request_id: str) -> Generat
         pipeline_name="generate",
         model_name="gpt_oss_120b",
         request_id=request_id,
-        model=GENERATE_MODEL_ID
+        model=GENERATE_MODEL_ID,
+        routes=PIPELINE_ROUTES["generate"],
+        hedge_after_ms=HEDGE_AFTER_MS["generate"]
     )
 
-async def validate_question(question_item, request_id: str) -> bool:
+def prefilter_question(question_item: GeneratedQuestion, request_id: str, anchors: List[dict] = ()) -> Optional[str]:
     """
-    Validates a generated question by trying to solve it with the Solver.
-    Returns True if Solver matches the Generator's answer.
+    Local checks run before the validator's solver call: the reason a
+    candidate is rejected, or None if it goes on to validation. Rejected are
+    copies of its `anchors` or a bank question (logic/copy_guard.py), then
+    (hakem) a GENERATE_PREFILTER_REJECT_FLAGS risk flag or distractor
+    quality below GENERATE_PREFILTER_MIN_DISTRACTOR_QUALITY. Every rejection
+    saves one solver call.
     """
+    t0 = time.perf_counter()
+    reason = None
+    copied = copy_guard.check(question_item.problem_text, question_item.choices, anchors)
+    if copied:
+        reason = f"copy_of={copied[1]} score={copied[0]:.2f}"
+    elif GENERATE_PREFILTER:
+        standardized = standardize({"question_text": question_item.problem_text, "choices": question_item.choices})
+        flags = [flag for flag in evaluate_guard(standardized).risk_flags if flag in GENERATE_PREFILTER_REJECT_FLAGS]
+        quality = analyze_distractors(standardized).distractor_quality
+        if flags:
+            reason = ",".join(flags)
+        elif quality < GENERATE_PREFILTER_MIN_DISTRACTOR_QUALITY:
+            reason = f"distractor_quality={quality:.2f}"
+
+    latency = (time.perf_counter() - t0) * 1000
+    metrics.incr("generate.prefilter.checked")
+    metrics.incr("generate.prefilter.ms_total", latency)
+    if reason:
+        metrics.incr("generate.prefilter.validations_saved")
+        print(f"[PREFILTER] req_id={request_id} rejected={reason} latency={latency:.2f}ms")
+    return reason
+
+async def validate_question(question_item, request_id: str, anchors: List[dict] = ()) -> bool:
+    """
+    Validates a generated question: the local prefilter, then the solver.
+    Returns True if it passes the prefilter and the Solver matches the
+    Generator's answer.
+    """
+    if prefilter_question(question_item, request_id, anchors):
+        return False
+    return await validate_with_solver(question_item, request_id)
+
+async def validate_with_solver(question_item, request_id: str) -> bool:
+    """Tries to solve a generated question; True if the Solver matches the Generator's answer."""
     try:
         # Mock an ExtractV1 object from the generated question
         mock_extract = ExtractV1(
@@ -72,8 +126,8 @@ async def validate_question(question_item, request_id: str) -> bool:
             language="tr"
         )
         
-        # Call Solver
-        solve_result = await solve_step(mock_extract, request_id)
+        # Call Solver; always the full model, a fast-tier agreement is not a validation
+        solve_result = await solve_step(mock_extract, request_id, routed=False)
         
         # Check agreement
         is_valid = solve_result.final_answer == question_item.correct_answer
@@ -84,13 +138,8 @@ async def validate_question(question_item, request_id: str) -> bool:
         print(f"[VALIDATOR ERROR] {e}")
         return False
 
-# ------------------------------------------------------------------------
-# MAIN PIPELINE
-# ------------------------------------------------------------------------
-
-async def generate_pipeline(topic: str, difficulty: str) -> dict:
-    req_id = generate_request_id()
-    
+async def sequential_generate(topic: str, difficulty: str, request_id: str) -> Optional[GenerateV1]:
+    """Generate -> validate, one call at a time; the first validated result or None."""
     # Simple retry loop for generation/validation (max 1 retry per user spec)
     max_pipeline_retries = 1
     attempts = 0
@@ -98,7 +147,8 @@ async def generate_pipeline(topic: str, difficulty: str) -> dict:
     while attempts <= max_pipeline_retries:
         try:
             # 1. Generate
-            gen_result = await generate_step(topic, difficulty, req_id)
+            anchors = get_random_anchors(topic, k=3)
+            gen_result = await generate_step(topic, difficulty, request_id, anchors)
             
             # 2. Validate (Check the first question as a heuristic)
             if not gen_result.questions:
@@ -106,12 +156,9 @@ async def generate_pipeline(topic: str, difficulty: str) -> dict:
                  continue
 
             first_q = gen_result.questions[0]
-            if await validate_question(first_q, req_id):
-                 return {
-                    "req_id": req_id,
-                    "status": "success",
-                    "data": gen_result.model_dump()
-                }
+            if await validate_question(first_q, request_id, anchors):
+                 # Only the validated question goes out
+                 return GenerateV1(questions=[first_q])
             else:
                  print(f"[WARN] Validation failed for attempt {attempts}")
                  
@@ -119,6 +166,302 @@ async def generate_pipeline(topic: str, difficulty: str) -> dict:
             print(f"[ERROR] Generate attempt {attempts} failed: {e}")
             
         attempts += 1
+
+    return None
+
+
+async def race_generate(topic: str, difficulty: str, request_id: str) -> Optional[GenerateV1]:
+    """
+    GENERATE_RACE_CANDIDATES generate -> validate chains at once; each
+    candidate is validated as soon as it arrives, the first one that passes
+    wins and the rest are cancelled. A rejected candidate is replaced while
+    the request's call budget lasts: GENERATE_MAX_CALLS generator + validator
+    calls, reserved two at a time so no candidate is generated without the
+    call to validate it; a candidate rejected by prefilter_question gives
+    its validation call back. At most GENERATE_RACE_CONCURRENCY calls are in
+    flight at once.
+    """
+    slots = asyncio.Semaphore(GENERATE_RACE_CONCURRENCY)
+    calls = 0
+
+    async def candidate(n: int) -> Optional[GenerateV1]:
+        nonlocal calls
+        anchors = get_random_anchors(topic, k=3)
+        try:
+            async with slots:
+                gen_result = await generate_step(topic, difficulty, request_id, anchors)
+        except Exception as e:
+            calls -= 1  # the validation call is not needed
+            print(f"[ERROR] Generate candidate {n} failed: {e}")
+            return None
+        question = gen_result.questions[0] if gen_result.questions else None
+        if question is None or prefilter_question(question, request_id, anchors):
+            calls -= 1
+            return None
+        async with slots:
+            valid = await validate_with_solver(question, request_id)
+        return GenerateV1(questions=[question]) if valid else None
+
+    def launch(n: int) -> Optional[asyncio.Task]:
+        nonlocal calls
+        if calls + 2 > GENERATE_MAX_CALLS:
+            return None
+        calls += 2
+        return asyncio.create_task(candidate(n))
+
+    t0 = time.perf_counter()
+    launched = 0
+    pending = set()
+    for _ in range(GENERATE_RACE_CANDIDATES):
+        task = launch(launched)
+        if task is None:
+            break
+        pending.add(task)
+        launched += 1
+
+    winner = None
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.result() is not None:
+                    winner = winner or task.result()
+                    continue
+                replacement = launch(launched)
+                if replacement is not None:
+                    pending.add(replacement)
+                    launched += 1
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    metrics.incr("generate.race.runs")
+    metrics.incr("generate.race.candidates", launched)
+    metrics.incr("generate.race.cancelled", len(pending))
+    print(f"[RACE] req_id={request_id} valid={winner is not None} candidates={launched} calls<={calls}/{GENERATE_MAX_CALLS} cancelled={len(pending)} latency={(time.perf_counter() - t0) * 1000:.0f}ms")
+    return winner
+
+async def batch_generate(topic: str, difficulty: str, count: int, request_id: str,
+                         on_event: Optional[PartialCallback] = None) -> Tuple[List[GeneratedQuestion], List[Dict[str, Any]]]:
+    """
+    Up to `count` validated questions from one bounded pool of generator
+    and validator calls (GENERATE_BATCH_CONCURRENCY in flight). Generator
+    calls are kept running for the questions still missing plus
+    GENERATE_BATCH_SPARE, every question they return is validated on its
+    own, and rejected ones are replaced, within a budget of
+    GENERATE_BATCH_CALLS_PER_QUESTION calls per requested question.
+    `on_event` gets a "candidate" event on every status change
+    (generating / validating / accepted / rejected / failed / cancelled
+    once the set is complete / surplus when validated after it was;
+    rejected by prefilter_question with a "reason") and a "question" event
+    per accepted question. Surplus questions go to the question pool.
+    Returns (accepted questions, per-candidate status).
+    """
+    emit = on_event or (lambda event, data: None)
+    slots = asyncio.Semaphore(GENERATE_BATCH_CONCURRENCY)
+    budget = count * GENERATE_BATCH_CALLS_PER_QUESTION
+    calls = 0
+    accepted: List[GeneratedQuestion] = []
+    surplus: List[GeneratedQuestion] = []
+    candidates: List[Dict[str, Any]] = []
+    running = set()
+
+    def set_status(candidate: Dict[str, Any], status: str) -> None:
+        candidate["status"] = status
+        emit("candidate", dict(candidate))
+
+    def new_candidate(status: str) -> Dict[str, Any]:
+        candidate = {"id": len(candidates) + 1}
+        candidates.append(candidate)
+        set_status(candidate, status)
+        return candidate
+
+    async def generate(candidate: Dict[str, Any]):
+        anchors = get_random_anchors(topic, k=3)
+        try:
+            async with slots:
+                gen_result = await generate_step(topic, difficulty, request_id, anchors)
+        except Exception as e:
+            print(f"[ERROR] Generate candidate {candidate['id']} failed: {e}")
+            gen_result = None
+        return "generated", candidate, (gen_result, anchors)
+
+    async def validate(candidate: Dict[str, Any], question: GeneratedQuestion):
+        async with slots:
+            return "validated", candidate, (question, await validate_with_solver(question, request_id))
+
+    def validate_later(candidate: Dict[str, Any], question: GeneratedQuestion, anchors: List[dict]) -> None:
+        nonlocal calls
+        reason = prefilter_question(question, request_id, anchors)
+        if reason:
+            calls -= 1  # rejected locally, its validation call is not needed
+            candidate["reason"] = reason
+            set_status(candidate, "rejected")
+            return
+        set_status(candidate, "validating")
+        running.add(asyncio.create_task(validate(candidate, question)))
+
+    t0 = time.perf_counter()
+    try:
+        while len(accepted) < count:
+            # Each generator call reserves its own validation call
+            while len(accepted) + len(running) < count + GENERATE_BATCH_SPARE and calls + 2 <= budget:
+                calls += 2
+                running.add(asyncio.create_task(generate(new_candidate("generating"))))
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                running.discard(task)
+                kind, candidate, payload = task.result()
+                if kind == "generated":
+                    gen_result, anchors = payload
+                    if gen_result is None or not gen_result.questions:
+                        calls -= 1  # its validation call is not needed
+                        set_status(candidate, "failed")
+                        continue
+                    questions = gen_result.questions
+                    validate_later(candidate, questions[0], anchors)
+                    # Extra questions in the same response, while they are still needed and affordable
+                    for question in questions[1:]:
+                        if len(accepted) + len(running) >= count or calls + 1 > budget:
+                            break
+                        calls += 1
+                        validate_later(new_candidate("validating"), question, anchors)
+                else:
+                    question, valid = payload
+                    if not valid:
+                        set_status(candidate, "rejected")
+                    elif len(accepted) < count:
+                        accepted.append(question)
+                        set_status(candidate, "accepted")
+                        emit("question", {"index": len(accepted), "question": question.model_dump()})
+                    else:
+                        # Validated in the same round the set was completed
+                        surplus.append(question)
+                        set_status(candidate, "surplus")
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        for candidate in candidates:
+            if candidate["status"] in ("generating", "validating"):
+                set_status(candidate, "cancelled")
+
+    if surplus and QUESTION_POOL_ENABLED:
+        await question_pool.add(topic, difficulty, surplus)
+    metrics.incr("generate.batch.runs")
+    metrics.incr("generate.batch.questions", len(accepted))
+    metrics.incr("generate.batch.candidates", len(candidates))
+    metrics.incr("generate.batch.surplus", len(surplus))
+    print(f"[BATCH] req_id={request_id} requested={count} accepted={len(accepted)} surplus={len(surplus)} candidates={len(candidates)} calls<={calls}/{budget} latency={(time.perf_counter() - t0) * 1000:.0f}ms")
+    return accepted, candidates
+
+# ------------------------------------------------------------------------
+# QUESTION POOL REFILL
+# ------------------------------------------------------------------------
+
+async def pool_refill_loop() -> None:
+    """
+    Background worker (started in the app lifespan): tops up every pool key
+    below the low watermark to QUESTION_POOL_TARGET, one key at a time.
+    Runs when /generate leaves a key below the watermark, or every
+    QUESTION_POOL_REFILL_INTERVAL_SECONDS. Keys whose refill adds nothing
+    are backed off (question_pool.record_refill).
+    """
+    while True:
+        try:
+            await asyncio.wait_for(question_pool.refill_wanted.wait(), QUESTION_POOL_REFILL_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        question_pool.refill_wanted.clear()
+        try:
+            low = await question_pool.low_keys()
+        except Exception as e:
+            print(f"[POOL] refill check failed: {e}")
+            continue
+        for topic, difficulty, depth in low:
+            req_id = generate_request_id()
+            t0 = time.perf_counter()
+            try:
+                questions, _ = await batch_generate(topic, difficulty, QUESTION_POOL_TARGET - depth, req_id)
+                await question_pool.add(topic, difficulty, questions)
+            except Exception as e:
+                print(f"[POOL] req_id={req_id} refill topic={topic} difficulty={difficulty} failed: {e}")
+                questions = []
+            try:
+                failures, backoff = await question_pool.record_refill(topic, difficulty, len(questions))
+            except Exception as e:
+                print(f"[POOL] req_id={req_id} refill bookkeeping failed: {e}")
+                failures, backoff = 0, 0.0
+            if not questions:
+                metrics.incr("question_pool.refill_failures")
+                evicted = failures >= QUESTION_POOL_MAX_FAILURES
+                print(f"[POOL] req_id={req_id} refill topic={topic} difficulty={difficulty} added nothing: failures={failures} "
+                      + ("evicted" if evicted else f"retry_in={backoff:.0f}s"))
+                continue
+            metrics.incr("question_pool.refills")
+            metrics.incr("question_pool.refilled", len(questions))
+            print(f"[POOL] req_id={req_id} refill topic={topic} difficulty={difficulty} depth={depth}->{depth + len(questions)} latency={(time.perf_counter() - t0) * 1000:.0f}ms")
+
+# ------------------------------------------------------------------------
+# MAIN PIPELINE
+# ------------------------------------------------------------------------
+
+async def generate_pipeline(topic: str, difficulty: str, count: int = 1, on_event: Optional[PartialCallback] = None,
+                            user_id: Optional[str] = None) -> dict:
+    """
+    Questions come from the pre-validated pool first (question_pool, never
+    one `user_id` has seen); only the rest is generated live and then added
+    to the pool. Live: `count` > 1 builds the set with batch_generate, a
+    single question is raced (race_generate) or generated sequentially.
+    `on_event` receives a "question" event per validated question (and the
+    batch's "candidate" status events) for streaming clients.
+    """
+    req_id = generate_request_id()
+    emit = on_event or (lambda event, data: None)
+
+    pooled = await question_pool.take(topic, difficulty, count, user_id) if QUESTION_POOL_ENABLED else []
+    for index, question in enumerate(pooled, 1):
+        emit("question", {"index": index, "question": question.model_dump()})
+
+    def after_pooled(event: str, data: dict) -> None:
+        if event == "question":
+            data = {**data, "index": len(pooled) + data["index"]}
+        emit(event, data)
+
+    missing = count - len(pooled)
+    live, candidates = [], []
+    if missing > 1:
+        live, candidates = await batch_generate(topic, difficulty, missing, req_id, after_pooled)
+    elif missing == 1:
+        if GENERATE_RACE:
+            gen_result = await race_generate(topic, difficulty, req_id)
+        else:
+            gen_result = await sequential_generate(topic, difficulty, req_id)
+        if gen_result is not None:
+            live = gen_result.questions
+            after_pooled("question", {"index": 1, "question": live[0].model_dump()})
+    if live and QUESTION_POOL_ENABLED:
+        await question_pool.add(topic, difficulty, live, user_id, served=True)
+
+    questions = pooled + live
+    if pooled:
+        print(f"[POOL] req_id={req_id} topic={topic} difficulty={difficulty} pooled={len(pooled)} live={len(live)}")
+    if questions:
+        response = {
+            "req_id": req_id,
+            "status": "success",
+            "data": GenerateV1(questions=questions).model_dump()
+        }
+        if count > 1:
+            response.update({"requested": count, "question_count": len(questions), "candidates": candidates})
+        if QUESTION_POOL_ENABLED:
+            response["pooled"] = len(pooled)
+        return response
         
     return {
         "req_id": req_id,
@@ -6,6 +6,7 @@ from .clarity_guard import guard_question, evaluate_guard
 from .osym_similarity import osym_similarity_score, calculate_similarity
 from .distractor_quality import distractor_quality_score, analyze_distractors
 from .cognitive_signature import cognitive_signature_score, analyze_cognitive_signature
+from .difficulty import estimate_difficulty, DifficultyEstimate
 
 __version__ = "0.1.0"
 __all__ = [
@@ -18,5 +19,7 @@ __all__ = [
     # Distractor Quality
     "distractor_quality_score", "analyze_distractors",
     # Cognitive Signature
-    "cognitive_signature_score", "analyze_cognitive_signature"
+    "cognitive_signature_score", "analyze_cognitive_signature",
+    # Difficulty Estimate
+    "estimate_difficulty", "DifficultyEstimate"
 ]
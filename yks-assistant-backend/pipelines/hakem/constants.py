@@ -49,18 +49,22 @@ BULLET_PATTERN = re.compile(r'[•●○◦]\s*')
 FIGURE_REFERENCE_PATTERNS = [
     r'\bşekil\b',
     r'\bşekilde\b',
+    r'\bşekildeki\b',
     r'\bşekilden\b',
     r'\bgrafik\b',
     r'\bgrafikte\b',
+    r'\bgrafikteki\b',
     r'\bgrafikten\b',
     r'\btablo\b',
     r'\btabloda\b',
+    r'\btablodaki\b',
     r'\btablodan\b',
     r'\bdiyagram\b',
     r'\bgörsel\b',
     r'\bçizim\b',
     r'\bharita\b',
     r'\bharitada\b',
+    r'\bharitadaki\b',
 ]
 
 FIGURE_REFERENCE_REGEX = re.compile('|'.join(FIGURE_REFERENCE_PATTERNS), re.IGNORECASE)
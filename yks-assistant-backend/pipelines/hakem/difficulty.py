@@ -0,0 +1,138 @@
+"""
+difficulty.py - Difficulty Estimate Module
+
+Bu modül, sorunun çözüm zorluğunu LLM çağırmadan tahmin eder.
+
+Amaç: "Bu soruyu küçük/hızlı bir model çözebilir mi?"
+
+Sinyaller (hepsi yerel, deterministik):
+- q_token_len: Uzun soru kökü = daha çok veri, daha çok adım
+- premise_count_proxy: I, II, III tipi öncüller
+- is_negative_question / has_figure
+- cognitive_signature: ilişki kurma, okuma tuzağı, zaman yutucusu
+- topic_hint: Konu bazlı ağırlık (olasılık, geometri, fonksiyonlar zor;
+  oran-orantı, temel kavramlar kolay)
+
+Çıktı:
+- score: 0-1 arası zorluk tahmini
+- signals: skora giren her sinyal (router kararlarını ayarlamak için loglanır)
+"""
+
+from typing import Any, Dict, Optional
+from dataclasses import dataclass, field
+
+from .cognitive_signature import analyze_cognitive_signature
+
+
+@dataclass
+class DifficultyEstimate:
+    """Zorluk tahmini sonucu."""
+    score: float  # 0-1
+    signals: Dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "score": round(self.score, 2),
+            "signals": {name: round(value, 2) for name, value in self.signals.items()},
+        }
+
+
+# ============================================================================
+# TOPIC WEIGHTS
+# ============================================================================
+
+# topic_hint içinde geçen anahtar kelime -> skora eklenen değer
+# (ilk eşleşen değil, en büyük mutlak değer kullanılır)
+TOPIC_WEIGHTS = {
+    "olasılık": 0.2,
+    "permütasyon": 0.2,
+    "kombinasyon": 0.2,
+    "binom": 0.2,
+    "mantık": 0.15,
+    "fonksiyon": 0.1,
+    "polinom": 0.1,
+    "logaritma": 0.15,
+    "türev": 0.2,
+    "integral": 0.2,
+    "limit": 0.15,
+    "trigonometri": 0.15,
+    "çember": 0.15,
+    "üçgen": 0.1,
+    "dörtgen": 0.1,
+    "katı cisim": 0.15,
+    "geometri": 0.1,
+    "karmaşık": 0.1,
+    "oran": -0.15,
+    "orantı": -0.15,
+    "yüzde": -0.1,
+    "temel kavramlar": -0.15,
+    "sayı basamakları": -0.1,
+    "rasyonel sayılar": -0.1,
+    "ondalık": -0.15,
+    "birinci dereceden": -0.1,
+    "1. dereceden": -0.1,
+}
+
+# Sinyal ağırlıkları (topic hariç toplamı 1.0). data/questions.db'deki
+# kolay/orta/zor etiketlerine, üç etiketi de taşıyan tek kaynak (3ADIM)
+# üzerinde ikili sıralama (AUC) en yüksek olacak şekilde ayarlandı:
+#   kolay<orta 0.57, orta<zor 0.73, kolay<zor 0.77
+# Zoru ayıran neredeyse yalnızca uzunluk. Kolay ile orta zor ayrılır; skor
+# "hızlı model çözebilir" demekten çok "zor değil" der. Şekil bankada
+# yalnızca kaynağı belli eder (3ADIM'in hepsi şekilli, diğerleri şekilsiz),
+# olumsuz kök ve okuma tuzağı etiketlerle ilişkisiz: sinyal olarak loglanır,
+# skora girmez.
+WEIGHTS = {
+    "length": 0.6,
+    "premises": 0.1,
+    "negative": 0.0,
+    "figure": 0.0,
+    "relation": 0.05,
+    "reading_trap": 0.0,
+    "time_sink": 0.25,
+}
+
+
+def topic_weight(topic_hint: Optional[str]) -> float:
+    """topic_hint için konu ağırlığı (eşleşme yoksa 0)."""
+    if not topic_hint:
+        return 0.0
+    topic = topic_hint.casefold()
+    matches = [weight for keyword, weight in TOPIC_WEIGHTS.items() if keyword in topic]
+    return max(matches, key=abs) if matches else 0.0
+
+
+# ============================================================================
+# MAIN DIFFICULTY ESTIMATE
+# ============================================================================
+
+def estimate_difficulty(standardized_data: Dict[str, Any], topic_hint: Optional[str] = None) -> DifficultyEstimate:
+    """
+    Ana zorluk tahmin fonksiyonu.
+
+    Args:
+        standardized_data: standardized_v1 formatında veri
+        topic_hint: extract_v1'deki konu tahmini (varsa)
+
+    Returns:
+        DifficultyEstimate objesi
+    """
+    base_features = standardized_data.get("base_features", {})
+    signature = analyze_cognitive_signature(standardized_data)
+
+    signals = {
+        # ÖSYM'de tipik kök 20-60 token; 80+ token uzun sayılır
+        "length": min(1.0, base_features.get("q_token_len", 0) / 80),
+        "premises": min(1.0, base_features.get("premise_count_proxy", 0) / 3),
+        "negative": 1.0 if base_features.get("is_negative_question") else 0.0,
+        "figure": 1.0 if base_features.get("has_figure") or base_features.get("references_figure_in_text") else 0.0,
+        "relation": signature.relation_building,
+        "reading_trap": signature.reading_trap,
+        "time_sink": signature.time_sink,
+    }
+    score = sum(WEIGHTS[name] * value for name, value in signals.items())
+
+    signals["topic"] = topic_weight(topic_hint)
+    score = min(1.0, max(0.0, score + signals["topic"]))
+
+    return DifficultyEstimate(score=score, signals=signals)
@@ -122,7 +122,9 @@ def standardize(input_data: Dict[str, Any]) -> Dict[str, Any]:
     raw_question = input_data.get("question_text", "")
     raw_choices = input_data.get("choices", {})
     raw_figures = input_data.get("figures_desc")
-    extraction_confidence = input_data.get("extraction_confidence", 1.0)
+    extraction_confidence = input_data.get("extraction_confidence")
+    if extraction_confidence is None:  # extract_v1 alanı opsiyonel
+        extraction_confidence = 1.0
     extraction_notes = input_data.get("extraction_notes", "")
     
     # Normalize
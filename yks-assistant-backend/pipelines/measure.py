@@ -1,67 +1,13 @@
-import base64
-import json
-from schemas_contracts.models import ExtractV1
-from contract_guard import run_with_contract_guard
-from ingest import generate_request_id
-from config import MEASURE_API_KEY, EXTRACT_API_KEY, EXTRACT_MODEL_ID
+from ingest import generate_request_id, ProcessedImage
+from pipelines.extract import extract_step
 from .hakem.standardizer import standardize
 from .hakem.osym_similarity import osym_similarity_score
 
-# ------------------------------------------------------------------------
-# PROMPTS
-# ------------------------------------------------------------------------
-
-MEASURE_SYSTEM_PROMPT = """
-Sen uzman bir soru analiz sistemisin. Görevin, verilen bir test sorusu görselini (TYT/AYT/YKS tarzı) analiz etmek ve içerikleri yapılandırılmış JSON formatında çıkarmaktır.
-
-HEDEF JSON FORMATI:
-{
-  "schema": "extract_v1",
-  "id": "q_001",
-  "question_text": "...",
-  "choices": {
-    "A": "...",
-    "B": "...",
-    "C": "...",
-    "D": "...",
-    "E": "..."
-  },
-  "figures_desc": "Varsa şekil/grafik/tablo açıklaması. Yoksa null veya \"\".",
-  "extraction_notes": "Varsa ek notlar.",
-  "extraction_confidence": 0.95
-}
-
-KURALLAR:
-1. "question_text": Soru metnini eksiksiz çıkar. Soru numarasını (1., 2. vb) metnin başına ekleme.
-2. "choices": Şık harflerini (A, B...) value kısmına dahil etme. Sadece metni al.
-3. "figures_desc": Şekil, grafik veya tablo varsa detaylı betimle (görme engelli biri için anlatır gibi). Şekil yoksa boş bırak.
-4. "extraction_confidence": 0.0 ile 1.0 arasında bir güven skoru ver.
-5. Sadece ve sadece geçerli JSON döndür. Markdown bloğu (```json) içine alma.
-"""
-
-# ------------------------------------------------------------------------
-# PIPELINE STEPS
-# ------------------------------------------------------------------------
-
-async def extract_step(image_bytes: bytes, request_id: str) -> ExtractV1:
-    image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-    
-    return await run_with_contract_guard(
-        prompt=MEASURE_SYSTEM_PROMPT,
-        api_key=EXTRACT_API_KEY,
-        image_b64=image_b64,
-        output_model=ExtractV1,
-        pipeline_name="measure",
-        model_name="qwen_vl_235b",
-        request_id=request_id,
-        model=EXTRACT_MODEL_ID
-    )
-
 # ------------------------------------------------------------------------
 # MAIN PIPELINE
 # ------------------------------------------------------------------------
 
-async def measure_pipeline(image_bytes: bytes) -> dict:
+async def measure_pipeline(image: ProcessedImage) -> dict:
     """
     Orchestrates the Measurement Pipeline.
     1. VLM Extraction (Image -> JSON)
@@ -72,7 +18,7 @@ async def measure_pipeline(image_bytes: bytes) -> dict:
     
     try:
         # 1. Extract
-        extract_result = await extract_step(image_bytes, req_id)
+        extract_result = await extract_step(image, req_id)
         extract_dict = extract_result.model_dump()
         
         # Ensure schema field is present as expected by hakem
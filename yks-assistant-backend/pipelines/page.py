@@ -0,0 +1,58 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, List
+from ingest import generate_request_id, ProcessedImage
+from pipelines.solve import solve_pipeline
+from pipelines.measure import measure_pipeline
+from config import PAGE_PARALLELISM
+import metrics
+
+# ------------------------------------------------------------------------
+# MAIN PIPELINE
+# ------------------------------------------------------------------------
+
+async def page_pipeline(questions: List[ProcessedImage], pipeline: Callable[[ProcessedImage], Awaitable[dict]], name: str) -> dict:
+    """
+    Runs a per-question pipeline over every question cropped from a test
+    page, at most PAGE_PARALLELISM at a time. Results come back in page
+    order; one failed question does not fail the page.
+    """
+    req_id = generate_request_id()
+
+    if not questions:
+        return {
+            "req_id": req_id,
+            "status": "error",
+            "message": "Sayfada soru bulunamadı. Lütfen sayfanın tamamını net bir şekilde çekin."
+        }
+
+    slots = asyncio.Semaphore(PAGE_PARALLELISM)
+
+    async def run(index: int, image: ProcessedImage) -> dict:
+        async with slots:
+            result = await pipeline(image)
+        return {"index": index, **result}
+
+    t0 = time.perf_counter()
+    # gather keeps argument order, so results are already in page order
+    results = await asyncio.gather(*(run(i + 1, image) for i, image in enumerate(questions)))
+    succeeded = sum(1 for r in results if r.get("status") == "success")
+
+    metrics.incr(f"page.{name}.questions", len(results))
+    metrics.incr(f"page.{name}.failed", len(results) - succeeded)
+    print(f"[PAGE] req_id={req_id} pipeline={name} questions={len(results)} ok={succeeded} latency={(time.perf_counter() - t0) * 1000:.0f}ms")
+
+    return {
+        "req_id": req_id,
+        "status": "success" if succeeded else "error",
+        "question_count": len(results),
+        "questions": results
+    }
+
+
+async def solve_page_pipeline(questions: List[ProcessedImage]) -> dict:
+    return await page_pipeline(questions, solve_pipeline, "solve")
+
+
+async def measure_page_pipeline(questions: List[ProcessedImage]) -> dict:
+    return await page_pipeline(questions, measure_pipeline, "measure")
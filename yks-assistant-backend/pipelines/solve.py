@@ -1,34 +1,24 @@
-import base64
+import asyncio
 import json
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
 from schemas_contracts.models import ExtractV1, SolveV1
-from contract_guard import run_with_contract_guard
-from ingest import generate_request_id
-from config import SOLVE_API_KEY, TOGETHER_API_KEY, EXTRACT_API_KEY, EXTRACT_MODEL_ID
+from contract_guard import run_with_contract_guard, PartialCallback
+from ingest import generate_request_id, ProcessedImage
+from pipelines.extract import extract_step
+from pipelines.hakem.standardizer import standardize
+from pipelines.hakem.difficulty import estimate_difficulty, DifficultyEstimate
+from logic.answer_bank import answer_bank
+from config import (PIPELINE_ROUTES, HEDGE_AFTER_MS, SOLVE_PIPELINED, SOLVE_ENSEMBLE_TEMPERATURES,
+                    SOLVE_ROUTING, SOLVE_FAST_MAX_DIFFICULTY, SOLVE_ESCALATE_BELOW_CONFIDENCE)
+import metrics
 
 # ------------------------------------------------------------------------
 # PROMPTS
 # ------------------------------------------------------------------------
 
-VLM_SYSTEM_PROMPT = """
-You are a VLM Extractor. Your job is to extract the question, choices, and relevant details from the image into a structured JSON format.
-Return ONLY valid JSON matching this exact structure:
-{
-  "schema": "extract_v1",
-  "id": "q_001",
-  "question_text": "...",
-  "choices": {
-    "A": "...",
-    "B": "...",
-    "C": "...",
-    "D": "...",
-    "E": "..."
-  },
-  "figures_desc": "Varsa şekil / grafik / tablo açıklaması",
-  "topic_hint": "opsiyonel",
-  "constraints": ["opsiyonel"]
-}
-"""
-
 SOLVER_SYSTEM_PROMPT = """
 You are a master Math/Science Solver for TYT/AYT exams.
 Given a structured question JSON, solve it step-by-step.
@@ -49,59 +39,313 @@ Return ONLY valid JSON matching this schema:
 """
 
 # ------------------------------------------------------------------------
-# PIPELINE STEPS
+# SOLVER INPUT
 # ------------------------------------------------------------------------
 
-async def extract_step(image_bytes: bytes, request_id: str) -> ExtractV1:
-    image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-    
-    return await run_with_contract_guard(
-        prompt=VLM_SYSTEM_PROMPT,
-        api_key=EXTRACT_API_KEY,
-        image_b64=image_b64,
-        output_model=ExtractV1,
-        pipeline_name="solve",
-        model_name="qwen3_thinking_v1",
-        request_id=request_id,
-        model=EXTRACT_MODEL_ID
-    )
+# Extraction fields the solver needs. They stream first, so the solver can
+# start before topic_hint / constraints / notes have been written.
+CORE_FIELDS = ("question_text", "choices", "figures_desc")
+
+_WORD = re.compile(r"\w+")
+
+
+def _restates(constraint: str, question_text: str) -> bool:
+    """True when (nearly) every word of the constraint already appears in the question."""
+    words = _WORD.findall(constraint.casefold())
+    if not words:
+        return True
+    question_words = set(_WORD.findall(question_text.casefold()))
+    return sum(word in question_words for word in words) >= 0.8 * len(words)
+
 
-async def solve_step(extract_data: ExtractV1, request_id: str) -> SolveV1:
+def solver_view(extract_data: ExtractV1) -> Dict[str, Any]:
+    """
+    The part of an extraction the solver sees: the core fields, plus any
+    constraint that is not already stated in the question text.
+    """
+    view = extract_data.model_dump(include=set(CORE_FIELDS))
+    view["constraints"] = [c for c in extract_data.constraints or [] if not _restates(c, extract_data.question_text)]
+    return view
+
+# ------------------------------------------------------------------------
+# DIFFICULTY ROUTING
+# ------------------------------------------------------------------------
+
+# tier -> (PIPELINE_ROUTES key, model name for logs)
+SOLVER_TIERS = {
+    "fast": ("solve_fast", "fast_solver"),
+    "full": ("solve", "together_solver_v1"),
+}
+
+
+def solver_tier(extract_data: ExtractV1) -> Tuple[str, Optional[DifficultyEstimate]]:
+    """
+    ("fast" | "full", estimate) from the local hakem difficulty estimate.
+    With SOLVE_ROUTING off there is nothing to decide: ("full", None).
+    """
+    if not SOLVE_ROUTING:
+        return "full", None
+    estimate = estimate_difficulty(standardize(extract_data.model_dump()), extract_data.topic_hint)
+    tier = "fast" if estimate.score <= SOLVE_FAST_MAX_DIFFICULTY else "full"
+    return tier, estimate
+
+
+def _log_route(request_id: str, tier: str, estimate: Optional[DifficultyEstimate], started: float, outcome: str) -> None:
+    latency = (time.perf_counter() - started) * 1000
+    metrics.incr(f"solve.route.{tier}")
+    metrics.incr(f"solve.route.{tier}.ms_total", latency)
+    difficulty = f" difficulty={estimate.score:.2f}" if estimate is not None else ""
+    signals = f" signals={estimate.to_dict()['signals']}" if estimate is not None else ""
+    print(f"[ROUTE] req_id={request_id} tier={tier}{difficulty} latency={latency:.0f}ms {outcome}{signals}")
+
+# ------------------------------------------------------------------------
+# PIPELINE STEPS
+# ------------------------------------------------------------------------
+
+def _solve_prompt(extract_data: ExtractV1) -> str:
     # Serialize extraction result to text for the solver
-    problem_str = json.dumps(extract_data.model_dump(), ensure_ascii=False, indent=2)
-    prompt = f"{SOLVER_SYSTEM_PROMPT}\n\nProblem Data:\n{problem_str}"
-    
+    problem_str = json.dumps(solver_view(extract_data), ensure_ascii=False, indent=2)
+    return f"{SOLVER_SYSTEM_PROMPT}\n\nProblem Data:\n{problem_str}"
+
+
+def _decided(votes: Counter, remaining: int) -> Optional[str]:
+    """The answer that no outcome of the `remaining` calls can overtake, if any."""
+    ranked = votes.most_common(2)
+    if not ranked:
+        return None
+    leader, top = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0
+    return leader if top > runner_up + remaining else None
+
+
+async def ensemble_solve_step(extract_data: ExtractV1, request_id: str, on_event: Optional[PartialCallback] = None) -> SolveV1:
+    """
+    Self-consistency solve: one solver call per SOLVE_ENSEMBLE_TEMPERATURES,
+    majority vote on final_answer. Calls still streaming are cancelled as
+    soon as they can no longer change the winner, so an easy question costs
+    about as much wall-clock time as the fastest majority. Returns the most
+    confident winning solution with confidence = its share of the votes.
+    """
+    emit = on_event or (lambda event, data: None)
+    prompt = _solve_prompt(extract_data)
+    t0 = time.perf_counter()
+
+    pending = {
+        asyncio.create_task(run_with_contract_guard(
+            prompt=prompt,
+            output_model=SolveV1,
+            pipeline_name="solve",
+            model_name="together_solver_v1",
+            request_id=request_id,
+            routes=PIPELINE_ROUTES["solve"],  # failover only: the ensemble is its own hedge
+            temperature=temperature
+        ))
+        for temperature in SOLVE_ENSEMBLE_TEMPERATURES
+    }
+    votes: Counter = Counter()
+    best: Dict[str, SolveV1] = {}
+    winner, last_error = None, None
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    last_error = task.exception()
+                    continue
+                solution = task.result()
+                votes[solution.final_answer] += 1
+                current = best.get(solution.final_answer)
+                if current is None or (solution.confidence or 0) > (current.confidence or 0):
+                    best[solution.final_answer] = solution
+                emit("vote", {"answer": solution.final_answer, "votes": dict(votes)})
+            winner = _decided(votes, len(pending))
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    if not votes:
+        raise last_error
+    if winner is None:
+        # Every call finished with a tie: the more confident solution wins
+        winner = max(votes, key=lambda answer: (votes[answer], best[answer].confidence or 0))
+
+    cast = sum(votes.values())
+    metrics.incr("solve.ensemble.runs")
+    metrics.incr("solve.ensemble.calls_cancelled", len(pending))
+    print(f"[ENSEMBLE] req_id={request_id} answer={winner} votes={dict(votes)} calls={cast}/{len(SOLVE_ENSEMBLE_TEMPERATURES)} cancelled={len(pending)} latency={(time.perf_counter() - t0) * 1000:.0f}ms")
+    return best[winner].model_copy(update={"confidence": round(votes[winner] / cast, 2)})
+
+
+async def _solve_on(tier: str, prompt: str, request_id: str, on_partial: Optional[PartialCallback]) -> SolveV1:
+    routes, model_name = SOLVER_TIERS[tier]
     return await run_with_contract_guard(
         prompt=prompt,
-        api_key=TOGETHER_API_KEY, # Using Together API Key
         output_model=SolveV1,
         pipeline_name="solve",
-        model_name="together_solver_v1",
+        model_name=model_name,
         request_id=request_id,
-        use_together=True # Routing to Together AI
+        routes=PIPELINE_ROUTES[routes], # Primary first, the rest as hedge/failover
+        hedge_after_ms=HEDGE_AFTER_MS["solve"],
+        on_partial=on_partial
     )
 
+
+async def solve_step(extract_data: ExtractV1, request_id: str, on_partial: Optional[PartialCallback] = None, ensemble: bool = False,
+                     routed: bool = True) -> SolveV1:
+    """
+    Easy questions (see solver_tier) go to the fast solver; its answer is
+    escalated to the full model when the fast call fails or its confidence
+    is below SOLVE_ESCALATE_BELOW_CONFIDENCE. `ensemble` always votes on
+    the full model; `routed=False` pins the call to the full model.
+    """
+    if ensemble:
+        return await ensemble_solve_step(extract_data, request_id, on_partial)
+    prompt = _solve_prompt(extract_data)
+    tier, estimate = solver_tier(extract_data) if routed else ("full", None)
+
+    started = time.perf_counter()
+    if tier == "fast":
+        try:
+            result = await _solve_on("fast", prompt, request_id, on_partial)
+            escalate = None if (result.confidence or 0) >= SOLVE_ESCALATE_BELOW_CONFIDENCE else f"confidence={result.confidence}"
+        except Exception as e:
+            escalate = f"error={e}"
+        _log_route(request_id, "fast", estimate, started, f"escalate={escalate}" if escalate else f"confidence={result.confidence}")
+        if escalate is None:
+            return result
+        metrics.incr("solve.route.escalated")
+        if on_partial is not None:
+            on_partial("reset", {})
+        started = time.perf_counter()
+
+    result = await _solve_on("full", prompt, request_id, on_partial)
+    _log_route(request_id, "full", estimate, started, f"confidence={result.confidence} escalated={tier == 'fast'}")
+    return result
+
+async def pipelined_solve(image: ProcessedImage, req_id: str, on_event: Optional[PartialCallback], ensemble: bool = False) -> tuple:
+    """
+    Extract -> solve with the two calls overlapped. The solver starts
+    speculatively once the core fields have streamed out of the extraction.
+    When the finished extraction shows the solver a different problem (a
+    retried extraction, or constraints the question text does not state) or
+    moves it to another solver tier, the speculative solve is cancelled and
+    reissued.
+    The answer bank is checked on the same partial extraction: a bank
+    question is answered from the bank and no solver call is started.
+    Returns (ExtractV1, SolveV1, answer bank match info or None).
+    """
+    emit = on_event or (lambda event, data: None)
+    fields: Dict[str, Any] = {}
+    speculative: Dict[str, Any] = {}  # "bank" once looked up, "extract" / "task" once started
+
+    def on_extract(event: str, data: Dict[str, Any]) -> None:
+        if event == "reset":
+            fields.clear()
+        elif event == "field":
+            fields[data["field"]] = data["value"]
+        if speculative or not all(key in fields for key in CORE_FIELDS):
+            return
+        try:
+            partial = ExtractV1.model_validate(fields)
+        except Exception:
+            return  # wait for the full extraction
+        bank_hit = answer_bank.match(partial, req_id)
+        speculative["bank"] = (partial, bank_hit)
+        if bank_hit is not None:
+            return
+        metrics.incr("solve.speculative.started")
+        print(f"[SPECULATE] req_id={req_id} core fields ready, starting solver before extraction completes")
+        emit("stage", {"req_id": req_id, "stage": "solving"})
+        speculative["extract"] = partial
+        speculative["tier"] = solver_tier(partial)[0]
+        speculative["task"] = asyncio.create_task(solve_step(partial, req_id, on_event, ensemble))
+
+    try:
+        extract_result = await extract_step(image, req_id, on_extract)
+        emit("extracted", extract_result.model_dump())
+
+        # The bank only looks at question_text / choices: no second lookup if those did not change
+        partial, bank_hit = speculative.pop("bank", (None, None))
+        if partial is None or (partial.question_text, partial.choices) != (extract_result.question_text, extract_result.choices):
+            bank_hit = answer_bank.match(extract_result, req_id)
+        task = speculative.pop("task", None)
+        if bank_hit is not None:
+            if task is not None:
+                task.cancel()
+                emit("reset", {})
+            emit("answer_bank", bank_hit[1])
+            return extract_result, bank_hit[0], bank_hit[1]
+
+        # topic_hint arrives late and can move the question to another solver tier
+        if task is not None and solver_view(extract_result) == solver_view(speculative["extract"]) \
+                and solver_tier(extract_result)[0] == speculative["tier"]:
+            metrics.incr("solve.speculative.used")
+            return extract_result, await task, None
+
+        if task is not None:
+            task.cancel()
+            metrics.incr("solve.speculative.reissued")
+            print(f"[SPECULATE] req_id={req_id} extraction changed the problem or its solver tier, reissuing solve")
+            emit("reset", {})
+        else:
+            emit("stage", {"req_id": req_id, "stage": "solving"})
+        return extract_result, await solve_step(extract_result, req_id, on_event, ensemble), None
+    finally:
+        # Also stops a speculative solve started by a late extraction event
+        speculative["closed"] = True
+        task = speculative.pop("task", None)
+        if task is not None and not task.done():
+            task.cancel()
+
 # ------------------------------------------------------------------------
 # MAIN PIPELINE
 # ------------------------------------------------------------------------
 
-async def solve_pipeline(image_bytes: bytes) -> dict:
+async def solve_pipeline(image: ProcessedImage, on_event: Optional[PartialCallback] = None, ensemble: bool = False) -> dict:
+    """
+    `on_event(event, data)` receives progress for streaming clients: stage
+    events, the extraction once it is done, then the solution's partial
+    output (steps as they are written) from the contract guard.
+    `ensemble` solves with a self-consistency vote (ensemble_solve_step);
+    its stream reports "vote" events instead of steps.
+    Questions found in the answer bank skip the solver; the response then
+    carries "answer_bank": {"id", "score"}.
+    """
     req_id = generate_request_id()
+    emit = on_event or (lambda event, data: None)
     
     try:
-        # 1. Extract
-        extract_result = await extract_step(image_bytes, req_id)
-        
-        # 2. Solve
-        solve_result = await solve_step(extract_result, req_id)
+        emit("stage", {"req_id": req_id, "stage": "extracting"})
+        if SOLVE_PIPELINED:
+            # 1 + 2 overlapped: the solver starts on the partial extraction
+            extract_result, solve_result, bank_hit = await pipelined_solve(image, req_id, on_event, ensemble)
+        else:
+            # 1. Extract
+            extract_result = await extract_step(image, req_id)
+            emit("extracted", extract_result.model_dump())
+
+            # 2. Solve (stored solution for bank questions)
+            found = answer_bank.match(extract_result, req_id)
+            if found is not None:
+                solve_result, bank_hit = found
+                emit("answer_bank", bank_hit)
+            else:
+                bank_hit = None
+                emit("stage", {"req_id": req_id, "stage": "solving"})
+                solve_result = await solve_step(extract_result, req_id, on_event, ensemble)
         
         # 3. Format Response (UI Ready)
-        return {
+        response = {
             "req_id": req_id,
             "status": "success",
             "extracted": extract_result.model_dump(),
             "solution": solve_result.model_dump()
         }
+        if bank_hit is not None:
+            response["answer_bank"] = bank_hit
+        return response
         
     except Exception as e:
         print(f"[ERROR] Pipeline failed: {e}")
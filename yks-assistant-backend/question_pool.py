@@ -0,0 +1,223 @@
+"""
+Pool of generated questions that already passed validation, per
+(topic, difficulty), stored in SQLite under data/ so it survives restarts.
+
+/generate takes questions from the pool first and only generates what is
+missing. A background worker (pipelines/generate.py: pool_refill_loop)
+tops up every recently requested key whose depth falls below the low
+watermark.
+
+A pooled question is served to several students: each is retired after
+QUESTION_POOL_MAX_SERVES serves or QUESTION_POOL_MAX_AGE_SECONDS, and a
+per-user seen-set keeps one student from getting the same question twice.
+
+Only keys with a question bank topic and a QUESTION_POOL_DIFFICULTIES value
+are pooled, so arbitrary client strings never become background work. A key
+whose refill adds nothing is backed off exponentially and evicted after
+QUESTION_POOL_MAX_FAILURES failures in a row.
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from schemas_contracts.models import GeneratedQuestion
+import metrics
+from config import (QUESTION_POOL_DB_PATH, QUESTION_POOL_LOW_WATERMARK, QUESTION_POOL_MAX_SERVES,
+                    QUESTION_POOL_MAX_AGE_SECONDS, QUESTION_POOL_KEY_TTL_SECONDS, QUESTION_POOL_DIFFICULTIES,
+                    QUESTION_POOL_RETRY_BASE_SECONDS, QUESTION_POOL_MAX_FAILURES)
+from logic.anchor_selector import known_topics
+
+
+class QuestionPool:
+    def __init__(self, db_path: str = QUESTION_POOL_DB_PATH):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.refill_wanted = asyncio.Event()
+        self._started_at = time.time()
+
+    # --- storage (runs in worker threads) -------------------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS question_pool ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT, difficulty TEXT,"
+                " payload TEXT, created_at REAL, served INTEGER DEFAULT 0)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pool_key ON question_pool(topic, difficulty)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS question_pool_seen ("
+                " user_id TEXT, question_id INTEGER, seen_at REAL, PRIMARY KEY (user_id, question_id))"
+            )
+            # Keys the refill worker keeps warm, by last request time; failed
+            # refills push retry_at back
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS question_pool_keys ("
+                " topic TEXT, difficulty TEXT, requested_at REAL, failures INTEGER DEFAULT 0,"
+                " retry_at REAL DEFAULT 0, PRIMARY KEY (topic, difficulty))"
+            )
+        return self._conn
+
+    def _take(self, topic: str, difficulty: str, count: int, user_id: Optional[str]) -> Tuple[List[Tuple[int, str]], int]:
+        """(rows taken, depth left for the key)."""
+        now = time.time()
+        with self._db_lock:
+            db = self._db()
+            db.execute(
+                "INSERT INTO question_pool_keys (topic, difficulty, requested_at) VALUES (?, ?, ?)"
+                " ON CONFLICT (topic, difficulty) DO UPDATE SET requested_at = excluded.requested_at",
+                (topic, difficulty, now)
+            )
+            # Least-served first, so the pool rotates evenly
+            rows = db.execute(
+                "SELECT id, payload FROM question_pool"
+                " WHERE topic = ? AND difficulty = ? AND served < ? AND created_at > ?"
+                " AND id NOT IN (SELECT question_id FROM question_pool_seen WHERE user_id = ?)"
+                " ORDER BY served, id LIMIT ?",
+                (topic, difficulty, QUESTION_POOL_MAX_SERVES, now - QUESTION_POOL_MAX_AGE_SECONDS, user_id or "", count)
+            ).fetchall()
+            ids = [(question_id,) for question_id, _ in rows]
+            db.executemany("UPDATE question_pool SET served = served + 1 WHERE id = ?", ids)
+            if user_id:
+                db.executemany("INSERT OR IGNORE INTO question_pool_seen (user_id, question_id, seen_at) VALUES (?, ?, ?)",
+                               [(user_id, question_id, now) for (question_id,) in ids])
+            (depth,) = db.execute(
+                "SELECT COUNT(*) FROM question_pool WHERE topic = ? AND difficulty = ? AND served < ? AND created_at > ?",
+                (topic, difficulty, QUESTION_POOL_MAX_SERVES, now - QUESTION_POOL_MAX_AGE_SECONDS)
+            ).fetchone()
+            db.commit()
+        return rows, depth
+
+    def _add(self, topic: str, difficulty: str, payloads: List[str], user_id: Optional[str], served: bool) -> None:
+        now = time.time()
+        with self._db_lock:
+            db = self._db()
+            for payload in payloads:
+                cursor = db.execute(
+                    "INSERT INTO question_pool (topic, difficulty, payload, created_at, served) VALUES (?, ?, ?, ?, ?)",
+                    (topic, difficulty, payload, now, int(served))
+                )
+                if user_id:
+                    db.execute("INSERT OR IGNORE INTO question_pool_seen (user_id, question_id, seen_at) VALUES (?, ?, ?)",
+                               (user_id, cursor.lastrowid, now))
+            db.commit()
+
+    def _low_keys(self) -> List[Tuple[str, str, int]]:
+        now = time.time()
+        with self._db_lock:
+            db = self._db()
+            # Retire used-up and stale questions first, so they do not count toward depth
+            db.execute("DELETE FROM question_pool WHERE served >= ? OR created_at <= ?",
+                       (QUESTION_POOL_MAX_SERVES, now - QUESTION_POOL_MAX_AGE_SECONDS))
+            db.execute("DELETE FROM question_pool_seen WHERE question_id NOT IN (SELECT id FROM question_pool)")
+            db.execute("DELETE FROM question_pool_keys WHERE requested_at <= ?", (now - QUESTION_POOL_KEY_TTL_SECONDS,))
+            db.commit()
+            rows = db.execute(
+                "SELECT k.topic, k.difficulty, COUNT(p.id) FROM question_pool_keys k"
+                " LEFT JOIN question_pool p ON p.topic = k.topic AND p.difficulty = k.difficulty"
+                " WHERE k.retry_at <= ? GROUP BY k.topic, k.difficulty",
+                (now,)
+            ).fetchall()
+        return [(topic, difficulty, depth) for topic, difficulty, depth in rows if depth < QUESTION_POOL_LOW_WATERMARK]
+
+    def _record_refill(self, topic: str, difficulty: str, added: int) -> Tuple[int, float]:
+        """(failures in a row, seconds until the next try); failures past the cap evict the key."""
+        with self._db_lock:
+            db = self._db()
+            if added:
+                db.execute("UPDATE question_pool_keys SET failures = 0, retry_at = 0 WHERE topic = ? AND difficulty = ?",
+                           (topic, difficulty))
+                db.commit()
+                return 0, 0.0
+            row = db.execute("SELECT failures FROM question_pool_keys WHERE topic = ? AND difficulty = ?",
+                             (topic, difficulty)).fetchone()
+            failures = (row[0] if row else 0) + 1
+            backoff = QUESTION_POOL_RETRY_BASE_SECONDS * 2 ** (failures - 1)
+            if failures >= QUESTION_POOL_MAX_FAILURES:
+                db.execute("DELETE FROM question_pool_keys WHERE topic = ? AND difficulty = ?", (topic, difficulty))
+            else:
+                db.execute("UPDATE question_pool_keys SET failures = ?, retry_at = ? WHERE topic = ? AND difficulty = ?",
+                           (failures, time.time() + backoff, topic, difficulty))
+            db.commit()
+        return failures, backoff
+
+    def _stats(self) -> Dict[str, float]:
+        with self._db_lock:
+            depth, keys, oldest = self._db().execute(
+                "SELECT COUNT(*), COUNT(DISTINCT topic || '|' || difficulty), MIN(created_at) FROM question_pool"
+            ).fetchone()
+        return {"depth": depth, "keys": keys, "oldest_age_s": round(time.time() - oldest, 1) if oldest else 0.0}
+
+    # --- public API -----------------------------------------------------------
+
+    @staticmethod
+    def poolable(topic: str, difficulty: str) -> bool:
+        """True for keys the pool keeps: a question bank topic and a known difficulty."""
+        return difficulty in QUESTION_POOL_DIFFICULTIES and topic in known_topics()
+
+    async def take(self, topic: str, difficulty: str, count: int, user_id: Optional[str] = None) -> List[GeneratedQuestion]:
+        """
+        Up to `count` pooled questions `user_id` has not seen; wakes the
+        refill worker when the key drops below the low watermark.
+        """
+        if not self.poolable(topic, difficulty):
+            return []
+        try:
+            rows, depth = await asyncio.to_thread(self._take, topic, difficulty, count, user_id)
+        except sqlite3.Error as e:
+            print(f"[POOL] read failed: {e}")
+            rows, depth = [], 0
+        metrics.incr("question_pool.served", len(rows))
+        metrics.incr("question_pool.missed", count - len(rows))
+        if depth < QUESTION_POOL_LOW_WATERMARK:
+            self.refill_wanted.set()
+        return [GeneratedQuestion.model_validate_json(payload) for _, payload in rows]
+
+    async def add(self, topic: str, difficulty: str, questions: List[GeneratedQuestion],
+                  user_id: Optional[str] = None, served: bool = False) -> None:
+        """
+        Stores validated questions. `served`: they were generated for a
+        request and already returned to it (to `user_id`, if known).
+        """
+        if not self.poolable(topic, difficulty):
+            return
+        payloads = [question.model_dump_json(by_alias=True) for question in questions]
+        try:
+            await asyncio.to_thread(self._add, topic, difficulty, payloads, user_id, served)
+        except sqlite3.Error as e:
+            print(f"[POOL] write failed: {e}")
+
+    async def low_keys(self) -> List[Tuple[str, str, int]]:
+        """(topic, difficulty, depth) of every recently requested key below the low watermark."""
+        return await asyncio.to_thread(self._low_keys)
+
+    async def record_refill(self, topic: str, difficulty: str, added: int) -> Tuple[int, float]:
+        """Resets the key's backoff after a refill that added questions, extends it otherwise."""
+        return await asyncio.to_thread(self._record_refill, topic, difficulty, added)
+
+    def stats(self) -> Dict[str, float]:
+        """Depth / age gauges plus the refill rate, for /metrics."""
+        try:
+            stats = self._stats()
+        except sqlite3.Error as e:
+            print(f"[POOL] stats failed: {e}")
+            stats = {}
+        refilled = metrics.snapshot().get("question_pool.refilled", 0)
+        minutes = max(1e-9, (time.time() - self._started_at) / 60)
+        return {**{f"question_pool.{name}": value for name, value in stats.items()},
+                "question_pool.refill_per_min": round(refilled / minutes, 2)}
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+question_pool = QuestionPool()
@@ -0,0 +1,145 @@
+"""
+Per-provider, per-key admission control for LLM calls.
+
+Each (provider, api_key) pair gets a ProviderLimiter that combines:
+- a semaphore-style cap on in-flight streams
+- a requests/min token bucket
+- a tokens/min token bucket (prompt estimate on admission, output on completion)
+
+The effective rate and concurrency adapt AIMD-style: a 429 halves them and
+blocks new calls until Retry-After has passed; successes add them back
+roughly one slot at a time toward the configured ceiling.
+"""
+
+import asyncio
+import hashlib
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+from config import RATE_LIMITS, RATE_LIMIT_MIN_SCALE, RATE_LIMIT_DEFAULT_BACKOFF
+
+
+class TokenBucket:
+    """
+    Continuous-refill token bucket. The balance may go negative when usage is
+    charged after the fact; admissions then wait until it has refilled.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.balance = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self, rate_scale: float) -> None:
+        now = time.monotonic()
+        rate = self.per_minute * rate_scale / 60.0
+        self.balance = min(self.capacity, self.balance + (now - self._updated) * rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, rate_scale: float) -> float:
+        """Seconds until `amount` is available (0 if available now)."""
+        self._refill(rate_scale)
+        needed = min(amount, self.capacity) - self.balance
+        if needed <= 0:
+            return 0.0
+        return needed / (self.per_minute * rate_scale / 60.0)
+
+    def consume(self, amount: float) -> None:
+        self.balance -= amount
+
+
+class ProviderLimiter:
+    """Admission layer for a single provider + API key."""
+
+    def __init__(self, name: str, max_concurrency: int, rpm: float, tpm: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate_scale = 1.0
+        self._cond = asyncio.Condition()
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._blocked_until = 0.0
+        self.in_flight = 0
+        self.rate_limited_count = 0
+
+    @property
+    def concurrency_limit(self) -> int:
+        return max(1, int(self.max_concurrency * self.rate_scale))
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int):
+        """Holds a concurrency slot for the duration of one streamed call."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.concurrency_limit)
+            self.in_flight += 1
+        try:
+            await self._wait_for_budget(estimated_tokens)
+            yield self
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    async def _wait_for_budget(self, estimated_tokens: int) -> None:
+        while True:
+            wait = max(
+                self._blocked_until - time.monotonic(),
+                self._requests.wait_time(1, self.rate_scale),
+                self._tokens.wait_time(estimated_tokens, self.rate_scale),
+            )
+            if wait <= 0:
+                self._requests.consume(1)
+                self._tokens.consume(estimated_tokens)
+                return
+            await asyncio.sleep(wait)
+
+    def charge_tokens(self, tokens: int) -> None:
+        """Charges output tokens once they are known."""
+        self._tokens.consume(tokens)
+
+    def on_success(self) -> None:
+        # Congestion-avoidance style recovery: about one slot back per
+        # `concurrency_limit` successful calls.
+        if self.rate_scale < 1.0:
+            self.rate_scale = min(1.0, self.rate_scale + 1 / (self.max_concurrency * self.concurrency_limit))
+
+    def on_rate_limited(self, retry_after: Optional[float]) -> float:
+        """Backs off after a 429. Returns the pause applied (seconds)."""
+        self.rate_limited_count += 1
+        now = time.monotonic()
+        # The first 429 of an overload event halves the rate; further 429s from
+        # calls admitted before the back-off each give up one more slot.
+        if now >= self._blocked_until:
+            self.rate_scale = max(RATE_LIMIT_MIN_SCALE, self.rate_scale / 2)
+        else:
+            self.rate_scale = max(RATE_LIMIT_MIN_SCALE, self.rate_scale - 1 / self.max_concurrency)
+        pause = retry_after if retry_after is not None else RATE_LIMIT_DEFAULT_BACKOFF
+        self._blocked_until = max(self._blocked_until, now + pause)
+        print(f"[RATE] {self.name} 429 received: pausing {pause:.1f}s, rate scale -> {self.rate_scale:.2f} (concurrency {self.concurrency_limit})")
+        return pause
+
+
+_limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+
+
+def get_limiter(provider: str, api_key: str) -> ProviderLimiter:
+    """Returns the shared limiter for (provider, api_key), creating it on first use."""
+    key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+    limiter = _limiters.get((provider, key_id))
+    if limiter is None:
+        limits = RATE_LIMITS[provider]
+        limiter = ProviderLimiter(
+            name=f"{provider}:{key_id}",
+            max_concurrency=limits["max_concurrency"],
+            rpm=limits["rpm"],
+            tpm=limits["tpm"],
+        )
+        _limiters[(provider, key_id)] = limiter
+    return limiter
+
+
+def estimate_tokens(text: str, has_image: bool = False) -> int:
+    """Rough prompt token estimate (~4 chars/token, flat cost per image)."""
+    return len(text) // 4 + (1000 if has_image else 0)
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Form, UploadFile, File, HTTPException
-from typing import Optional
+from typing import List, Optional
 from schemas_contracts.models import ExtractV1, SolveV1, GenerateV1, CoachV1
 from pipelines.solve import solve_pipeline
 from pipelines.generate import generate_pipeline
@@ -7,31 +7,35 @@ from pipelines.coach import coach_pipeline
 from pipelines.evaluate import evaluate_pipeline
 from pipelines.measure import measure_pipeline
 from pipelines.chat import chat_pipeline
+from pipelines.page import solve_page_pipeline, measure_page_pipeline
+from ingest import ProcessedImage
+from sse import Emit
 
 router = APIRouter()
 
 
 
-async def route_solve(image_bytes: bytes) -> dict:
+async def route_solve(image: ProcessedImage, on_event: Optional[Emit] = None, ensemble: bool = False) -> dict:
     """
     Routes the solve request to the Solve Pipeline.
-    Process: VLM Extractor -> Solver Model -> Post-process
+    Process: VLM Extractor -> Solver Model (or Solver Ensemble + Vote) -> Post-process
     """
-    return await solve_pipeline(image_bytes)
+    return await solve_pipeline(image, on_event, ensemble)
 
-async def route_generate(topic: str, difficulty: str) -> dict:
+async def route_generate(topic: str, difficulty: str, count: int = 1, on_event: Optional[Emit] = None,
+                         user_id: Optional[str] = None) -> dict:
     """
     Routes the generate request to the Generate Pipeline.
-    Process: Generator Model -> Validator
+    Process: Question Pool -> Generator Model -> Validator (a pool of both for count > 1)
     """
-    return await generate_pipeline(topic, difficulty)
+    return await generate_pipeline(topic, difficulty, count, on_event, user_id)
 
-async def route_coach(context: dict) -> dict:
+async def route_coach(context: dict, on_event: Optional[Emit] = None) -> dict:
     """
     Routes the coach request to the Coach Pipeline.
     Process: Coach LLM
     """
-    return await coach_pipeline(context)
+    return await coach_pipeline(context, on_event)
 
 async def route_evaluate(data: dict) -> dict:
     """
@@ -39,16 +43,30 @@ async def route_evaluate(data: dict) -> dict:
     """
     return await evaluate_pipeline(data)
 
-async def route_measure(image_bytes: bytes) -> dict:
+async def route_measure(image: ProcessedImage) -> dict:
     """
     Routes the measure request to the Measure Pipeline.
     Process: VLM Extractor -> Hakem Standardizer -> Hakem Scorer
     """
-    return await measure_pipeline(image_bytes)
+    return await measure_pipeline(image)
 
-async def route_chat(message: str, history: list, context: dict) -> dict:
+async def route_solve_page(questions: List[ProcessedImage]) -> dict:
+    """
+    Routes a whole test page to the Solve Pipeline, one question at a time.
+    Process: Page Segmenter -> (VLM Extractor -> Solver Model) per question
+    """
+    return await solve_page_pipeline(questions)
+
+async def route_measure_page(questions: List[ProcessedImage]) -> dict:
+    """
+    Routes a whole test page to the Measure Pipeline, one question at a time.
+    Process: Page Segmenter -> (VLM Extractor -> Hakem Standardizer -> Hakem Scorer) per question
+    """
+    return await measure_page_pipeline(questions)
+
+async def route_chat(message: str, history: list, context: dict, on_event: Optional[Emit] = None) -> dict:
     """
     Routes the chat request to the Chat Pipeline.
     """
-    return await chat_pipeline(message, history, context)
+    return await chat_pipeline(message, history, context, on_event)
 
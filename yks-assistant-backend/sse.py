@@ -0,0 +1,67 @@
+"""
+Server-Sent Events for the streaming endpoints.
+
+The pipeline runs as a task and reports progress through `emit(event, data)`
+(stage changes, validated fields, solution steps, text deltas). Each call
+becomes one SSE frame; the pipeline's response dict, identical to the
+non-streaming endpoint's, is always the last frame ("final").
+"""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict
+
+from fastapi.responses import StreamingResponse
+
+from config import SSE_KEEPALIVE_SECONDS
+import metrics
+
+Emit = Callable[[str, Dict[str, Any]], None]
+
+
+def format_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream_pipeline(run: Callable[[Emit], Awaitable[dict]], name: str) -> StreamingResponse:
+    """
+    Streams `run(emit)` as text/event-stream. The pipeline is cancelled if
+    the client disconnects before it finishes.
+    """
+    queue: "asyncio.Queue" = asyncio.Queue()
+
+    def emit(event: str, data: Dict[str, Any]) -> None:
+        queue.put_nowait((event, data))
+
+    async def events():
+        metrics.incr(f"sse.{name}.streams")
+        task = asyncio.create_task(run(emit))
+        # Runs after every emit of the task, so it always arrives last
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    break
+                yield format_event(*item)
+
+            if task.exception() is not None:
+                print(f"[ERROR] {name} stream failed: {task.exception()}")
+                yield format_event("final", {"status": "error", "message": "Beklenmeyen bir hata oluştu. Lütfen tekrar deneyin."})
+            else:
+                yield format_event("final", task.result())
+        finally:
+            if not task.done():
+                metrics.incr(f"sse.{name}.disconnected")
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Disable proxy buffering (nginx) so frames reach the client immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
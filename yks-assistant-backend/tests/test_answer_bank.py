@@ -0,0 +1,61 @@
+from logic.answer_bank import AnswerBank
+from logic.minhash_index import MinHashIndex, jaccard, normalize_text, shingles
+from schemas_contracts.models import ExtractV1
+
+STEM = ("Bir sınıftaki öğrencilerin 3/5'i kızdır. Kızların 1/4'ü gözlüklü olduğuna göre, "
+        "sınıftaki gözlüklü kız sayısı 6 ise sınıf mevcudu kaçtır?")
+CHOICES = {"A": "30", "B": "35", "C": "40", "D": "45", "E": "50"}
+OTHER = "Bir dikdörtgenin kısa kenarı 4 cm, uzun kenarı kısa kenarının 3 katıdır. Dikdörtgenin çevresi kaç cm'dir?"
+
+
+def test_index_scores_near_duplicates_and_misses_unrelated_texts():
+    index = MinHashIndex()
+    index.add("q1", STEM)
+    index.add("q2", OTHER)
+
+    assert index.best(STEM) == (1.0, "q1", None)
+    retyped = STEM.replace("öğrencilerin", "ogrencilerin").replace("?", "")
+    score, key, _ = index.best(retyped)
+    assert key == "q1" and 0.8 < score < 1.0
+    assert index.best("Bir trenin hızı saatte 80 km olduğuna göre 3 saatte kaç km yol alır?", min_score=0.5) is None
+
+
+def test_min_score_is_a_hard_threshold():
+    index = MinHashIndex()
+    index.add("q1", STEM)
+    retyped = STEM.replace("gözlüklü", "gözlük takan")
+    exact = jaccard(shingles(normalize_text(STEM)), shingles(normalize_text(retyped)))
+    assert index.best(retyped, min_score=exact)[0] == exact
+    assert index.best(retyped, min_score=exact + 1e-9) is None
+
+
+def test_empty_index_and_empty_text():
+    index = MinHashIndex()
+    assert index.query(STEM) == [] and index.best(STEM) is None
+    index.add("blank", "?!  ")
+    assert len(index) == 0
+    index.add("q1", STEM)
+    assert index.query("") == []
+
+
+def _bank() -> AnswerBank:
+    bank = AnswerBank(min_score=0.85)
+    bank.add("q1", STEM, list(CHOICES.values()), ["Sınıf 40 kişidir."], "40")
+    return bank
+
+
+def test_bank_answers_a_retyped_question_with_shuffled_choices():
+    shuffled = dict(zip("ABCDE", ["50", "40", "30", "45", "35"]))
+    solved, info = _bank().match(ExtractV1(question_text=STEM.replace("  ", " "), choices=shuffled))
+    assert solved.final_answer == "B" and solved.steps == ["Sınıf 40 kişidir."]
+    assert info["id"] == "q1" and info["score"] >= 0.85
+
+
+def test_bank_misses_changed_numbers_and_different_choices():
+    bank = _bank()
+    assert bank.match(ExtractV1(question_text=STEM.replace("6 ise", "9 ise"), choices=CHOICES)) is None
+    assert bank.match(ExtractV1(question_text=STEM, choices={**CHOICES, "E": "60"})) is None
+
+
+def test_empty_bank_matches_nothing():
+    assert AnswerBank().match(ExtractV1(question_text=STEM, choices=CHOICES)) is None
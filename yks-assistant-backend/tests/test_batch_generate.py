@@ -0,0 +1,40 @@
+import asyncio
+
+import pipelines.generate as generate_module
+from schemas_contracts.models import GenerateV1
+
+
+def _question(n: int) -> dict:
+    return {"problem_text": f"{n} + {n} kaçtır?", "answer_choices": {"A": str(2 * n), "B": "0"},
+            "correct_answer": "A", "solution": "topla"}
+
+
+def test_questions_validated_after_the_set_is_complete_are_pooled(monkeypatch):
+    generated = iter(range(1, 100))
+    pooled = []
+
+    async def fake_generate_step(topic, difficulty, request_id, anchors):
+        return GenerateV1(questions=[_question(next(generated))])
+
+    async def fake_validate(question, request_id):
+        return True
+
+    async def fake_add(topic, difficulty, questions, user_id=None, served=False):
+        pooled.extend(questions)
+
+    monkeypatch.setattr(generate_module, "generate_step", fake_generate_step)
+    monkeypatch.setattr(generate_module, "validate_with_solver", fake_validate)
+    monkeypatch.setattr(generate_module, "prefilter_question", lambda question, request_id, anchors: None)
+    monkeypatch.setattr(generate_module, "get_random_anchors", lambda topic, k: [])
+    monkeypatch.setattr(generate_module.question_pool, "add", fake_add)
+    monkeypatch.setattr(generate_module, "QUESTION_POOL_ENABLED", True)
+    monkeypatch.setattr(generate_module, "GENERATE_BATCH_SPARE", 1)
+    monkeypatch.setattr(generate_module, "GENERATE_BATCH_CONCURRENCY", 8)
+
+    accepted, candidates = asyncio.run(generate_module.batch_generate("oran - orantı", "medium", 2, "test"))
+
+    statuses = [candidate["status"] for candidate in candidates]
+    assert len(accepted) == 2
+    assert statuses.count("accepted") == 2 and statuses.count("surplus") == 1
+    assert "rejected" not in statuses
+    assert len(pooled) == 1 and pooled[0] not in accepted
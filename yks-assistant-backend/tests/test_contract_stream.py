@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+import contract_guard
+from contract_guard import ContractViolation, _StreamValidator, _attempt_route
+from json_stream import JsonStreamScanner, TokenLimitExceeded
+from schemas_contracts.models import EvalV1, SolveV1
+
+
+def _feed(text: str, chunk_size: int = 3, max_tokens=None, validator=None) -> JsonStreamScanner:
+    scanner = JsonStreamScanner(max_tokens=max_tokens)
+    for i in range(0, len(text), chunk_size):
+        done = scanner.feed(text[i:i + chunk_size])
+        if validator is not None:
+            validator.check(scanner)
+        if done:
+            break
+    return scanner
+
+
+# --- scanner -------------------------------------------------------------
+
+
+def test_scanner_stops_at_object_close_despite_prose_and_braces_in_strings():
+    obj = '{"steps": ["{x}", "a \\" } b"], "final_answer": "C"}'
+    scanner = _feed("Tabii, işte çözüm:\n```json\n" + obj + "\n``` Umarım yardımcı olur.")
+    assert scanner.complete
+    assert scanner.object_text() == obj
+    assert [key for key, _ in scanner.pop_members()] == ["steps", "final_answer"]
+
+
+def test_scanner_reports_value_starts_and_array_items():
+    scanner = _feed('{"steps": ["bir", "iki"], "confidence": 0.5}', chunk_size=1)
+    assert scanner.pop_value_starts() == [("steps", "["), ("confidence", "0")]
+    assert scanner.pop_items() == [("steps", 0, '"bir"'), ("steps", 1, '"iki"')]
+
+
+def test_scanner_enforces_max_tokens_before_close():
+    with pytest.raises(TokenLimitExceeded):
+        _feed('{"steps": ["' + "uzun " * 50, chunk_size=5, max_tokens=10)
+
+
+def test_scanner_object_closing_on_the_last_allowed_token_is_complete():
+    scanner = _feed('{"a": 1}', chunk_size=4, max_tokens=2)
+    assert scanner.complete and scanner.tokens == 2
+
+
+# --- validator -----------------------------------------------------------
+
+
+def test_validator_accepts_numeric_strings_like_the_model():
+    text = '{"steps": ["a"], "final_answer": "B", "confidence": "0.9"}'
+    _feed(text, validator=_StreamValidator(SolveV1))
+    assert SolveV1.model_validate_json(text).confidence == 0.9
+
+    _feed('{"scores": {"osym_similarity": "0.7", "difficulty": 0.4}, "short_justifications": ["x"]}',
+          validator=_StreamValidator(EvalV1))
+
+
+@pytest.mark.parametrize("text, message", [
+    ('{"steps": "tek adım", "final_answer": "B"}', "wrong JSON type"),
+    ('{"steps": ["a"], "final_answer": "F"}', "invalid 'final_answer'"),
+    ('{"steps": ["a"], "final_answer": "B", "confidence": [1]}', "wrong JSON type"),
+    ('{"steps": ["a"], "final_answer": "B", "confidence": 1.5}', "invalid 'confidence'"),
+    ('{"steps": ["a"], "final_answer": "B", "confidence": "çok"}', "invalid 'confidence'"),
+    ('{"steps": ["a"]}', "missing required keys: final_answer"),
+])
+def test_validator_rejects_contract_violations(text, message):
+    with pytest.raises(ContractViolation, match=message):
+        _feed(text, validator=_StreamValidator(SolveV1))
+
+
+def test_validator_rejects_long_prose_before_json():
+    with pytest.raises(ContractViolation, match="prose"):
+        _feed("Bu soruyu adım adım düşünelim. " * 20 + '{"steps": ["a"], "final_answer": "B"}', chunk_size=20,
+              validator=_StreamValidator(SolveV1))
+
+
+def test_reasoning_block_is_not_prose_and_its_braces_are_not_the_object():
+    think = "<think>\n" + "A = {1, 2, 3} kümesi için eleman sayısını bulalım. " * 20 + "</think>\n"
+    obj = '{"steps": ["a"], "final_answer": "B"}'
+    scanner = _feed(think + obj, chunk_size=7, validator=_StreamValidator(SolveV1))
+    assert scanner.object_text() == obj
+
+
+def test_unclosed_reasoning_block_is_not_prose():
+    scanner = _feed("<think>" + "düşünüyorum {x} " * 50, chunk_size=7, validator=_StreamValidator(SolveV1))
+    assert not scanner.started and scanner.preamble() == ""
+
+
+# --- live path: stream validator + repair --------------------------------
+
+
+def _attempt(monkeypatch, text: str, chunk_size: int = 5):
+    async def fake_call_route(route, **kwargs):
+        for i in range(0, len(text), chunk_size):
+            yield text[i:i + chunk_size]
+
+    monkeypatch.setattr(contract_guard, "call_route", fake_call_route)
+    return asyncio.run(_attempt_route({"provider": "test"}, "prompt", SolveV1, None, "image/jpeg", 2000, 0.6, asyncio.Event()))
+
+
+def test_single_quoted_output_is_repaired_on_the_live_path(monkeypatch):
+    solved = _attempt(monkeypatch, "{'steps': ['a','b'], 'final_answer': 'C'}")
+    assert solved.steps == ["a", "b"] and solved.final_answer == "C"
+
+
+def test_incomplete_strict_object_still_aborts_on_the_live_path(monkeypatch):
+    with pytest.raises(ContractViolation, match="missing required keys"):
+        _attempt(monkeypatch, '{"steps": ["a"]}')
+
+
+@pytest.mark.parametrize("text", [
+    '{"steps": ["a", "b"], "final_answer": "C", "confidence": None}',
+    "{\"steps\": ['a', 'b'], 'final_answer': \"C\", \"reasoning_checks\": None}",
+])
+def test_python_literals_and_quotes_in_strict_keys_are_repaired_on_the_live_path(monkeypatch, text):
+    solved = _attempt(monkeypatch, text)
+    assert solved.steps == ["a", "b"] and solved.final_answer == "C"
+
+
+def test_numeric_strings_and_python_literals_together(monkeypatch):
+    text = """{"steps": ['Türkiye\\'nin nüfusu'], "final_answer": 'D', "confidence": "0.8", "common_traps": None}"""
+    solved = _attempt(monkeypatch, text)
+    assert solved.steps == ["Türkiye'nin nüfusu"]
+    assert solved.final_answer == "D" and solved.confidence == 0.8 and solved.common_traps is None
+
+
+@pytest.mark.parametrize("text", [
+    '{"steps": ["a"], "final_answer": "B", "confidence": high}',
+    '{"steps": "tek adım", "final_answer": "B"}',
+])
+def test_unrepairable_types_still_abort_on_the_live_path(monkeypatch, text):
+    with pytest.raises(ContractViolation, match="wrong JSON type"):
+        _attempt(monkeypatch, text)
@@ -0,0 +1,38 @@
+from logic.copy_guard import CopyGuard
+
+BANK_TEXT = ("Bir manav elindeki elmaların 2/7'sini ilk gün, kalanın 1/5'ini ikinci gün satıyor. "
+             "Geriye 40 elma kaldığına göre manavın başlangıçta kaç elması vardır?")
+BANK_CHOICES = ["60", "70", "75", "80", "90"]
+
+
+def _guard() -> CopyGuard:
+    guard = CopyGuard(min_score=0.6)
+    guard.add("bank-1", BANK_TEXT, BANK_CHOICES)
+    guard.add("bank-2", "Ardışık üç çift sayının toplamı 48 ise en büyüğü kaçtır?", ["14", "16", "18", "20", "22"])
+    return guard
+
+
+def test_copied_bank_question_is_caught_with_reworded_stem_and_shuffled_choices():
+    copied = BANK_TEXT.replace("Bir manav", "Bir satıcı").replace("elmaların", "elmalarının")
+    found = _guard().check(copied, dict(zip("ABCDE", ["90", "60", "80", "70", "75"])))
+    assert found is not None
+    score, question_id = found
+    assert question_id == "bank-1" and score >= 0.6
+
+
+def test_novel_question_and_new_numbers_are_accepted():
+    guard = _guard()
+    novel = "Bir kitabın önce 1/3'ü, sonra kalanın yarısı okunuyor. Geriye 50 sayfa kaldığına göre kitap kaç sayfadır?"
+    assert guard.check(novel, dict(zip("ABCDE", ["120", "150", "180", "200", "240"]))) is None
+    # Same template, new numbers: a new question
+    assert guard.check(BANK_TEXT.replace("40 elma", "60 elma"), dict(zip("ABCDE", BANK_CHOICES))) is None
+
+
+def test_copy_of_an_anchor_is_caught_without_the_bank():
+    anchor = {"id": "anchor-7", "problem_text": BANK_TEXT, "choices": '["A) 60", "B) 70", "C) 75", "D) 80", "E) 90"]'}
+    found = CopyGuard().check(BANK_TEXT, dict(zip("ABCDE", BANK_CHOICES)), anchors=[anchor])
+    assert found == (1.0, "anchor-7")
+
+
+def test_empty_guard_accepts_everything():
+    assert CopyGuard().check(BANK_TEXT, dict(zip("ABCDE", BANK_CHOICES))) is None
@@ -0,0 +1,79 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+import pipelines.solve as solve_module
+from pipelines.solve import _decided, ensemble_solve_step
+from schemas_contracts.models import ExtractV1, SolveV1
+
+QUESTION = ExtractV1(question_text="2x = 6 ise x kaçtır?", choices={"A": "1", "B": "2", "C": "3"})
+
+
+def test_decided_needs_a_lead_the_remaining_calls_cannot_close():
+    assert _decided(Counter(), 5) is None
+    assert _decided(Counter({"C": 3}), 2) == "C"
+    assert _decided(Counter({"C": 2}), 2) is None
+    assert _decided(Counter({"C": 2, "D": 1}), 1) is None
+    assert _decided(Counter({"C": 3, "D": 1}), 1) == "C"
+    assert _decided(Counter({"C": 2, "D": 2}), 0) is None  # tie: left to confidence
+
+
+def _ensemble(monkeypatch, answers):
+    """answers[temperature] = (final_answer or an exception, confidence, delay seconds)."""
+    cancelled = []
+
+    async def fake_guard(temperature, **kwargs):
+        answer, confidence, delay = answers[temperature]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(temperature)
+            raise
+        if isinstance(answer, Exception):
+            raise answer
+        return SolveV1(steps=["x = 3"], final_answer=answer, confidence=confidence)
+
+    monkeypatch.setattr(solve_module, "SOLVE_ENSEMBLE_TEMPERATURES", list(answers))
+    monkeypatch.setattr(solve_module, "run_with_contract_guard", fake_guard)
+    return asyncio.run(ensemble_solve_step(QUESTION, "test")), cancelled
+
+
+def test_majority_wins_and_undecided_calls_are_cancelled(monkeypatch):
+    solved, cancelled = _ensemble(monkeypatch, {
+        0.2: ("C", 0.7, 0.01), 0.5: ("C", 0.9, 0.02), 0.7: ("D", 0.8, 0.03), 0.9: ("C", 0.6, 0.04), 1.0: ("D", 0.9, 5),
+    })
+    assert solved.final_answer == "C"
+    assert solved.confidence == 0.75  # 3 of the 4 votes cast
+    assert cancelled == [1.0]
+
+
+def test_stops_as_soon_as_the_outcome_is_decided(monkeypatch):
+    solved, cancelled = _ensemble(monkeypatch, {
+        0.2: ("B", 0.9, 0.01), 0.5: ("B", 0.9, 0.01), 0.7: ("B", 0.9, 0.01), 0.9: ("A", 0.9, 5), 1.0: ("A", 0.9, 5),
+    })
+    assert solved.final_answer == "B" and solved.confidence == 1.0
+    assert sorted(cancelled) == [0.9, 1.0]
+
+
+def test_tie_goes_to_the_more_confident_answer(monkeypatch):
+    solved, cancelled = _ensemble(monkeypatch, {
+        0.2: ("C", 0.6, 0.01), 0.5: ("D", 0.9, 0.02), 0.7: ("C", 0.5, 0.03), 0.9: ("D", 0.8, 0.04),
+    })
+    assert solved.final_answer == "D" and solved.confidence == 0.5
+    assert cancelled == []
+
+
+def test_failed_samples_do_not_vote(monkeypatch):
+    solved, _ = _ensemble(monkeypatch, {
+        0.2: (ValueError("contract"), None, 0.01), 0.5: ("A", 0.8, 0.02), 0.7: (ValueError("contract"), None, 0.03),
+    })
+    assert solved.final_answer == "A" and solved.confidence == 1.0
+
+
+def test_all_samples_failing_raises(monkeypatch):
+    with pytest.raises(ValueError, match="contract 3"):
+        _ensemble(monkeypatch, {
+            0.2: (ValueError("contract 1"), None, 0.01), 0.5: (ValueError("contract 2"), None, 0.02),
+            0.7: (ValueError("contract 3"), None, 0.03),
+        })
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from contract_guard import _load_contract
+from json_repair import has_misread_latex, repair_json
+from schemas_contracts.models import ChatV1, SolveV1
+
+VALID_TURKISH = [
+    '{"response": "x = 5\\neşit değil\\ntoplam"}',
+    '{"response": "1. adım\\nneden böyle?\\ttoplam 12\\r\\ntan değeri\\nnot: bar grafiği\\nbig data"}',
+    '{"response": "Şıklar:\\nA) 3\\nB) 4", "extra": ["\\tikinci", "\\rmetin"]}',
+]
+
+
+@pytest.mark.parametrize("text", VALID_TURKISH)
+def test_valid_json_with_escapes_round_trips(text):
+    assert _load_contract(text, ChatV1).response == json.loads(text)["response"]
+    repaired, fixes = repair_json(text)
+    assert json.loads(repaired) == json.loads(text)
+    assert "latex_escape" not in fixes
+
+
+def test_latex_read_as_form_feed_is_repaired():
+    text = r'{"steps": ["$\frac{3}{4}$ alınır", "$2 \times 3$"], "final_answer": "B"}'
+    assert has_misread_latex(json.loads(text))
+    solved = _load_contract(text, SolveV1)
+    assert solved.steps == [r"$\frac{3}{4}$ alınır", r"$2 \times 3$"]
+
+
+def test_latex_in_broken_json_is_repaired_but_turkish_line_breaks_are_kept():
+    text = '{"steps": ["$\\sqrt{x} \\neq 2$\\neşit değil", "son",], "final_answer": "A"}'
+    solved = _load_contract(text, SolveV1)
+    assert solved.steps == ["$\\sqrt{x} \\neq 2$\neşit değil", "son"]
+
+
+def test_truncated_and_python_style_output():
+    repaired, fixes = repair_json("{'steps': ['a', 'b'], 'final_answer': 'C', 'confidence': None, 'reasoning_checks': ['kontr")
+    assert json.loads(repaired) == {"steps": ["a", "b"], "final_answer": "C", "confidence": None, "reasoning_checks": ["kontr"]}
+    assert {"single_quotes", "python_literal", "truncated"} <= set(fixes)
@@ -0,0 +1,45 @@
+import asyncio
+import sqlite3
+
+from llm_cache import LLMCache
+from schemas_contracts.models import SolveV1
+
+
+def _rows(db_path) -> list:
+    conn = sqlite3.connect(db_path)
+    try:
+        return [key for (key,) in conn.execute("SELECT key FROM llm_cache ORDER BY created_at")]
+    finally:
+        conn.close()
+
+
+def _put_all(cache: LLMCache, keys) -> None:
+    async def run():
+        for key in keys:
+            await cache.put(key, SolveV1(steps=["a"], final_answer="A"), 100.0)
+    asyncio.run(run())
+    cache.close()
+
+
+def test_disk_tier_keeps_only_the_newest_max_rows(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    _put_all(LLMCache(db_path=db_path, max_rows=3, purge_interval=0), [f"k{i}" for i in range(6)])
+    assert _rows(db_path) == ["k3", "k4", "k5"]
+
+
+def test_disk_tier_purges_expired_rows(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    _put_all(LLMCache(db_path=db_path, ttl=3600), ["old1", "old2"])
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE llm_cache SET created_at = created_at - 7200")
+    conn.commit()
+    conn.close()
+
+    _put_all(LLMCache(db_path=db_path, ttl=3600), ["new"])
+    assert _rows(db_path) == ["new"]
+
+
+def test_purge_runs_at_most_once_per_interval(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    _put_all(LLMCache(db_path=db_path, max_rows=2, purge_interval=3600), [f"k{i}" for i in range(4)])
+    assert len(_rows(db_path)) == 4
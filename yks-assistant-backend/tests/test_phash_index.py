@@ -0,0 +1,63 @@
+import random
+
+from logic.phash_index import MultiIndexHashTable, PerceptualCache
+
+BASE = 0x0123_4567_89AB_CDEF
+
+
+def _flip(value: int, bits) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def test_lookup_within_the_radius_even_when_flips_are_spread_over_every_band():
+    table = MultiIndexHashTable(max_distance=8)
+    table.add(BASE, "q1")
+    # Two flips in each 16-bit band: no band matches exactly
+    near = _flip(BASE, [0, 1, 16, 17, 32, 33, 48, 49])
+    assert table.candidates(near) == [(8, BASE, "q1")]
+
+
+def test_miss_just_beyond_the_radius():
+    table = MultiIndexHashTable(max_distance=8)
+    table.add(BASE, "q1")
+    assert table.candidates(_flip(BASE, [0, 1, 2, 16, 17, 32, 33, 48, 49])) == []
+
+
+def test_finds_exactly_what_a_linear_scan_finds():
+    rng = random.Random(9)
+    table = MultiIndexHashTable(max_distance=6, max_items=10_000)
+    stored = [rng.getrandbits(64) for _ in range(300)]
+    for value in stored:
+        table.add(value, value)
+    for _ in range(200):
+        query = _flip(rng.choice(stored), rng.sample(range(64), rng.randint(0, 8)))
+        expected = sorted((value ^ query).bit_count() for value in stored if (value ^ query).bit_count() <= 6)
+        assert [distance for distance, _, _ in table.candidates(query)] == expected
+
+
+def test_least_recently_used_hash_is_evicted():
+    a, b, c = BASE, ~BASE & (2 ** 64 - 1), 0x5555_5555_5555_5555
+    table = MultiIndexHashTable(max_distance=4, max_items=2)
+    table.add(a, "a")
+    table.add(b, "b")
+    table.touch(a)
+    table.add(c, "c")
+    assert len(table) == 2
+    assert table.candidates(b) == []
+    assert table.candidates(a) == [(0, a, "a")]
+    assert table.candidates(c) == [(0, c, "c")]
+    # Evicted hashes leave no empty band buckets behind
+    assert sum(len(band) for band in table._bands) == 8
+
+
+def test_cache_verifies_the_fine_hash_and_keeps_namespaces_apart():
+    cache = PerceptualCache(max_distance=8, verify_max_distance=20)
+    fine = (1 << 255) | 12345
+    cache.add("extract", BASE, fine, "payload")
+
+    assert cache.lookup("extract", _flip(BASE, [3]), _flip(fine, range(10))) == "payload"
+    # Same coarse layout, different question: the fine hash disagrees
+    assert cache.lookup("extract", BASE, _flip(fine, range(0, 200, 5))) is None
+    assert cache.lookup("measure", BASE, fine) is None
@@ -0,0 +1,73 @@
+import asyncio
+
+from logic.anchor_selector import known_topics
+from question_pool import QuestionPool
+from schemas_contracts.models import GeneratedQuestion
+import question_pool as question_pool_module
+
+TOPIC = "oran - orantı"
+
+
+def _question(n: int) -> GeneratedQuestion:
+    return GeneratedQuestion(problem_text=f"Soru {n}", answer_choices={letter: f"{letter}{n}" for letter in "ABCDE"},
+                             correct_answer="C", solution="-")
+
+
+def test_bank_topics_are_known():
+    assert TOPIC in known_topics()
+
+
+def test_unknown_keys_are_never_pooled(tmp_path):
+    pool = QuestionPool(str(tmp_path / "pool.db"))
+
+    async def run():
+        await pool.add("yazım hatası", "medium", [_question(1)])
+        await pool.add(TOPIC, "çok zor", [_question(2)])
+        assert await pool.take("yazım hatası", "medium", 1) == []
+        assert not pool.refill_wanted.is_set()
+        return await pool.low_keys()
+
+    assert asyncio.run(run()) == []
+    assert pool.stats()["question_pool.depth"] == 0
+
+
+def test_worker_is_woken_only_below_the_low_watermark(tmp_path, monkeypatch):
+    monkeypatch.setattr(question_pool_module, "QUESTION_POOL_LOW_WATERMARK", 3)
+    pool = QuestionPool(str(tmp_path / "pool.db"))
+
+    async def run():
+        await pool.add(TOPIC, "medium", [_question(n) for n in range(5)])
+        assert len(await pool.take(TOPIC, "medium", 1, "u1")) == 1
+        assert not pool.refill_wanted.is_set()  # 5 servable questions left
+        # One serve each: the served question is retired, two more are taken
+        monkeypatch.setattr(question_pool_module, "QUESTION_POOL_MAX_SERVES", 1)
+        assert len(await pool.take(TOPIC, "medium", 2, "u2")) == 2
+        assert pool.refill_wanted.is_set()  # 2 left
+
+    asyncio.run(run())
+
+
+def test_failed_refills_back_off_and_evict(tmp_path, monkeypatch):
+    monkeypatch.setattr(question_pool_module, "QUESTION_POOL_MAX_FAILURES", 3)
+    pool = QuestionPool(str(tmp_path / "pool.db"))
+
+    async def run():
+        await pool.take(TOPIC, "hard", 1)
+        assert [key[:2] for key in await pool.low_keys()] == [(TOPIC, "hard")]
+
+        failures, backoff = await pool.record_refill(TOPIC, "hard", 0)
+        assert failures == 1 and backoff > 0
+        assert await pool.low_keys() == []  # backing off
+
+        await pool.record_refill(TOPIC, "hard", 0)
+        await pool.record_refill(TOPIC, "hard", 0)
+        pool._db().execute("UPDATE question_pool_keys SET retry_at = 0")
+        assert await pool.low_keys() == []  # evicted, not just backing off
+        assert pool._db().execute("SELECT COUNT(*) FROM question_pool_keys").fetchone() == (0,)
+
+        await pool.take(TOPIC, "hard", 1)
+        await pool.record_refill(TOPIC, "hard", 0)
+        await pool.record_refill(TOPIC, "hard", 2)  # a refill that adds questions resets the backoff
+        return pool._db().execute("SELECT failures, retry_at FROM question_pool_keys").fetchone()
+
+    assert asyncio.run(run()) == (0, 0)
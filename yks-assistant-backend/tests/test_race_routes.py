@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import pytest
+
+import contract_guard
+from contract_guard import _race_routes, run_with_contract_guard
+from schemas_contracts.models import SolveV1
+
+ROUTES = [{"provider": "primary", "api_key": "k"}, {"provider": "secondary", "api_key": "k"}]
+
+
+class ProviderDown(Exception):
+    pass
+
+
+def _race(behaviours, hedge_after_ms=None):
+    """Runs _race_routes over ROUTES; behaviours[provider](first_token) is that route's attempt."""
+    async def attempt(route, first_token):
+        return await behaviours[route["provider"]](first_token)
+
+    async def run():
+        t0 = time.perf_counter()
+        result, route = await _race_routes(ROUTES[:len(behaviours)], hedge_after_ms, attempt, "test")
+        return result, route["provider"], time.perf_counter() - t0
+
+    return asyncio.run(run())
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    cancelled = []
+
+    async def slow(first_token):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append("primary")
+            raise
+
+    async def fast(first_token):
+        first_token.set()
+        return "secondary answer"
+
+    result, provider, took = _race({"primary": slow, "secondary": fast}, hedge_after_ms=20)
+    assert (result, provider) == ("secondary answer", "secondary")
+    assert cancelled == ["primary"]
+    assert took < 1
+
+
+def test_primary_streaming_before_the_deadline_is_not_hedged():
+    launched = []
+
+    async def primary(first_token):
+        first_token.set()
+        await asyncio.sleep(0.1)
+        return "primary answer"
+
+    async def secondary(first_token):
+        launched.append("secondary")
+        return "secondary answer"
+
+    assert _race({"primary": primary, "secondary": secondary}, hedge_after_ms=20)[:2] == ("primary answer", "primary")
+    assert launched == []
+
+
+def test_failed_primary_fails_over_to_the_next_route():
+    async def down(first_token):
+        raise ProviderDown("primary 500")
+
+    async def secondary(first_token):
+        return "secondary answer"
+
+    assert _race({"primary": down, "secondary": secondary})[:2] == ("secondary answer", "secondary")
+
+
+def test_all_routes_failing_raises_the_last_error():
+    async def primary(first_token):
+        raise ProviderDown("primary 500")
+
+    async def secondary(first_token):
+        raise ProviderDown("secondary 503")
+
+    with pytest.raises(ProviderDown, match="secondary 503"):
+        _race({"primary": primary, "secondary": secondary})
+
+
+def test_partial_output_follows_the_winning_route(monkeypatch):
+    """The primary streams a step, then dies; the client is told to reset and sees only the secondary's output."""
+    async def fake_call_route(route, **kwargs):
+        if route["provider"] == "primary":
+            yield '{"steps": ["birinci yol", '
+            raise ProviderDown("connection reset")
+        for chunk in ('{"steps": ["ikinci yol", ', '"son adım"], "final_answer": "B"}'):
+            yield chunk
+
+    monkeypatch.setattr(contract_guard, "call_route", fake_call_route)
+    events = []
+    solved = asyncio.run(run_with_contract_guard(
+        prompt="prompt", output_model=SolveV1, routes=ROUTES, max_retries=0, cache=False,
+        on_partial=lambda event, data: events.append((event, data))
+    ))
+
+    assert solved.steps == ["ikinci yol", "son adım"]
+    reset = events.index(("reset", {}))
+    assert ("item", {"field": "steps", "index": 0, "value": "birinci yol"}) in events[:reset]
+    after = [data.get("value") for event, data in events[reset + 1:] if event == "item"]
+    assert after == ["ikinci yol", "son adım"]
@@ -0,0 +1,64 @@
+import asyncio
+import json
+from contextlib import aclosing
+
+import httpx
+
+import llm_client
+import rate_limiter
+from rate_limiter import ProviderLimiter
+
+
+def _sse(*contents: str) -> bytes:
+    chunks = [json.dumps({"choices": [{"delta": {"content": content}}]}) for content in contents]
+    return "".join(f"data: {chunk}\n\n" for chunk in chunks + ["[DONE]"]).encode("utf-8")
+
+
+def test_429_halves_rate_and_successes_recover_it():
+    limiter = ProviderLimiter("test", max_concurrency=8, rpm=600, tpm=100000)
+    limiter.on_rate_limited(0)
+    assert limiter.rate_scale == 0.5
+    assert limiter.concurrency_limit == 4
+
+    for _ in range(40):
+        limiter.on_success()
+    assert limiter.rate_scale == 1.0
+    assert limiter.concurrency_limit == 8
+
+
+def test_limiter_recovers_when_streams_are_closed_early():
+    """The contract guard stops reading once the JSON object closes; that still counts as a success."""
+    statuses = [429] + [200] * 40
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        status = statuses.pop(0)
+        if status == 429:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, headers={"Content-Type": "text/event-stream"},
+                              content=_sse('{"a": 1}', " trailing prose"))
+
+    async def run() -> ProviderLimiter:
+        api_key = "test-early-close"
+        llm_client.clients._http[("together", api_key)] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        limiter = rate_limiter.get_limiter("together", api_key)
+        try:
+            stream = llm_client._stream_chat_completion("together", "Test", "http://test/chat/completions", api_key, {}, 10)
+            async with aclosing(stream):
+                async for _ in stream:
+                    pass
+        except llm_client.RateLimitError:
+            pass
+        assert limiter.rate_scale == 0.5
+
+        for _ in range(40):
+            stream = llm_client._stream_chat_completion("together", "Test", "http://test/chat/completions", api_key, {}, 10)
+            async with aclosing(stream):
+                async for _ in stream:
+                    break  # contract complete, stop reading
+        await llm_client.clients.aclose()
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert limiter.rate_scale == 1.0
+    assert limiter.concurrency_limit == limiter.max_concurrency
+    assert limiter.in_flight == 0
@@ -0,0 +1,47 @@
+import asyncio
+
+import pipelines.generate as generate_module
+import pipelines.solve as solve_module
+from schemas_contracts.models import ExtractV1, GeneratedQuestion, SolveV1
+
+SHORT = ExtractV1(question_text="2x = 6 ise x kaçtır?", choices={"A": "1", "B": "2", "C": "3", "D": "4", "E": "5"})
+
+
+def _record_tiers(monkeypatch):
+    tiers = []
+
+    async def fake_solve_on(tier, prompt, request_id, on_partial):
+        tiers.append(tier)
+        return SolveV1(steps=["x = 3"], final_answer="C", confidence=0.95)
+
+    monkeypatch.setattr(solve_module, "SOLVE_ROUTING", True)
+    monkeypatch.setattr(solve_module, "_solve_on", fake_solve_on)
+    return tiers
+
+
+def test_routing_sends_easy_questions_to_the_fast_tier(monkeypatch):
+    tiers = _record_tiers(monkeypatch)
+    assert solve_module.solver_tier(SHORT)[0] == "fast"
+    asyncio.run(solve_module.solve_step(SHORT, "test"))
+    assert tiers == ["fast"]
+
+
+def test_generated_questions_are_validated_on_the_full_tier(monkeypatch):
+    tiers = _record_tiers(monkeypatch)
+    question = GeneratedQuestion(problem_text=SHORT.question_text, answer_choices=SHORT.choices,
+                                 correct_answer="C", solution="x = 3")
+    assert asyncio.run(generate_module.validate_with_solver(question, "test"))
+    assert tiers == ["full"]
+
+
+def test_no_difficulty_estimate_without_routing(monkeypatch):
+    tiers = _record_tiers(monkeypatch)
+    monkeypatch.setattr(solve_module, "SOLVE_ROUTING", False)
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError("difficulty estimated with routing off")
+
+    monkeypatch.setattr(solve_module, "estimate_difficulty", unexpected)
+    assert solve_module.solver_tier(SHORT) == ("full", None)
+    asyncio.run(solve_module.solve_step(SHORT, "test"))
+    assert tiers == ["full"]
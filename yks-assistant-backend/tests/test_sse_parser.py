@@ -0,0 +1,65 @@
+import asyncio
+from typing import List
+
+import httpx
+
+from llm_client import iter_sse_data
+
+
+def _parse_bytes(chunks: List[bytes]) -> List[str]:
+    """Runs the parser on an HTTP body delivered in exactly these chunks, as the provider stream is read."""
+    async def body():
+        for chunk in chunks:
+            yield chunk
+
+    async def run():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("POST", "http://test/chat/completions") as response:
+                return [data async for data in iter_sse_data(response.aiter_lines())]
+
+    return asyncio.run(run())
+
+
+def _parse_lines(lines: List[str]) -> List[str]:
+    consumed = []
+
+    async def source():
+        for line in lines:
+            consumed.append(line)
+            yield line
+
+    async def run():
+        return [data async for data in iter_sse_data(source())]
+
+    events = asyncio.run(run())
+    assert consumed == lines  # always drained, so the connection can be reused
+    return events
+
+
+def test_event_split_across_chunk_boundaries():
+    body = 'data: {"content": "çözüm"}\r\n\r\ndata: {"content": "adım"}\n\n'.encode("utf-8")
+    # Cut inside "data:", inside the multi-byte "ö" and between \r and \n
+    cuts = [3, body.index("ö".encode()) + 1, body.index(b"\r") + 1, len(body) - 1]
+    chunks = [body[a:b] for a, b in zip([0] + cuts, cuts + [len(body)])]
+    assert _parse_bytes(chunks) == ['{"content": "çözüm"}', '{"content": "adım"}']
+
+
+def test_multi_line_data_fields_are_joined_and_other_fields_ignored():
+    lines = ["event: message", "id: 7", "data: birinci", "data:ikinci", "data:  boşluklu", "retry: 100", ""]
+    assert _parse_lines(lines) == ["birinci\nikinci\n boşluklu"]
+
+
+def test_comments_keep_alives_and_empty_events_are_skipped():
+    lines = [": ping", "", "", ":keep-alive", "data: x", "", ": ping", ""]
+    assert _parse_lines(lines) == ["x"]
+
+
+def test_done_stops_the_stream():
+    lines = ["data: a", "", "data: [DONE]", "", "data: sonrası", ""]
+    assert _parse_lines(lines) == ["a"]
+
+
+def test_stream_closed_without_a_trailing_blank_line():
+    assert _parse_lines(["data: a", "", "data: son"]) == ["a", "son"]
+    assert _parse_lines(["data: a", "", "data: [DONE]"]) == ["a"]
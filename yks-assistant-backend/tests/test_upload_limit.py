@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, File, UploadFile
+
+from ingest import UploadSizeLimit
+
+LIMIT = 1000
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimit, max_bytes=LIMIT)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return app
+
+
+def _multipart(payload: bytes) -> bytes:
+    return (b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.png\"\r\n"
+            b"Content-Type: image/png\r\n\r\n" + payload + b"\r\n--b--\r\n")
+
+
+def _post(body: bytes, chunked: bool) -> httpx.Response:
+    async def chunks():
+        for i in range(0, len(body), 100):
+            yield body[i:i + 100]
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app()), base_url="http://test") as client:
+            return await client.post("/upload", content=chunks() if chunked else body,
+                                     headers={"Content-Type": "multipart/form-data; boundary=b"})
+
+    return asyncio.run(run())
+
+
+def test_declared_oversized_body_is_rejected():
+    assert _post(_multipart(b"x" * 2000), chunked=False).status_code == 413
+
+
+def test_chunked_oversized_body_is_rejected_while_streaming():
+    response = _post(_multipart(b"x" * 2000), chunked=True)
+    assert response.status_code == 413
+    assert "Upload exceeds" in response.json()["detail"]
+
+
+def test_chunked_body_under_the_limit_passes():
+    response = _post(_multipart(b"x" * 500), chunked=True)
+    assert response.status_code == 200
+    assert response.json() == {"size": 500}